@@ -0,0 +1,237 @@
+"""Running the control loop, as an asyncio task or on a thread of its own
+
+By default firmware.py runs a ControlLoop as a task on the web server's
+asyncio loop. With "control_thread" set in config.json it starts a
+ControlThread instead. The web server keeps the asyncio loop, and the two
+threads only meet in three places:
+
+- `snapshots`: each controller's StatusSnapshot, replaced after every pass
+  that changed it. Routes read these instead of the controllers.
+- `commands`: anything that changes a controller from outside (config,
+  test overrides, a trace snapshot) is queued by call() and runs on the
+  control thread between two passes.
+- `outbox`: log entries, runs and failed starts the controllers report,
+  for the web side to store and stream.
+
+Both queues are SpscQueues, so neither thread ever waits on a lock held by
+the other.
+"""
+import asyncio
+import time
+import _thread
+from generator import TICK_MS, MS_PER_DAY
+
+THREAD_POLL_MS = 20      # Longest sleep between checks for commands and IRQ wakeups
+CALL_POLL_MS = 10        # How often call() looks for a free slot and for its reply
+COMMAND_SLOTS = 8
+EVENT_SLOTS = 32
+
+class SpscQueue:
+    """Fixed-size FIFO between one producer thread and one consumer thread, without locks
+
+    Only put() moves `tail` and only get() moves `head`. An item is stored
+    before `tail` passes its slot and taken before `head` does, so each side
+    only ever sees slots the other has finished with.
+    """
+    def __init__(self, slots):
+        self.items = [None] * slots
+        self.head = 0
+        self.tail = 0
+
+    def put(self, item):
+        """Append item; False (and nothing queued) if the queue is full"""
+        tail = self.tail
+        nxt = (tail + 1) % len(self.items)
+        if nxt == self.head:
+            return False
+        self.items[tail] = item
+        self.tail = nxt
+        return True
+
+    def get(self):
+        """Remove and return the oldest item, or None if there is none"""
+        head = self.head
+        if head == self.tail:
+            return None
+        item = self.items[head]
+        self.items[head] = None
+        self.head = (head + 1) % len(self.items)
+        return item
+
+    def __len__(self):
+        return (self.tail - self.head) % len(self.items)
+
+class ControlLoop:
+    """Steps a ChannelScheduler as an asyncio task
+
+    Takes the same hooks as ControlThread. Between passes the task sleeps
+    with asyncio.sleep_ms(), which reuses one generator and so allocates
+    nothing, in slices of TICK_MS (polled pins are sampled after each) or
+    THREAD_POLL_MS (IRQ inputs). An IRQ edge or a set() from a web route is
+    seen at the end of the slice. Waiting on a ThreadSafeFlag would wake at
+    once, but every wait allocates a coroutine, and a timeout a task and an
+    exception.
+    """
+    def __init__(self, scheduler, polled=True):
+        self.scheduler = scheduler
+        self.polled = polled
+        self.poll_ms = TICK_MS if polled else THREAD_POLL_MS
+        self.wake_pending = False
+        self.passes = 0
+        self.max_wait_ms = MS_PER_DAY
+        self.after_pass = None
+        self.before_sleep = None
+        self.after_wakeup = None
+
+    def set(self):
+        """Wake the loop before its next deadline; stands in for the sensors' wake flag"""
+        self.wake_pending = True
+
+    async def run(self):
+        scheduler = self.scheduler
+        while True:
+            self.wake_pending = False
+            start = time.ticks_us()
+            scheduler.tick()
+            pass_us = time.ticks_diff(time.ticks_us(), start)
+            self.passes += 1
+            if self.after_pass:
+                self.after_pass(pass_us)
+            wait_ms = min(scheduler.next_wakeup_ms(), self.max_wait_ms)
+            if self.before_sleep:
+                self.before_sleep(wait_ms)
+            deadline = time.ticks_add(time.ticks_ms(), wait_ms)
+            # Sleep until the deadline, an input change or a set(). This stays
+            # inline: a coroutine per pass would be an allocation per pass.
+            while True:
+                wait = time.ticks_diff(deadline, time.ticks_ms())
+                settle = scheduler.next_settle_ms()
+                if settle is not None and settle < wait:
+                    wait = settle
+                if wait <= 0:
+                    break
+                await asyncio.sleep_ms(min(wait, self.poll_ms))
+                if self.wake_pending or (self.polled and scheduler.input_changed()):
+                    break
+            if self.after_wakeup:
+                self.after_wakeup(time.ticks_diff(time.ticks_ms(), deadline))
+
+class ControlThread:
+    """Steps a ChannelScheduler on its own thread
+
+    after_pass(pass_us), before_sleep(wait_ms) and after_wakeup(late_ms) are
+    optional hooks run on the control thread, for the firmware's metrics and
+    GC policy; late_ms is negative for an early wakeup. events_ready, if set,
+    is an object whose set() is called whenever the outbox gains an event
+    (an asyncio.ThreadSafeFlag in the firmware). max_wait_ms caps every
+    sleep, e.g. to keep a watchdog fed.
+    """
+    def __init__(self, scheduler, polled=True, events_ready=None):
+        self.scheduler = scheduler
+        # Polled pins are sampled every TICK_MS; IRQ edges call set()
+        self.polled = polled
+        self.poll_ms = TICK_MS if polled else THREAD_POLL_MS
+        self.events_ready = events_ready
+        self.commands = SpscQueue(COMMAND_SLOTS)
+        self.outbox = SpscQueue(EVENT_SLOTS)
+        self.snapshots = [c.status_snapshot() for c in scheduler.controllers]
+        self.wake_pending = False
+        self.events_dropped = 0
+        self.passes = 0
+        self.error = None        # What stopped the thread, if anything did
+        self.max_wait_ms = MS_PER_DAY
+        self.after_pass = None
+        self.before_sleep = None
+        self.after_wakeup = None
+
+    def set(self):
+        """Wake the loop before its next deadline; stands in for the sensors' wake flag"""
+        self.wake_pending = True
+
+    def start(self, stack_bytes=None):
+        if stack_bytes:
+            _thread.stack_size(stack_bytes)
+        _thread.start_new_thread(self.run, ())
+
+    def run(self):
+        try:
+            self.loop()
+        except Exception as e:
+            self.error = e
+            raise
+
+    def loop(self):
+        scheduler = self.scheduler
+        while True:
+            self.wake_pending = False
+            self.run_commands()
+            start = time.ticks_us()
+            scheduler.tick()
+            pass_us = time.ticks_diff(time.ticks_us(), start)
+            self.publish()
+            self.passes += 1
+            if self.after_pass:
+                self.after_pass(pass_us)
+            wait_ms = min(scheduler.next_wakeup_ms(), self.max_wait_ms)
+            if self.before_sleep:
+                self.before_sleep(wait_ms)
+            deadline = time.ticks_add(time.ticks_ms(), wait_ms)
+            self.sleep_until(deadline)
+            if self.after_wakeup:
+                self.after_wakeup(time.ticks_diff(time.ticks_ms(), deadline))
+
+    def sleep_until(self, deadline):
+        """Sleep until deadline, an input change, a command or a set()"""
+        scheduler = self.scheduler
+        while True:
+            wait = time.ticks_diff(deadline, time.ticks_ms())
+            settle = scheduler.next_settle_ms()
+            if settle is not None and settle < wait:
+                wait = settle
+            if wait <= 0:
+                return
+            time.sleep_ms(min(wait, self.poll_ms))
+            if self.wake_pending or len(self.commands) or (self.polled and scheduler.input_changed()):
+                return
+
+    def run_commands(self):
+        commands = self.commands
+        while True:
+            command = commands.get()
+            if command is None:
+                return
+            fn, reply = command
+            try:
+                reply[1] = fn()
+            except Exception as e:
+                reply[2] = e
+            reply[0] = True
+
+    def publish(self):
+        """Replace the snapshot of every controller whose status has moved"""
+        snapshots = self.snapshots
+        i = 0
+        for controller in self.scheduler.controllers:
+            if snapshots[i].version != controller.status_version:
+                snapshots[i] = controller.status_snapshot()
+            i += 1
+
+    def post(self, event):
+        """Queue an event for the web side (on the control thread)"""
+        if not self.outbox.put(event):
+            self.events_dropped += 1
+            return
+        if self.events_ready:
+            self.events_ready.set()
+
+    async def call(self, fn):
+        """Run fn() on the control thread before its next pass and return its result (on the web side)"""
+        reply = [False, None, None]
+        # A full queue drains within a pass; only this thread puts, so waiting is enough
+        while not self.commands.put((fn, reply)):
+            await asyncio.sleep(CALL_POLL_MS / 1000)
+        while not reply[0]:
+            await asyncio.sleep(CALL_POLL_MS / 1000)
+        if reply[2] is not None:
+            raise reply[2]
+        return reply[1]
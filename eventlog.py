@@ -0,0 +1,218 @@
+import io
+import os
+import struct
+
+from storage import atomic_write
+
+LOG_DIR = 'log'
+SEGMENT_COUNT = 4
+SEGMENT_BYTES = 8192
+
+# Record: seq, timestamp (ticks_ms), boot number, event code, details length, then the details
+HEADER = '<IIHBB'
+HEADER_SIZE = struct.calcsize(HEADER)
+
+# Event names are stored as a one-byte code. Only ever append to this tuple;
+# names not listed here are stored as code 0 with the name folded into the details.
+EVENT_NAMES = (
+    '',
+    'System Start',
+    'Generator Running',
+    'Run Request',
+    'Cool Down',
+    'Maintenance',
+    'Maintenance Countdown',
+    'Maintenance Reset',
+    'Start Relay',
+    'Kill Relay',
+    'TEST',
+    'Deadline Missed',
+)
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_NAMES)}
+
+# Per-segment index entry fields
+FIRST_SEQ = 0
+LAST_SEQ = 1
+EVENT_MASK = 2
+SIZE = 3
+
+def _read_records(f, want_details=True):
+    """Yield (offset, seq, timestamp, boot, code, details) for each record in a log file"""
+    while True:
+        offset = f.tell()
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return
+        seq, timestamp, boot, code, length = struct.unpack(HEADER, header)
+        if want_details:
+            details = f.read(length)
+            if len(details) < length:
+                return  # Torn write at the end of a segment
+        else:
+            f.seek(length, 1)
+            details = None
+        yield offset, seq, timestamp, boot, code, details
+
+class EventLog:
+    """Append-only event log in a rotating set of flash segments
+
+    record() only appends to a RAM buffer; flush() writes the buffer out in
+    one append per segment. A small index of (first seq, last seq, event
+    mask, size) per segment lets query() skip segments without reading them.
+    """
+    def __init__(self, directory=LOG_DIR, segment_count=SEGMENT_COUNT, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_count = segment_count
+        self.segment_bytes = segment_bytes
+        self.pending = bytearray()
+        self.pending_first_seq = 0
+        self.current = 0
+        self.next_seq = 1
+        self.boot = 1
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+        self.index = [self._scan(i) for i in range(segment_count)]
+        newest = 0
+        for i, entry in enumerate(self.index):
+            if entry[LAST_SEQ] > newest:
+                newest = entry[LAST_SEQ]
+                self.current = i
+        self.next_seq = newest + 1
+
+    def _path(self, segment):
+        return self.directory + '/seg' + str(segment) + '.bin'
+
+    def _scan(self, segment):
+        entry = [0, 0, 0, 0]
+        path = self._path(segment)
+        try:
+            size = os.stat(path)[6]
+            with open(path, 'rb') as f:
+                for offset, seq, timestamp, boot, code, details in _read_records(f, False):
+                    # A record cut short by a reset claims bytes past the end of the file
+                    if f.tell() > size:
+                        break
+                    if not entry[FIRST_SEQ]:
+                        entry[FIRST_SEQ] = seq
+                    entry[LAST_SEQ] = seq
+                    entry[EVENT_MASK] |= 1 << code
+                    entry[SIZE] = f.tell()
+                    if boot >= self.boot:
+                        self.boot = boot + 1
+                torn = entry[SIZE] < size
+                if torn:
+                    f.seek(0)
+                    data = f.read(entry[SIZE])
+            if torn:
+                # Drop the partial record so the next flush() appends right after the last whole one
+                atomic_write(path, data)
+        except OSError:
+            pass
+        return entry
+
+    def record(self, timestamp, event, details=''):
+        """Queue one entry for the next flush and return its sequence number"""
+        code = EVENT_CODES.get(event, 0)
+        if not code:
+            details = event + ': ' + details
+        data = details.encode()
+        if len(data) > 255:
+            # Cut on a character boundary: back off over the continuation bytes (0b10xxxxxx)
+            # of a character that would be split, or query() can't decode the record
+            end = 255
+            while end and data[end] & 0xC0 == 0x80:
+                end -= 1
+            data = data[:end]
+        seq = self.next_seq
+        self.next_seq += 1
+        if not self.pending:
+            self.pending_first_seq = seq
+        self.pending += struct.pack(HEADER, seq, timestamp & 0xFFFFFFFF, self.boot & 0xFFFF, code, len(data))
+        self.pending += data
+        return seq
+
+    def flush(self):
+        """Write queued records to flash"""
+        if not self.pending:
+            return
+        buf = self.pending
+        self.pending = bytearray()
+        view = memoryview(buf)
+        pos = 0
+        while pos < len(buf):
+            entry = self.index[self.current]
+            end = pos
+            while end < len(buf):
+                seq, timestamp, boot, code, length = struct.unpack_from(HEADER, buf, end)
+                size = HEADER_SIZE + length
+                if entry[SIZE] and entry[SIZE] + end - pos + size > self.segment_bytes:
+                    break
+                if not entry[FIRST_SEQ]:
+                    entry[FIRST_SEQ] = seq
+                entry[LAST_SEQ] = seq
+                entry[EVENT_MASK] |= 1 << code
+                end += size
+            if end > pos:
+                with open(self._path(self.current), 'ab') as f:
+                    f.write(view[pos:end])
+                entry[SIZE] += end - pos
+                pos = end
+            if pos < len(buf):
+                # Current segment is full: reuse the oldest one
+                self.current = (self.current + 1) % self.segment_count
+                with open(self._path(self.current), 'wb'):
+                    pass
+                self.index[self.current] = [0, 0, 0, 0]
+
+    def _sources(self):
+        """(first seq, event mask, opener) for the RAM buffer and each segment, newest first"""
+        if self.pending:
+            mask = 0
+            for record in _read_records(io.BytesIO(self.pending), False):
+                mask |= 1 << record[4]
+            yield self.pending_first_seq, mask, lambda: io.BytesIO(bytes(self.pending))
+        for n in range(self.segment_count):
+            segment = (self.current - n) % self.segment_count
+            entry = self.index[segment]
+            if entry[FIRST_SEQ]:
+                yield entry[FIRST_SEQ], entry[EVENT_MASK], lambda path=self._path(segment): open(path, 'rb')
+
+    def query(self, before=None, limit=20, event=None):
+        """Newest-first entries with seq < before, optionally only one event type
+
+        Returns a list of (seq, timestamp, boot, event, details). Only one
+        segment is streamed at a time and at most `limit` records are kept.
+        """
+        code = None
+        if event:
+            code = EVENT_CODES.get(event)
+            if code is None:
+                return []
+        results = []
+        for first_seq, mask, opener in self._sources():
+            if before is not None and first_seq >= before:
+                continue
+            if code is not None and not mask & (1 << code):
+                continue
+            need = limit - len(results)
+            matches = []
+            with opener() as f:
+                for offset, seq, timestamp, boot, record_code, details in _read_records(f, False):
+                    if (before is not None and seq >= before) or (code is not None and record_code != code):
+                        continue
+                    matches.append(offset)
+                    if len(matches) > need:
+                        matches.pop(0)
+                # Go back for the details of the kept records only
+                for offset in reversed(matches):
+                    f.seek(offset)
+                    for record in _read_records(f):
+                        seq, timestamp, boot, record_code, details = record[1:]
+                        name = EVENT_NAMES[record_code] if record_code < len(EVENT_NAMES) else ''
+                        results.append((seq, timestamp, boot, name, details.decode()))
+                        break
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,1184 @@
+import machine
+import time
+
+# Boot phase timing, served at /boot. ticks_ms() counts from when MicroPython started.
+boot_phases = [('firmware_import', time.ticks_ms())]
+
+def boot_mark(phase):
+    boot_phases.append((phase, time.ticks_ms()))
+
+# Relays go to their safe state (off) before anything else runs. Relays of any
+# further channels follow as soon as config.json has been read.
+relay_start_gen = machine.Pin(32, machine.Pin.OUT)
+relay_kill_gen = machine.Pin(33, machine.Pin.OUT)
+relay_start_gen.value(0)
+relay_kill_gen.value(0)
+boot_mark('relays_safe')
+
+import asyncio
+import network
+import os
+import ujson
+import gc
+import random
+from eventlog import EventLog
+from history import RunHistory, HISTORY_DIR
+from iotrace import Trace, TRACE_BYTES
+from storage import Persistence, atomic_write, load_state
+from streaming import BufferedBody
+from control import ControlLoop, ControlThread
+from respcache import ResponseCache, CachedBody, CACHE_BYTES, MIN_FREE_BYTES
+from metrics import Histogram, Watermark, RouteStats, header, LATENESS_BUCKETS_MS, UPDATE_BUCKETS_US, RELAY_LATENCY_BUCKETS_MS
+import generator
+from generator import GeneratorController, SensorManager, IrqSensorManager, ChannelScheduler, stagger_maintenance, get_current_minutes, set_current_minutes, status_json, status_dict, TICK_MS, MS_PER_DAY, LATENCY_PATHS
+
+CONFIG_FILE = 'config.json'
+
+# Settings used when config.json can't be read. These are also the only
+# top-level settings /config/update will change; "channels" and "telemetry"
+# are edited in config.json itself.
+DEFAULT_CONFIG = {
+    "maintenance_interval_days": 7,
+    "maintenance_duration_minutes": 10,
+    "cool_down_duration_minutes": 15,
+    "maintenance_start_hour": 12,
+    "maintenance_start_minute": 0,
+    "maintenance_stagger_minutes": 15,
+    "input_irq": 0,
+    "control_thread": 0,
+    "debounce_ms": 2000,
+    "request_debounce_ms": 50,
+    "log_echo": 0,
+    "max_connections": 6,
+    "accept_queue": 2,
+    "lateness_budget_ms": 50,
+    "watchdog_ms": 0,
+    "deadline_guard_ms": 500,
+    "trace_bytes": TRACE_BYTES,
+    "response_cache_bytes": 8192,
+    "response_cache_min_free_bytes": 16384
+}
+
+def load_config():
+    """Return (config, saved runtime state or None)"""
+    saved_state = load_state()
+    try:
+        with open(CONFIG_FILE) as f:
+            config = ujson.load(f)
+        # Ensure values are ints (the channel list and telemetry settings are kept as they are)
+        config = {k: v if k in ('channels', 'telemetry') else int(v) for k, v in config.items()}
+        return config, saved_state
+    except:
+        return dict(DEFAULT_CONFIG), saved_state
+
+def save_config(config):
+    atomic_write(CONFIG_FILE, ujson.dumps(config).encode())
+
+config, saved_state = load_config()
+boot_mark('config_loaded')
+
+# Generator channels: each has its own inputs, relays and controller. Without a
+# "channels" list in config.json there is one channel on the board's default pins.
+DEFAULT_CHANNEL = {"name": "gen1", "run_sense": 27, "run_request": 13, "start": 32, "kill": 33}
+channel_configs = config.get("channels") or [DEFAULT_CHANNEL]
+for channel in channel_configs:
+    machine.Pin(channel["start"], machine.Pin.OUT).value(0)
+    machine.Pin(channel["kill"], machine.Pin.OUT).value(0)
+
+# Status LEDs show whether any channel is running, requested, cooling down or in maintenance
+led_run_request = machine.Pin(16, machine.Pin.OUT)
+led_running = machine.Pin(17, machine.Pin.OUT)
+led_cool_down = machine.Pin(18, machine.Pin.OUT)
+led_maintenance = machine.Pin(19, machine.Pin.OUT)
+
+def channel_settings(i):
+    """Global config with channel i's own entries (name, pins, overrides) on top"""
+    settings = {k: v for k, v in config.items() if k != 'channels'}
+    settings.update(channel_configs[i])
+    settings.setdefault("name", "gen" + str(i + 1))
+    return settings
+
+input_irq = config.get("input_irq", 0)
+
+def make_sensor_manager(settings):
+    in_run_sense = machine.Pin(settings["run_sense"], machine.Pin.IN, machine.Pin.PULL_UP)
+    in_run_request = machine.Pin(settings["run_request"], machine.Pin.IN, machine.Pin.PULL_UP)
+    if input_irq:
+        # Pin IRQs stamp each edge and wake the control loop once the input settles
+        sensors = IrqSensorManager(in_run_sense, in_run_request,
+                                   settings.get("debounce_ms", 2000), settings.get("request_debounce_ms", 50))
+    else:
+        sensors = SensorManager(in_run_sense, in_run_request, settings.get("debounce_ms", 2000))
+    return sensors
+
+# Echo log entries to the console
+generator.log_echo = config.get("log_echo", 0)
+
+# Persistent event log (shared) and run history (one per channel). Both scan
+# flash when opened, so open_storage() creates them once the control loop is running.
+EVENT_LOG_FLUSH_MS = 30000
+EVENT_LOG_FLUSH_BYTES = 1024
+event_log = None
+run_histories = [None] * len(channel_configs)
+
+# One controller per channel, all stepped by one scheduler. Channel 0 keeps the
+# unqualified URLs and file names.
+controllers = []
+for i in range(len(channel_configs)):
+    settings = channel_settings(i)
+    controllers.append(GeneratorController(make_sensor_manager(settings), settings,
+                                           machine.Pin(settings["start"], machine.Pin.OUT),
+                                           machine.Pin(settings["kill"], machine.Pin.OUT)))
+# Channels take turns for maintenance instead of all starting at the same minute
+stagger_maintenance(controllers, config.get("maintenance_stagger_minutes", 15))
+scheduler = ChannelScheduler(controllers)
+
+# Input edges and relay actions of every channel, served at /trace for host/replay_trace.py
+trace = Trace(config.get("trace_bytes", TRACE_BYTES))
+for i, c in enumerate(controllers):
+    c.attach_trace(trace, i)
+
+# Config and runtime state are written together, at most once per PERSIST_INTERVAL_MS
+persistence = Persistence(save_config)
+if saved_state:
+    saved_minutes, saved_channels = saved_state
+    # Time spent powered off is unknown: carry on from the saved time until a browser syncs the clock
+    set_current_minutes(saved_minutes)
+    for c, (days_until_maintenance, day_ms, start_attempts, detected_runs, failed_starts) in zip(controllers, saved_channels):
+        c.days_until_maintenance = min(days_until_maintenance, c.maintenance_interval_days)
+        c.maintenance_check_time = time.ticks_add(time.ticks_ms(), -min(day_ms, MS_PER_DAY - 1))
+        c.start_attempts = start_attempts
+        c.detected_runs = detected_runs
+        c.failed_starts = failed_starts
+# Replays start from a keyframe: one now that the state is restored, then one each time a channel goes idle
+for c in controllers:
+    c.trace_keyframe()
+
+# Log startup and sample the inputs once before the rest of the firmware loads
+for c in controllers:
+    if saved_state:
+        c.log_state_change('System Start', f'Restored state, {c.days_until_maintenance} days until maintenance')
+    else:
+        c.log_state_change('System Start', 'Generator controller initialized')
+scheduler.tick()
+boot_mark('inputs_sampled')
+
+# Runtime metrics, served at /metrics
+loop_lateness = Histogram(LATENESS_BUCKETS_MS)   # ms past its deadline each timed wakeup ran
+LATENESS_BUDGET_MS = config.get("lateness_budget_ms", 50)
+loop_lateness_max = 0
+loop_over_budget = 0
+update_time = Histogram(UPDATE_BUCKETS_US)       # us per control pass over all channels (debounce + state update)
+channel_update_time = [Histogram(UPDATE_BUCKETS_US) for c in controllers]
+heap_free = Watermark()
+heap_alloc = Watermark()
+route_stats = {}
+# ms from each cause (input edge or deadline) to the relay write it led to, per LATENCY_PATHS entry
+relay_latency = [Histogram(RELAY_LATENCY_BUCKETS_MS) for path in LATENCY_PATHS]
+LATENCY_QUANTILES = ('0.5', '0.9', '0.99')
+
+def observe_relay_latency(path, ms):
+    relay_latency[path].observe(ms)
+
+for c in controllers:
+    c.on_latency = observe_relay_latency
+
+# Watchdog and deadline guard, off unless "watchdog_ms" is set. The loop then
+# sleeps for at most a quarter of the timeout and feeds the WDT after every
+# wakeup that came within DEADLINE_GUARD_MS of its deadline. A later wakeup
+# releases whatever relays are held and is logged; a loop that stops waking
+# altogether gets the board reset, and boot switches the relays off first.
+WATCHDOG_MS = config.get("watchdog_ms", 0)
+DEADLINE_GUARD_MS = config.get("deadline_guard_ms", 500)
+MAX_WAIT_MS = WATCHDOG_MS // 4 if WATCHDOG_MS else MS_PER_DAY
+watchdog = None
+watchdog_armed = False      # Set once booting is done; the loop then starts the WDT itself
+deadline_misses = 0
+
+def sample_heap():
+    heap_free.update(gc.mem_free())
+    heap_alloc.update(gc.mem_alloc())
+
+# Garbage collection: MicroPython collects automatically once GC_THRESHOLD of the
+# free heap has been allocated, plus opportunistic collections while the controller
+# is idle. The opportunistic ones are skipped while a relay is being held; automatic
+# collection stays on, since StoppingState holds the kill relay for as long as the
+# engine takes to stop and a heap that can't be collected would raise MemoryError.
+GC_THRESHOLD = 4                # Collect after 1/GC_THRESHOLD of the free heap is allocated
+GC_IDLE_BYTES = 8192            # Collect while idle once this much has been allocated
+GC_IDLE_MIN_MS = 100            # Only if the controller has nothing to do for at least this long
+gc_alloc_after_collect = 0
+
+def collect_garbage():
+    global gc_alloc_after_collect
+    gc.collect()
+    gc_alloc_after_collect = gc.mem_alloc()
+
+def update_gc(wait_ms):
+    """Apply the GC policy after a control pass that will sleep for wait_ms"""
+    if scheduler.relay_held():
+        return
+    if wait_ms >= GC_IDLE_MIN_MS and gc.mem_alloc() - gc_alloc_after_collect >= GC_IDLE_BYTES:
+        collect_garbage()
+
+def observe_pass(pass_us):
+    """Record one control pass over all channels that took pass_us"""
+    update_time.observe(pass_us)
+    i = 0
+    for histogram in channel_update_time:
+        histogram.observe(scheduler.pass_us[i])
+        i += 1
+    sample_heap()
+
+def observe_wakeup(late):
+    """Record a wakeup `late` ms after the deadline it slept for, and guard the deadline"""
+    global loop_lateness_max, loop_over_budget
+    # Early wakeups (inputs, web actions) aren't late for anything
+    if late >= 0:
+        loop_lateness.observe(late)
+        if late > loop_lateness_max:
+            loop_lateness_max = late
+        if late > LATENESS_BUDGET_MS:
+            loop_over_budget += 1
+    if WATCHDOG_MS:
+        guard_deadline(late)
+
+def guard_deadline(late):
+    """Feed the watchdog for a deadline met; make the relays safe for one missed"""
+    global watchdog, deadline_misses
+    if late > DEADLINE_GUARD_MS:
+        deadline_misses += 1
+        for c in controllers:
+            c.fail_safe(f'Control loop woke {late} ms late')
+    elif watchdog:
+        watchdog.feed()
+    elif watchdog_armed:
+        # The ESP32's WDT watches the task that created it, so this has to
+        # happen on the loop's own thread
+        watchdog = machine.WDT(timeout=WATCHDOG_MS)
+
+# The control loop runs as a ControlLoop task on the web server's asyncio loop,
+# or with "control_thread" set, as a ControlThread of its own: a slow route
+# then holds up the relays only until the VM hands the thread over, not until
+# the route next awaits. Routes then read the published status snapshots and
+# change controllers through in_control_loop(); see control.py. Either one is the
+# sensors' wake flag, set by input IRQs and, via wake_control(), by web routes
+# that change what the controller sees.
+CONTROL_STACK_BYTES = 8192
+control = None
+if config.get("control_thread", 0):
+    control = ControlThread(scheduler, polled=not input_irq, events_ready=asyncio.ThreadSafeFlag())
+    control_loop = control
+else:
+    control_loop = ControlLoop(scheduler, polled=not input_irq)
+control_loop.after_pass = observe_pass
+control_loop.before_sleep = update_gc
+control_loop.after_wakeup = observe_wakeup
+control_loop.max_wait_ms = MAX_WAIT_MS
+for c in controllers:
+    c.sensor_manager.wake = control_loop
+
+def wake_control():
+    control_loop.set()
+
+from microdot import Response, send_file
+from server import BoundedMicrodot
+
+# Set up Microdot, with a cap on concurrent connections
+app = BoundedMicrodot(config.get("max_connections", 6), config.get("accept_queue", 2))
+Response.default_content_type = 'application/json'
+# Files are read from flash in chunks of this size, with a socket write (and a yield) after each
+Response.send_file_buffer_size = 512
+
+class StatusCache:
+    """One serialized /status body per channel, shared by every client
+
+    Rebuilt when the controller's status version moves, and otherwise once a
+    second while a remaining-time field is counting down or once a minute
+    for the maintenance countdown. The ETag only changes when the body does.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+        self.body = None
+        self.etag = None
+        self.serial = 0
+        self.version = -1
+        self.built = 0
+        self.minutes = -1
+        # Keeps ETags from one boot from matching the next
+        self.prefix = '"' + hex(random.getrandbits(24))[2:] + '-'
+
+    def stale(self, snapshot):
+        if self.body is None or self.version != snapshot.version:
+            return True
+        if snapshot.cool_down or snapshot.maintenance:
+            return time.ticks_diff(time.ticks_ms(), self.built) >= 1000
+        return get_current_minutes() != self.minutes
+
+    def refresh(self):
+        snapshot = status_snapshot(self.channel)
+        if not self.stale(snapshot):
+            return
+        self.version = snapshot.version
+        self.built = time.ticks_ms()
+        self.minutes = get_current_minutes()
+        body = ''.join(status_json(snapshot))
+        if body != self.body:
+            self.body = body
+            self.serial += 1
+            self.etag = self.prefix + str(self.serial) + '"'
+
+def status_snapshot(i):
+    """Channel i's status: as last published by the control thread, or as of now"""
+    if control:
+        return control.snapshots[i]
+    return controllers[i].status_snapshot()
+
+status_caches = [StatusCache(i) for i in range(len(controllers))]
+
+# MQTT telemetry over a station-mode link to the site network, off unless
+# "telemetry" names a broker. It runs as a task on the web side; see telemetry.py.
+TELEMETRY = config.get("telemetry") or {}
+telemetry = None
+if TELEMETRY.get("broker"):
+    from telemetry import Telemetry
+    try:
+        telemetry = Telemetry(TELEMETRY["broker"], TELEMETRY.get("port", 1883), TELEMETRY.get("topic", "gencontroller"),
+                              TELEMETRY.get("client_id", "gencontroller"), TELEMETRY.get("user"), TELEMETRY.get("password"),
+                              TELEMETRY.get("interval_s", 10), TELEMETRY.get("queue_records", 64))
+    except ValueError as e:
+        print('[ERROR] telemetry disabled:', e)
+
+# Credentials in the telemetry block; the web pages only learn whether they are set
+TELEMETRY_SECRETS = ('user', 'password', 'wifi_password')
+
+def public_config():
+    """config as served to clients of the open AP, without the telemetry credentials"""
+    if not TELEMETRY:
+        return config
+    public = dict(config)
+    public["telemetry"] = {k: bool(v) if k in TELEMETRY_SECRETS else v for k, v in TELEMETRY.items()}
+    return public
+
+def offer_telemetry_status():
+    """Hand telemetry each channel's /status body; it only sends the ones that changed"""
+    for cache, c in zip(status_caches, controllers):
+        cache.refresh()
+        telemetry.offer_status(c.name, cache.body)
+
+# Server-Sent Events. Each open stream holds one of the server's connection slots,
+# so leave at least two slots for ordinary requests.
+MAX_EVENT_CLIENTS = max(1, min(4, app.max_connections - 2))
+EVENT_POLL_MS = 1000         # How often open streams look for changed status fields
+EVENT_KEEPALIVE_MS = 15000
+EVENT_STALE_MS = 5000        # A stream not pulled for this long has lost its client
+event_streams = []
+events_changed = asyncio.Event()
+
+def notify_event_streams():
+    """Wake every open event stream"""
+    global events_changed
+    changed = events_changed
+    events_changed = asyncio.Event()
+    changed.set()
+
+def stored_log_entry(i, seq):
+    """Channel i's log entry as the shared event log keeps it, tagged with the channel after the first"""
+    c = controllers[i]
+    ts, ev, det = c.state_log.entry(seq)
+    if i:
+        det = '[' + c.name + '] ' + det
+    return ts, ev, det
+
+# Last log entry of each channel that open_storage() copied into the event log
+stored_seqs = [0] * len(channel_configs)
+
+def handle_control_event(event):
+    """Store and stream one event a controller reported"""
+    kind = event[0]
+    i = event[1]
+    if kind == 'log':
+        if event_log and event[2] > stored_seqs[i]:
+            event_log.record(event[3], event[4], event[5])
+        if telemetry:
+            telemetry.add_log(controllers[i].name, event[2], event[3], event[4], event[5])
+        notify_event_streams()
+    elif run_histories[i]:
+        if kind == 'run':
+            run_histories[i].record_run(event[2], event[3], event[4], event[5])
+        else:
+            run_histories[i].record_failed_start(event[2], event[3])
+
+def report(event):
+    # The control thread must not touch the stores or asyncio objects, so it posts
+    if control:
+        control.post(event)
+    else:
+        handle_control_event(event)
+
+def attach_channel(i, c):
+    """Send channel i's log entries, runs and failed starts to the shared stores"""
+    def on_log_entry(seq):
+        report(('log', i, seq) + stored_log_entry(i, seq))
+
+    def on_run(day, start_minute, duration_ms, maintenance):
+        report(('run', i, day, start_minute, duration_ms, maintenance))
+
+    def on_failed_start():
+        report(('failed_start', i, c.days_elapsed, get_current_minutes()))
+
+    c.on_log = on_log_entry
+    c.on_run = on_run
+    c.on_failed_start = on_failed_start
+
+for i, c in enumerate(controllers):
+    attach_channel(i, c)
+
+def log_fields(controller, since):
+    """The "log", "seq" and "resync" members for entries newer than since
+
+    resync means the client missed some entries (or holds a cursor from
+    before a reboot) and gets them all.
+    """
+    state_log = controller.state_log
+    resync = state_log.is_behind(since)
+    if resync:
+        since = 0
+    yield '"log":['
+    first = True
+    for seq in state_log.seqs_since(since):
+        if not first:
+            yield ','
+        first = False
+        yield state_log.entry_json(seq)
+    yield '],"seq":' + str(state_log.last_seq)
+    yield ',"resync":' + ('true' if resync else 'false')
+
+def log_entries_json(controller, since):
+    state_log = controller.state_log
+    return '[' + ','.join([state_log.entry_json(seq) for seq in state_log.seqs_since(since)]) + ']'
+
+def sse_message(event, data):
+    """Frame an already JSON-encoded payload as one event"""
+    return 'event: ' + event + '\ndata: ' + data + '\n\n'
+
+class EventStream:
+    """Response body for /events: a full snapshot, then only changed status fields and new log entries"""
+    def __init__(self, channel):
+        self.channel = channel
+        self.controller = controllers[channel]
+        self.status_cache = status_caches[channel]
+        self.status = None
+        self.status_serial = 0
+        self.log_seq = self.controller.state_log.last_seq
+        self.last_active = time.ticks_ms()
+        self.last_sent = self.last_active
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        controller = self.controller
+        status_cache = self.status_cache
+        if self.status is None:
+            status_cache.refresh()
+            self.status_serial = status_cache.serial
+            self.status = status_dict(status_snapshot(self.channel))
+            self.log_seq = controller.state_log.last_seq
+            return sse_message('snapshot', '{"status":' + ujson.dumps(self.status)
+                               + ',"log":' + log_entries_json(controller, 0)
+                               + ',"seq":' + str(self.log_seq)
+                               + ',"uptime_ms":' + str(time.ticks_ms()) + '}')
+        while True:
+            now = time.ticks_ms()
+            self.last_active = now
+            if controller.state_log.last_seq != self.log_seq:
+                since = self.log_seq
+                self.log_seq = controller.state_log.last_seq
+                self.last_sent = now
+                return sse_message('log', log_entries_json(controller, since))
+            # Only diff the status when the shared serialization has moved on
+            status_cache.refresh()
+            if status_cache.serial != self.status_serial:
+                self.status_serial = status_cache.serial
+                status = status_dict(status_snapshot(self.channel))
+                changed = {k: v for k, v in status.items() if self.status.get(k) != v}
+                if changed:
+                    self.status = status
+                    self.last_sent = now
+                    return sse_message('status', ujson.dumps(changed))
+            if time.ticks_diff(now, self.last_sent) >= EVENT_KEEPALIVE_MS:
+                self.last_sent = now
+                return ': keepalive\n\n'
+            try:
+                await asyncio.wait_for_ms(events_changed.wait(), EVENT_POLL_MS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def aclose(self):
+        if self in event_streams:
+            event_streams.remove(self)
+
+def prune_event_streams():
+    now = time.ticks_ms()
+    for stream in event_streams[:]:
+        if time.ticks_diff(now, stream.last_active) > EVENT_STALE_MS:
+            event_streams.remove(stream)
+
+async def open_storage():
+    """Open the event log and run histories, then add the entries logged while booting"""
+    global event_log
+    try:
+        log = EventLog()
+        for i, c in enumerate(controllers):
+            for seq in c.state_log.seqs_since(0):
+                log.record(*stored_log_entry(i, seq))
+                stored_seqs[i] = seq
+        event_log = log
+    except Exception as e:
+        print('[ERROR] event log:', e)
+    for i in range(len(controllers)):
+        await asyncio.sleep_ms(0)
+        try:
+            # Channel 0 keeps the original directory
+            run_histories[i] = RunHistory(HISTORY_DIR if i == 0 else HISTORY_DIR + str(i + 1))
+        except Exception as e:
+            print('[ERROR] run history:', e)
+    boot_mark('storage_open')
+
+async def flush_storage():
+    last_flush = time.ticks_ms()
+    while True:
+        await asyncio.sleep_ms(1000)
+        persistence.watch(controllers)
+        try:
+            persistence.flush(config, controllers, get_current_minutes())
+        except Exception as e:
+            print('[ERROR] config/state save:', e)
+        for c, run_history in zip(controllers, run_histories):
+            if not run_history:
+                continue
+            # Rollups only change when a run ends or a day passes, so write them straight away
+            run_history.set_day(c.days_elapsed)
+            try:
+                run_history.flush()
+            except Exception as e:
+                print('[ERROR] run history flush:', e)
+        if not event_log or not event_log.pending:
+            continue
+        if len(event_log.pending) < EVENT_LOG_FLUSH_BYTES and time.ticks_diff(time.ticks_ms(), last_flush) < EVENT_LOG_FLUSH_MS:
+            continue
+        try:
+            event_log.flush()
+        except Exception as e:
+            print('[ERROR] event log flush:', e)
+        last_flush = time.ticks_ms()
+
+async def deliver_control_events():
+    """Hand what the control thread posted to the stores and event streams"""
+    while True:
+        await control.events_ready.wait()
+        while True:
+            event = control.outbox.get()
+            if event is None:
+                break
+            handle_control_event(event)
+
+async def in_control_loop(fn):
+    """Run fn(), which changes controllers, where the control loop allows it
+
+    That is on the control thread between two passes when there is one, and
+    right here otherwise; either way the loop runs a pass straight after.
+    """
+    if control:
+        return await control.call(fn)
+    result = fn()
+    wake_control()
+    return result
+
+async def update_leds():
+    while True:
+        running = request = cool_down = maintenance = False
+        for i in range(len(controllers)):
+            snapshot = status_snapshot(i)
+            running = running or snapshot.running
+            request = request or snapshot.run_request
+            cool_down = cool_down or snapshot.cool_down
+            maintenance = maintenance or snapshot.maintenance
+        led_running.value(running)
+        led_run_request.value(request)
+        led_cool_down.value(cool_down)
+        led_maintenance.value(maintenance)
+        await asyncio.sleep_ms(500)
+
+# Static assets: gzip copies and content hashes produced by host/build_assets.py
+STATIC_DIR = 'static'
+
+def load_asset_hashes():
+    try:
+        with open(STATIC_DIR + '/assets.json') as f:
+            return ujson.load(f)
+    except:
+        return {}
+
+asset_hashes = load_asset_hashes()
+# Pages and assets held in RAM, so a repeat request doesn't read flash
+response_cache = ResponseCache(config.get("response_cache_bytes", CACHE_BYTES),
+                               config.get("response_cache_min_free_bytes", MIN_FREE_BYTES))
+
+def send_sized_file(path, **kwargs):
+    """send_file() with a Content-Length, so the connection can be kept alive"""
+    res = send_file(path, **kwargs)
+    res.headers['Content-Length'] = str(os.stat(path)[6])
+    return res
+
+def send_cached_file(path, content_type=None, compressed=False):
+    """The file from the response cache, or send_sized_file() if it isn't cached"""
+    data = response_cache.get(path)
+    if data is None:
+        return send_sized_file(path, content_type=content_type, compressed=compressed)
+    headers = {'Content-Type': content_type or Response.types_map.get(path.split('.')[-1], 'application/octet-stream'),
+               'Content-Length': str(len(data))}
+    if compressed:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body=CachedBody(data), headers=headers)
+
+def serve_asset(request, filename):
+    """send_file() with a strong ETag, 304 revalidation and the precompressed copy when there is one"""
+    digest = asset_hashes.get(filename)
+    if digest is None:
+        return send_cached_file(filename)
+    gzip_ok = 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = '"' + digest + ('-gz"' if gzip_ok else '"')
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status_code=304, headers=headers)
+    if gzip_ok:
+        res = send_cached_file(STATIC_DIR + '/' + filename + '.gz', compressed=True,
+                               content_type=Response.types_map.get(filename.split('.')[-1]))
+    else:
+        res = send_cached_file(filename)
+    res.headers.update(headers)
+    return res
+
+def request_channel(request):
+    """Channel index from ?channel=<n>; channel 0 when it is left out"""
+    channel = int(request.args.get('channel', 0))
+    if not 0 <= channel < len(controllers):
+        raise ValueError('No channel ' + str(channel))
+    return channel
+
+# Web server routes
+@app.route('/')
+def index(request):
+    try:
+        return serve_asset(request, 'index.html')
+    except Exception as e:
+        print('[ERROR] / route:', e)
+        return Response(body='Error', status_code=500)
+
+@app.route('/script.js')
+def script_js(request):
+    try:
+        return serve_asset(request, 'script.js')
+    except Exception as e:
+        print('[ERROR] /script.js route:', e)
+        return Response(body='Error', status_code=500)
+
+@app.route('/status')
+def get_status(request):
+    try:
+        status_cache = status_caches[request_channel(request)]
+        status_cache.refresh()
+        headers = {'Content-Type': 'application/json', 'ETag': status_cache.etag, 'Cache-Control': 'no-cache'}
+        if request.headers.get('If-None-Match') == status_cache.etag:
+            return Response(status_code=304, headers=headers)
+        return status_cache.body, 200, headers
+    except Exception as e:
+        print('[ERROR] /status route:', e)
+        return {'error': str(e)}
+
+@app.route('/uptime')
+def get_uptime(request):
+    try:
+        return {'uptime_ms': time.ticks_ms()}
+    except Exception as e:
+        print('[ERROR] /uptime route:', e)
+        return {'error': str(e)}
+
+
+@app.route('/log')
+def get_log(request):
+    try:
+        # ?since=<seq> returns only newer entries
+        since = int(request.args.get('since', 0))
+        controller = controllers[request_channel(request)]
+        def generate_log():
+            yield '{'
+            yield from log_fields(controller, since)
+            yield ',"uptime_ms":' + str(time.ticks_ms()) + '}'
+        return BufferedBody(generate_log()), 200, {'Content-Type': 'application/json'}
+    except Exception as e:
+        print('[ERROR] /log route:', e)
+        return {'error': str(e)}
+
+DASHBOARD_SECTIONS = ('uptime', 'status', 'log', 'config')
+
+@app.route('/dashboard')
+def get_dashboard(request):
+    """Everything a page needs for one refresh in a single response
+
+    ?include= picks the sections (default all), ?channel= the channel and
+    ?log_since= works like /log?since=. Sections always come out in
+    DASHBOARD_SECTIONS order.
+    """
+    try:
+        channel = request_channel(request)
+        include = request.args.get('include')
+        include = include.split(',') if include else DASHBOARD_SECTIONS
+        for section in include:
+            if section not in DASHBOARD_SECTIONS:
+                return {'error': 'Unknown section: ' + section}, 400
+        since = int(request.args.get('log_since', 0))
+        status_cache = status_caches[channel]
+        if 'status' in include:
+            status_cache.refresh()
+        def generate_dashboard():
+            sep = '{'
+            for section in DASHBOARD_SECTIONS:
+                if section not in include:
+                    continue
+                yield sep
+                sep = ','
+                if section == 'uptime':
+                    yield '"uptime_ms":' + str(time.ticks_ms())
+                elif section == 'status':
+                    yield '"status":'
+                    yield status_cache.body
+                elif section == 'log':
+                    yield from log_fields(controllers[channel], since)
+                else:
+                    yield '"config":'
+                    yield ujson.dumps(public_config())
+            yield '}'
+        return BufferedBody(generate_dashboard()), 200, {'Content-Type': 'application/json'}
+    except Exception as e:
+        print('[ERROR] /dashboard route:', e)
+        return {'error': str(e)}
+
+@app.route('/channels')
+def get_channels(request):
+    """Every channel's name, pins and status, in channel order"""
+    try:
+        for status_cache in status_caches:
+            status_cache.refresh()
+        def generate_channels():
+            yield '{"channels":['
+            for i, c in enumerate(controllers):
+                if i:
+                    yield ','
+                settings = channel_configs[i]
+                yield '{"channel":' + str(i) + ',"name":' + ujson.dumps(c.name)
+                yield ',"pins":' + ujson.dumps({k: settings[k] for k in ('run_sense', 'run_request', 'start', 'kill')})
+                yield ',"maintenance_minute":' + str(c.maintenance_minute())
+                yield ',"status":'
+                yield status_caches[i].body
+                yield '}'
+            yield ']}'
+        return BufferedBody(generate_channels()), 200, {'Content-Type': 'application/json'}
+    except Exception as e:
+        print('[ERROR] /channels route:', e)
+        return {'error': str(e)}
+
+@app.route('/events')
+def get_events(request):
+    try:
+        prune_event_streams()
+        if len(event_streams) >= MAX_EVENT_CLIENTS:
+            # The dashboard falls back to polling
+            return {'error': 'Too many event streams'}, 503
+        stream = EventStream(request_channel(request))
+        event_streams.append(stream)
+        return stream, 200, {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+    except Exception as e:
+        print('[ERROR] /events route:', e)
+        return {'error': str(e)}
+
+@app.route('/log/history')
+def get_log_history(request):
+    try:
+        if not event_log:
+            return {'error': 'Event log unavailable'}, 503
+        before = request.args.get('before')
+        before = int(before) if before else None
+        limit = min(int(request.args.get('limit', 20)), 100)
+        records = event_log.query(before, limit, request.args.get('event'))
+        def generate_history():
+            yield '{"log":['
+            for i, (seq, ts, boot, ev, det) in enumerate(records):
+                if i > 0:
+                    yield ','
+                yield '{"seq":' + str(seq) + ',"boot":' + str(boot) + ',"timestamp":' + str(ts) + ',"event":' + ujson.dumps(ev) + ',"details":' + ujson.dumps(det) + '}'
+            yield '],"next_before":' + (str(records[-1][0]) if len(records) == limit else 'null')
+            yield ',"boot":' + str(event_log.boot) + '}'
+        return BufferedBody(generate_history()), 200, {'Content-Type': 'application/json'}
+    except Exception as e:
+        print('[ERROR] /log/history route:', e)
+        return {'error': str(e)}
+
+@app.route('/history')
+def get_history(request):
+    try:
+        run_history = run_histories[request_channel(request)]
+        if not run_history:
+            return {'error': 'Run history unavailable'}, 503
+        if request.args.get('format') == 'csv':
+            return BufferedBody(run_history.csv_rows()), 200, {'Content-Type': 'text/csv'}
+        return run_history.rollups()
+    except Exception as e:
+        print('[ERROR] /history route:', e)
+        return {'error': str(e)}
+
+@app.route('/logpage')
+def log_page(request):
+    try:
+        return serve_asset(request, 'log.html')
+    except Exception as e:
+        print('[ERROR] /logpage route:', e)
+        return Response(body='Error', status_code=500)
+
+@app.route('/config')
+def config_page(request):
+    try:
+        return serve_asset(request, 'config.html')
+    except Exception as e:
+        print('[ERROR] /config route:', e)
+        return Response(body='Error', status_code=500)
+
+@app.route('/config/data')
+def get_config(request):
+    try:
+        return public_config()
+    except Exception as e:
+        print('[ERROR] /config/data route:', e)
+        return {'error': str(e)}
+
+def parse_form_data(body):
+    data = {}
+    for pair in body.decode().split('&'):
+        if '=' in pair:
+            k, v = pair.split('=', 1)
+            data[k] = v
+    return data
+
+@app.route('/config/update', methods=['POST'])
+async def update_config_route(request):
+    try:
+        data = parse_form_data(request.body)
+        for k in data:
+            # Anything else (a channel list or telemetry block overwritten by a
+            # number) would stop the board booting once saved
+            if k not in DEFAULT_CONFIG and k != 'current_minutes':
+                return {'error': 'Unknown setting: ' + k}, 400
+            try:
+                data[k] = int(data[k])
+            except ValueError:
+                return {'error': 'Not a whole number: ' + k}, 400
+        old_start_hour = config.get("maintenance_start_hour", 12)
+        old_start_minute = config.get("maintenance_start_minute", 0)
+        # The browser's clock sync is runtime state, not config
+        host_minutes = data.pop('current_minutes', None)
+        if data:
+            config.update(data)
+            persistence.config_changed()
+
+        settings = [channel_settings(i) for i in range(len(controllers))]
+        start_changed = config["maintenance_start_hour"] != old_start_hour or config["maintenance_start_minute"] != old_start_minute
+
+        def apply():
+            # Update every channel from the new config (channel overrides still win)
+            for c, channel_config in zip(controllers, settings):
+                c.configure(channel_config)
+            clock_set = host_minutes is not None and abs(get_current_minutes() - host_minutes) > 1
+            if clock_set:
+                set_current_minutes(host_minutes)
+            # Reset countdown if start time changed
+            for c in controllers:
+                if start_changed:
+                    c.days_until_maintenance = c.maintenance_interval_days
+                    c.maintenance_check_time = time.ticks_ms()
+                c.mark_status_changed()
+            return clock_set
+
+        if await in_control_loop(apply):
+            persistence.state_changed()
+        return {'status': 'ok'}
+    except Exception as e:
+        print('[ERROR] /config/update route:', e)
+        return {'error': str(e)}
+
+first_request_served = False
+
+@app.after_request
+def mark_first_request(request, response):
+    global first_request_served
+    if not first_request_served:
+        first_request_served = True
+        boot_mark('first_request')
+    return response
+
+@app.before_request
+def start_request_timer(request):
+    request.start_ms = time.ticks_ms()
+
+def record_request(request, response):
+    """Count a response once the server has written all of it, so streamed bodies are timed too"""
+    # Only matched routes pass start_request_timer(), so the set of paths stays fixed
+    start = getattr(request, 'start_ms', None)
+    if start is not None:
+        stats = route_stats.get(request.path)
+        if stats is None:
+            stats = route_stats[request.path] = RouteStats()
+        stats.latency.observe(time.ticks_diff(time.ticks_ms(), start))
+        if response.status_code >= 500:
+            stats.errors += 1
+    # Short of heap: cached files go first, collected now unless a relay is being held
+    if response_cache.relieve() and not scheduler.relay_held():
+        collect_garbage()
+    sample_heap()
+
+app.response_sent = record_request
+
+@app.route('/metrics')
+def get_metrics(request):
+    try:
+        def generate_metrics():
+            yield header('gen_loop_lateness_ms', 'histogram', 'How late the control loop woke for a deadline')
+            yield from loop_lateness.lines('gen_loop_lateness_ms')
+            yield header('gen_loop_lateness_max_ms', 'gauge', 'Worst control loop lateness since boot')
+            yield 'gen_loop_lateness_max_ms %d\n' % loop_lateness_max
+            yield header('gen_loop_lateness_budget_ms', 'gauge', 'Configured control loop lateness budget')
+            yield 'gen_loop_lateness_budget_ms %d\n' % LATENESS_BUDGET_MS
+            yield header('gen_loop_over_budget_total', 'counter', 'Control loop wakeups later than the budget')
+            yield 'gen_loop_over_budget_total %d\n' % loop_over_budget
+            if control:
+                yield header('gen_control_thread_up', 'gauge', 'Whether the control thread is still running')
+                yield 'gen_control_thread_up %d\n' % (control.error is None)
+                yield header('gen_control_events_dropped_total', 'counter', 'Controller events the web side fell too far behind to take')
+                yield 'gen_control_events_dropped_total %d\n' % control.events_dropped
+            if telemetry:
+                yield header('gen_telemetry_connected', 'gauge', 'Whether the MQTT broker connection is up')
+                yield 'gen_telemetry_connected %d\n' % telemetry.connected()
+                yield header('gen_telemetry_queued_records', 'gauge', 'Log entries waiting for the broker')
+                yield 'gen_telemetry_queued_records %d\n' % telemetry.count
+                yield header('gen_telemetry_published_total', 'counter', 'Messages the broker acknowledged')
+                yield 'gen_telemetry_published_total %d\n' % telemetry.published
+                yield header('gen_telemetry_dropped_total', 'counter', 'Log entries lost because the queue was full')
+                yield 'gen_telemetry_dropped_total %d\n' % telemetry.dropped_total
+                yield header('gen_telemetry_errors_total', 'counter', 'Failed broker connections and publishes')
+                yield 'gen_telemetry_errors_total %d\n' % telemetry.errors
+            yield header('gen_relay_latency_ms', 'histogram', 'Time from an input edge or deadline to the relay write it caused')
+            for path, histogram in zip(LATENCY_PATHS, relay_latency):
+                yield from histogram.lines('gen_relay_latency_ms', 'path="' + path + '"')
+            yield header('gen_relay_latency_quantile_ms', 'gauge', 'Estimated percentiles of gen_relay_latency_ms')
+            for path, histogram in zip(LATENCY_PATHS, relay_latency):
+                if histogram.count():
+                    for q in LATENCY_QUANTILES:
+                        yield 'gen_relay_latency_quantile_ms{path="%s",quantile="%s"} %d\n' % (path, q, histogram.quantile(float(q)))
+            yield header('gen_deadline_missed_total', 'counter', 'Wakeups later than the deadline guard, each releasing the relays')
+            yield 'gen_deadline_missed_total %d\n' % deadline_misses
+            yield header('gen_watchdog_enabled', 'gauge', 'Whether the hardware watchdog is running')
+            yield 'gen_watchdog_enabled %d\n' % (watchdog is not None)
+            yield header('gen_controller_update_us', 'histogram', 'Time spent in one control pass over all channels')
+            yield from update_time.lines('gen_controller_update_us')
+            yield header('gen_channel_update_us', 'histogram', 'Time spent in one controller update pass per channel')
+            for c, histogram in zip(controllers, channel_update_time):
+                yield from histogram.lines('gen_channel_update_us', 'channel="' + c.name + '"')
+            yield header('gen_http_request_duration_ms', 'histogram', 'Time from routing a request to the last byte of its response')
+            for path, stats in route_stats.items():
+                yield from stats.latency.lines('gen_http_request_duration_ms', 'route="' + path + '"')
+            yield header('gen_http_requests_total', 'counter', 'Requests handled per route')
+            for path, stats in route_stats.items():
+                yield 'gen_http_requests_total{route="%s"} %d\n' % (path, stats.latency.count())
+            yield header('gen_http_errors_total', 'counter', 'Responses with a 5xx status per route')
+            for path, stats in route_stats.items():
+                yield 'gen_http_errors_total{route="%s"} %d\n' % (path, stats.errors)
+            yield header('gen_http_connections', 'gauge', 'Connections being served and waiting for a slot')
+            yield 'gen_http_connections{state="active"} %d\n' % app.active
+            yield 'gen_http_connections{state="queued"} %d\n' % app.queued
+            yield header('gen_http_rejected_total', 'counter', 'Connections answered with 503 because the server was full')
+            yield 'gen_http_rejected_total %d\n' % app.rejected
+            yield header('gen_http_keepalive_reused_total', 'counter', 'Requests served on a reused connection')
+            yield 'gen_http_keepalive_reused_total %d\n' % app.reused
+            yield header('gen_response_cache_requests_total', 'counter', 'Cacheable file requests served from RAM (hit) or flash (miss)')
+            yield 'gen_response_cache_requests_total{result="hit"} %d\n' % response_cache.hits
+            yield 'gen_response_cache_requests_total{result="miss"} %d\n' % response_cache.misses
+            yield header('gen_response_cache_bytes', 'gauge', 'Bytes held in the response cache and its budget')
+            yield 'gen_response_cache_bytes %d\n' % response_cache.size
+            yield 'gen_response_cache_bytes{mark="budget"} %d\n' % response_cache.budget
+            yield header('gen_response_cache_evictions_total', 'counter', 'Files dropped from the response cache for space or heap')
+            yield 'gen_response_cache_evictions_total %d\n' % response_cache.evictions
+            yield header('gen_heap_free_bytes', 'gauge', 'gc.mem_free() now and its low/high water marks')
+            yield 'gen_heap_free_bytes %d\n' % gc.mem_free()
+            yield 'gen_heap_free_bytes{mark="low"} %d\n' % heap_free.low
+            yield 'gen_heap_free_bytes{mark="high"} %d\n' % heap_free.high
+            yield header('gen_heap_alloc_bytes', 'gauge', 'gc.mem_alloc() now and its low/high water marks')
+            yield 'gen_heap_alloc_bytes %d\n' % gc.mem_alloc()
+            yield 'gen_heap_alloc_bytes{mark="low"} %d\n' % heap_alloc.low
+            yield 'gen_heap_alloc_bytes{mark="high"} %d\n' % heap_alloc.high
+        return BufferedBody(generate_metrics()), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+    except Exception as e:
+        print('[ERROR] /metrics route:', e)
+        return Response(body='Error', status_code=500)
+
+@app.route('/boot')
+def get_boot(request):
+    try:
+        return {
+            'phases': [{'phase': phase, 'ms': ticks} for phase, ticks in boot_phases],
+            'reset_cause': machine.reset_cause(),
+        }
+    except Exception as e:
+        print('[ERROR] /boot route:', e)
+        return {'error': str(e)}
+
+@app.route('/trace')
+async def get_trace(request):
+    try:
+        body = await in_control_loop(lambda: trace.snapshot(controllers))
+        # Microdot only sizes bytes bodies by itself
+        return body, 200, {'Content-Type': 'application/octet-stream', 'Content-Length': str(len(body))}
+    except Exception as e:
+        print('[ERROR] /trace route:', e)
+        return {'error': str(e)}
+
+@app.route('/ping')
+def ping(request):
+    try:
+        return {'status': 'ok', 'message': 'Server is running'}
+    except Exception as e:
+        print('[ERROR] /ping route:', e)
+        return {'error': str(e)}
+
+# Testing endpoints
+@app.route('/test/force_maintenance', methods=['POST'])
+async def test_force_maintenance(request):
+    try:
+        controller = controllers[request_channel(request)]
+        def force():
+            controller.days_until_maintenance = 0
+            controller.log_state_change('TEST', 'Forced maintenance countdown to 0')
+        await in_control_loop(force)
+        return {'status': 'ok', 'message': 'Maintenance will start in next cycle'}
+    except Exception as e:
+        print('[ERROR] /test/force_maintenance route:', e)
+        return {'error': str(e)}
+
+@app.route('/test/override_running', methods=['POST'])
+async def test_override_running_endpoint(request):
+    try:
+        controller = controllers[request_channel(request)]
+        sensor_manager = controller.sensor_manager
+        data = request.json
+        override = data.get('override')  # True, False, or None
+        def set_override():
+            if override == 'none' or override is None:
+                sensor_manager.set_override_running(None)
+                controller.log_state_change('TEST', 'Cleared running override (using sensor)')
+            else:
+                sensor_manager.set_override_running(bool(override))
+                controller.log_state_change('TEST', f'Override running = {bool(override)}')
+            return sensor_manager.test_override_running
+        return {'status': 'ok', 'override': await in_control_loop(set_override)}
+    except Exception as e:
+        print('[ERROR] /test/override_running route:', e)
+        return {'error': str(e)}
+
+@app.route('/test/override_request', methods=['POST'])
+async def test_override_request_endpoint(request):
+    try:
+        controller = controllers[request_channel(request)]
+        sensor_manager = controller.sensor_manager
+        data = request.json
+        override = data.get('override')  # True, False, or None
+        def set_override():
+            if override == 'none' or override is None:
+                sensor_manager.set_override_request(None)
+                controller.log_state_change('TEST', 'Cleared request override (using sensor)')
+            else:
+                sensor_manager.set_override_request(bool(override))
+                controller.log_state_change('TEST', f'Override request = {bool(override)}')
+            return sensor_manager.test_override_request
+        return {'status': 'ok', 'override': await in_control_loop(set_override)}
+    except Exception as e:
+        print('[ERROR] /test/override_request route:', e)
+        return {'error': str(e)}
+
+@app.route('/style.css')
+def style_css(request):
+    try:
+        return serve_asset(request, 'style.css')
+    except Exception as e:
+        print('[ERROR] /style.css route:', e)
+        return Response(body='Error', status_code=500)
+
+ap = None
+
+async def start_access_point():
+    """Bring up the WiFi access point without blocking the control loop"""
+    global ap
+    ap = network.WLAN(network.AP_IF)
+    ap.config(hostname='gencontroller')
+    ap.config(essid='GenController', password='westinghouse', authmode=network.AUTH_WPA_WPA2_PSK)
+    ap.active(True)
+    while not ap.active():
+        await asyncio.sleep_ms(100)
+    boot_mark('ap_active')
+    print('AP active, IP:', ap.ifconfig()[0])
+    print('Connect to: http://gencontroller.local')
+
+async def run_telemetry():
+    """Join the site network as a station, alongside the AP, and publish to the broker"""
+    sta = network.WLAN(network.STA_IF)
+    sta.active(True)
+    if TELEMETRY.get("ssid"):
+        sta.connect(TELEMETRY["ssid"], TELEMETRY.get("wifi_password", ""))
+    await telemetry.run(offer_telemetry_status, sta.isconnected)
+
+async def main():
+    global watchdog_armed
+    print('Starting Generator Controller...')
+    # Control loop first; everything else starts behind it
+    if control:
+        control.start(CONTROL_STACK_BYTES)
+        t1 = asyncio.create_task(deliver_control_events())
+    else:
+        t1 = asyncio.create_task(control_loop.run())
+    t2 = asyncio.create_task(update_leds())
+    await asyncio.sleep_ms(0)
+    boot_mark('control_loop')
+    await open_storage()
+    t3 = asyncio.create_task(flush_storage())
+    await start_access_point()
+    if telemetry:
+        t4 = asyncio.create_task(run_telemetry())
+    # Boot allocations are done: collect and set the automatic threshold from what is left
+    collect_garbage()
+    gc.threshold(gc.mem_free() // GC_THRESHOLD + gc.mem_alloc())
+    # Slow boot steps are behind us too: the control loop starts the watchdog on its next wakeup
+    watchdog_armed = WATCHDOG_MS > 0
+    print('Starting web server on http://gencontroller.local or http://' + ap.ifconfig()[0])
+    boot_mark('server_start')
+    try:
+        await app.start_server(host='0.0.0.0', port=80)
+    except Exception as e:
+        print('Error in start_server:', e)
+        raise
+
+try:
+    print('Starting async event loop...')
+    asyncio.run(main())
+except Exception as e:
+    import sys
+    sys.print_exception(e)
+    print('Error starting server:', e)
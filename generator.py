@@ -0,0 +1,947 @@
+import array
+import json
+import time
+from collections import namedtuple
+from iotrace import RAW_SENSE, RAW_REQUEST, SENSE, REQUEST, START_RELAY, KILL_RELAY, KEY_SENSE, KEY_REQUEST, KEY_RAW_SENSE, KEY_RAW_REQUEST
+try:
+    from micropython import const
+except ImportError:
+    def const(x):
+        return x
+
+TICK_MS = 200                        # Input sampling period when the pins are polled
+MS_PER_DAY = 24 * 60 * 60 * 1000     # one day in milliseconds
+KILL_RELAY_DELAY_MS = 2000           # Hold kill relay this long after the generator stops
+START_RETRY_MS = 80000               # No new start attempt this long after a start pulse
+RUN_HOLDOFF_MS = 20000               # No new start attempt this long after the generator is seen running
+LOG_ENTRIES = 50                     # Slots in each controller's log ring
+
+# GeneratorController.flags bits
+_F_PREVIOUS_REQUEST = const(0x001)   # Run request as of the last tick
+_F_STATE_SETTLED = const(0x002)      # Last tick ended in the state it started in
+_F_PULSE_COOLDOWN = const(0x004)     # Start attempts held off until pulse_cooldown_end
+_F_MAINTENANCE = const(0x008)        # Maintenance run in progress
+_F_COOL_DOWN = const(0x010)          # Cool-down in progress
+_F_RUN_MAINTENANCE = const(0x020)    # Current run started as a maintenance run
+_F_LOGGED_RUNNING = const(0x040)     # Last logged run-sense
+_F_LOGGED_REQUEST = const(0x080)     # Last logged run request
+_F_START_RELAY = const(0x100)
+_F_KILL_RELAY = const(0x200)
+_F_MAINTENANCE_RESET = const(0x400)  # Countdown already reset for this run
+_F_WAITING_FOR_STOP = const(0x800)   # Kill relay on, generator still running
+
+# SensorManager.flags bits
+_S_RUNNING = const(0x01)             # Debounced run-sense
+_S_PREVIOUS_RUNNING = const(0x02)    # Debounced run-sense as of the last update_transitions()
+_S_BECAME_RUNNING = const(0x04)
+_S_STOPPED_RUNNING = const(0x08)
+_S_REQUEST = const(0x10)             # Debounced run request (IrqSensorManager)
+_S_TRACED_SENSE = const(0x20)        # Last raw run-sense level recorded in the trace
+_S_TRACED_REQUEST = const(0x40)      # Last raw run-request level recorded in the trace
+
+# Input-to-relay latency paths. A controller tags the cause of its next relay
+# write (an input edge or a deadline) with the time it happened, and the write
+# reports how long ago that was through on_latency(path, ms).
+LATENCY_PATHS = ('request_start', 'retry_start', 'start_release', 'cool_down_kill', 'maintenance_kill', 'kill_release')
+_P_NONE = const(-1)
+_P_REQUEST_START = const(0)      # Run-request edge -> start relay on
+_P_RETRY_START = const(1)        # Start hold-off ending with the request still on -> start relay on
+_P_START_RELEASE = const(2)      # End of the start pulse -> start relay off
+_P_COOL_DOWN_KILL = const(3)     # End of cool-down -> kill relay on
+_P_MAINTENANCE_KILL = const(4)   # End of a maintenance run -> kill relay on
+_P_KILL_RELEASE = const(5)       # End of the kill delay -> kill relay off
+# The relay write that completes each path: start on, start off, kill on, kill off
+_WRITE_START_ON = const(0)
+_WRITE_START_OFF = const(1)
+_WRITE_KILL_ON = const(2)
+_WRITE_KILL_OFF = const(3)
+_PATH_WRITES = bytes((_WRITE_START_ON, _WRITE_START_ON, _WRITE_START_OFF, _WRITE_KILL_ON, _WRITE_KILL_ON, _WRITE_KILL_OFF))
+
+def _flag_property(bit):
+    """Attribute-style access to one bit of self.flags, for code off the hot path"""
+    def get(self):
+        return (self.flags & bit) != 0
+
+    def set(self, value):
+        if value:
+            self.flags |= bit
+        else:
+            self.flags &= ~bit
+    return property(get, set)
+
+# Echo log entries to the console. Off by default: print() blocks on the UART
+# and allocates, right when a relay is switching.
+log_echo = False
+
+# Fake RTC
+rtc_base_minutes = 0
+rtc_base_ticks = time.ticks_ms()
+
+def get_current_minutes():
+    global rtc_base_minutes, rtc_base_ticks
+    elapsed_minutes = time.ticks_diff(time.ticks_ms(), rtc_base_ticks) // 60000
+    if elapsed_minutes >= 1440:
+        # Move the base forward so ticks_diff never has to span a ticks wrap
+        rtc_base_minutes = (rtc_base_minutes + elapsed_minutes) % 1440
+        rtc_base_ticks = time.ticks_add(rtc_base_ticks, elapsed_minutes * 60000)
+        elapsed_minutes = 0
+    return (rtc_base_minutes + elapsed_minutes) % 1440
+
+def set_current_minutes(minutes):
+    """Re-base the fake RTC so the current time of day is `minutes`"""
+    global rtc_base_minutes, rtc_base_ticks
+    rtc_base_minutes = minutes % 1440
+    rtc_base_ticks = time.ticks_ms()
+
+def ms_until_minute_of_day(minute):
+    """Milliseconds until the fake RTC next reads `minute` (0 if it reads it now)"""
+    current_minutes = get_current_minutes()
+    if current_minutes == minute:
+        return 0
+    elapsed = time.ticks_diff(time.ticks_ms(), rtc_base_ticks)
+    return ((minute - current_minutes) % 1440) * 60000 - elapsed % 60000
+
+class LogRing:
+    """Fixed-size, preallocated log of (timestamp, event, details) entries
+
+    Every entry gets a sequence number, starting at 1. Entry `seq` lives in
+    slot `seq % capacity`, so appending overwrites the oldest entry in place.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = [0] * capacity
+        self.events = [''] * capacity
+        self.details = [''] * capacity
+        self.last_seq = 0
+
+    def append(self, timestamp, event, details):
+        # The slot is filled before last_seq moves, so a reader on another
+        # thread never sees a sequence number ahead of its entry
+        seq = self.last_seq + 1
+        i = seq % self.capacity
+        self.timestamps[i] = timestamp
+        self.events[i] = event
+        self.details[i] = details
+        self.last_seq = seq
+        return seq
+
+    def __len__(self):
+        return min(self.last_seq, self.capacity)
+
+    def first_seq(self):
+        """Oldest sequence number still held"""
+        return max(1, self.last_seq - self.capacity + 1)
+
+    def entry(self, seq):
+        i = seq % self.capacity
+        return self.timestamps[i], self.events[i], self.details[i]
+
+    def entry_json(self, seq):
+        """Entry `seq` as the JSON object /log and /events send"""
+        i = seq % self.capacity
+        return ('{"seq":' + str(seq) + ',"timestamp":' + str(self.timestamps[i]) + ',"event":' + json.dumps(self.events[i])
+                + ',"details":' + json.dumps(self.details[i]) + '}')
+
+    def seqs_since(self, seq):
+        """Sequence numbers of the held entries newer than `seq`"""
+        return range(max(seq + 1, self.first_seq()), self.last_seq + 1)
+
+    def is_behind(self, seq):
+        """True if a reader at `seq` has missed entries (or has a cursor from before a reboot)"""
+        return seq < self.first_seq() - 1 or seq > self.last_seq
+
+    def __iter__(self):
+        for seq in self.seqs_since(0):
+            yield self.entry(seq)
+
+# A controller's status frozen at one moment. Tuples are immutable, so a
+# snapshot published by the control thread can be read from the web server's.
+StatusSnapshot = namedtuple('StatusSnapshot', (
+    'version', 'running', 'run_request', 'cool_down', 'cool_down_end', 'maintenance', 'maintenance_end',
+    'days_until_maintenance', 'maintenance_minute', 'start_attempts', 'detected_runs', 'last_start_request',
+    'last_kill_action', 'last_run_sense_start', 'last_run_sense_end'))
+
+def _countdown_minutes(snapshot, current_minutes):
+    """Minutes until the next maintenance run"""
+    return snapshot.days_until_maintenance * 1440 + (snapshot.maintenance_minute - current_minutes + 1440) % 1440
+
+def status_json(snapshot):
+    """The /status body for a StatusSnapshot, in pieces; remaining times count from now"""
+    current_time = time.ticks_ms()
+    current_minutes = get_current_minutes()
+    total_minutes = _countdown_minutes(snapshot, current_minutes)
+
+    yield '{'
+    yield '"running":' + ('true' if snapshot.running else 'false')
+    yield ',"run_request":' + ('true' if snapshot.run_request else 'false')
+    yield ',"cool_down":' + ('true' if snapshot.cool_down else 'false')
+    yield ',"cool_down_remaining":' + str(max(0, time.ticks_diff(snapshot.cool_down_end, current_time)))
+    yield ',"maintenance":' + ('true' if snapshot.maintenance else 'false')
+    yield ',"maintenance_remaining":' + str(max(0, time.ticks_diff(snapshot.maintenance_end, current_time)))
+    yield ',"maintenance_countdown":{"days":' + str(total_minutes // 1440)
+    yield ',"hours":' + str((total_minutes % 1440) // 60)
+    yield ',"minutes":' + str(total_minutes % 60)
+    yield ',"total_minutes":' + str(total_minutes) + '}'
+    yield ',"current_time_minutes":' + str(current_minutes)
+    yield ',"start_attempts":' + str(snapshot.start_attempts)
+    yield ',"detected_runs":' + str(snapshot.detected_runs)
+    yield ',"last_start_request":' + str(snapshot.last_start_request)
+    yield ',"last_kill_action":' + str(snapshot.last_kill_action)
+    yield ',"last_run_sense_start":' + str(snapshot.last_run_sense_start)
+    yield ',"last_run_sense_end":' + str(snapshot.last_run_sense_end)
+    yield '}'
+
+def status_dict(snapshot):
+    """Same fields as status_json(), as a dict"""
+    current_time = time.ticks_ms()
+    current_minutes = get_current_minutes()
+    total_minutes = _countdown_minutes(snapshot, current_minutes)
+    return {
+        'running': snapshot.running,
+        'run_request': snapshot.run_request,
+        'cool_down': snapshot.cool_down,
+        'cool_down_remaining': max(0, time.ticks_diff(snapshot.cool_down_end, current_time)),
+        'maintenance': snapshot.maintenance,
+        'maintenance_remaining': max(0, time.ticks_diff(snapshot.maintenance_end, current_time)),
+        'maintenance_countdown': {
+            'days': total_minutes // 1440,
+            'hours': (total_minutes % 1440) // 60,
+            'minutes': total_minutes % 60,
+            'total_minutes': total_minutes,
+        },
+        'current_time_minutes': current_minutes,
+        'start_attempts': snapshot.start_attempts,
+        'detected_runs': snapshot.detected_runs,
+        'last_start_request': snapshot.last_start_request,
+        'last_kill_action': snapshot.last_kill_action,
+        'last_run_sense_start': snapshot.last_run_sense_start,
+        'last_run_sense_end': snapshot.last_run_sense_end,
+    }
+
+class GeneratorState:
+    IDLE = "idle"                          # Not running, monitoring for requests/maintenance
+    STARTING = "starting"                   # Activating start relay (pulse)
+    CONFIRM_STARTED = "confirm_started"     # Waiting to see if generator started after pulse
+    RUNNING = "running"                     # Running (normal or maintenance)
+    COOL_DOWN = "cool_down"                 # Running but no request; waiting to stop
+    STOPPING = "stopping"                   # Activating kill relay with delay
+
+class GeneratorController:
+    # Every on/off field is one bit of self.flags (the _F_* constants). The
+    # hot paths test the bits directly; these are for everything else.
+    previous_request = _flag_property(_F_PREVIOUS_REQUEST)
+    state_settled = _flag_property(_F_STATE_SETTLED)
+    pulse_cooldown_active = _flag_property(_F_PULSE_COOLDOWN)
+    maintenance_active = _flag_property(_F_MAINTENANCE)
+    cool_down_active = _flag_property(_F_COOL_DOWN)
+    run_maintenance = _flag_property(_F_RUN_MAINTENANCE)
+    logged_running = _flag_property(_F_LOGGED_RUNNING)
+    logged_request = _flag_property(_F_LOGGED_REQUEST)
+    start_relay_on = _flag_property(_F_START_RELAY)
+    kill_relay_on = _flag_property(_F_KILL_RELAY)
+    maintenance_reset = _flag_property(_F_MAINTENANCE_RESET)
+    stopping_waiting_for_stop = _flag_property(_F_WAITING_FOR_STOP)
+
+    def __init__(self, sensor_manager, config, relay_start_gen, relay_kill_gen):
+        self.sensor_manager = sensor_manager
+        self.relay_start_gen = relay_start_gen
+        self.relay_kill_gen = relay_kill_gen
+        self.name = config.get("name", "")
+        self.maintenance_offset_minutes = 0     # Set by stagger_maintenance()
+        self.trace = None                       # Set by attach_trace()
+        self.channel = 0
+        self.configure(config)
+
+        # State variables
+        self.flags = _F_STATE_SETTLED
+        self.days_until_maintenance = self.maintenance_interval_days
+        self.maintenance_check_time = time.ticks_ms()
+        self.maintenance_end = 0
+        self.cool_down_end = 0
+
+        # Statistics and tracking
+        self.start_attempts = 0
+        self.detected_runs = 0
+        self.failed_starts = 0
+        self.days_elapsed = 0          # 24-hour periods since boot
+        self.run_mark = 0              # Start of the part of the current run not yet in run_ms
+        self.run_ms = 0
+        self.run_start_day = 0
+        self.run_start_minutes = 0
+        self.on_run = None             # Called with (start day, start minute, duration ms, maintenance) when a run ends
+        self.on_failed_start = None    # Called when a start attempt gets no run-sense before the retry hold-off
+        self.last_start_request = 0
+        self.last_kill_action = 0
+        self.last_run_sense_start = 0
+        self.last_run_sense_end = 0
+
+        # Timing and relays
+        self.start_relay_end_time = 0
+        self.pulse_cooldown_end = 0
+        self.kill_relay_delay_timer = 0
+        # What the next relay write answers to (a _P_* path) and when it happened
+        self.cause_path = _P_NONE
+        self.cause_time = 0
+        self.on_latency = None  # Called with (LATENCY_PATHS index, ms) when a relay write completes a path
+
+        self.state_log = LogRing(LOG_ENTRIES)
+        self.on_log = None      # Called with the sequence number of each new entry
+        # Bumped whenever a field behind get_status() changes. Every such change
+        # in the state machine is logged, so log_state_change() bumps it too.
+        self.status_version = 0
+        self.logged_days = self.maintenance_interval_days
+
+        self.current_state = None
+        self.state_map = {
+            GeneratorState.IDLE: IdleState(self),
+            GeneratorState.STARTING: StartingState(self),
+            GeneratorState.CONFIRM_STARTED: ConfirmStartedState(self),
+            GeneratorState.RUNNING: RunningState(self),
+            GeneratorState.COOL_DOWN: CoolDownState(self),
+            GeneratorState.STOPPING: StoppingState(self),
+        }
+        self.transition_to(GeneratorState.IDLE)
+
+    def configure(self, config):
+        """Apply the timing settings from a config dict"""
+        self.maintenance_interval_days = config.get("maintenance_interval_days", 7)
+        self.maintenance_duration_minutes = config.get("maintenance_duration_minutes", 10)
+        self.maintenance_duration = self.maintenance_duration_minutes * 60 * 1000
+        self.cool_down_duration_minutes = config.get("cool_down_duration_minutes", 15)
+        self.cool_down_duration = self.cool_down_duration_minutes * 60 * 1000
+        self.maintenance_start_hour = config.get("maintenance_start_hour", 12)
+        self.maintenance_start_minute = config.get("maintenance_start_minute", 0)
+
+    def attach_trace(self, trace, channel):
+        """Record this channel's input edges and relay actions in `trace`"""
+        self.trace = trace
+        self.channel = channel
+        sensor_manager = self.sensor_manager
+        sensor_manager.trace = trace
+        sensor_manager.channel = channel
+        # Raw levels from here on are in the keyframe that follows; only edges get recorded
+        sensor_manager.traced_sense = sensor_manager._is_running_raw()
+        sensor_manager.traced_request = sensor_manager.is_request_raw()
+
+    def trace_keyframe(self):
+        """Record what a replay needs to pick up from here (the controller is idle)"""
+        if not self.trace:
+            return
+        sensor_manager = self.sensor_manager
+        flags = 0
+        if sensor_manager.is_running_debounced():
+            flags |= KEY_SENSE
+        if self.previous_request:
+            flags |= KEY_REQUEST
+        if sensor_manager._is_running_raw():
+            flags |= KEY_RAW_SENSE
+        if sensor_manager.is_request_raw():
+            flags |= KEY_RAW_REQUEST
+        now = time.ticks_ms()
+        holdoff = max(0, time.ticks_diff(self.pulse_cooldown_end, now)) if self.pulse_cooldown_active else 0
+        self.trace.keyframe(self.channel, self.days_until_maintenance, get_current_minutes(),
+                            max(0, time.ticks_diff(now, self.maintenance_check_time)), holdoff, flags)
+
+    def set_start_relay(self, on):
+        self.relay_start_gen.value(1 if on else 0)
+        self.start_relay_on = on
+        if self.trace:
+            self.trace.record(self.channel, START_RELAY, on)
+        self.relay_written(_WRITE_START_ON if on else _WRITE_START_OFF)
+
+    def set_kill_relay(self, on):
+        self.relay_kill_gen.value(1 if on else 0)
+        self.kill_relay_on = on
+        if self.trace:
+            self.trace.record(self.channel, KILL_RELAY, on)
+        self.relay_written(_WRITE_KILL_ON if on else _WRITE_KILL_OFF)
+
+    def tag_cause(self, path, ticks):
+        """Note that the next relay write on `path` answers to something that happened at `ticks`"""
+        self.cause_path = path
+        self.cause_time = ticks
+
+    def relay_written(self, write):
+        path = self.cause_path
+        if path >= 0 and _PATH_WRITES[path] == write:
+            self.cause_path = _P_NONE
+            if self.on_latency:
+                self.on_latency(path, time.ticks_diff(time.ticks_ms(), self.cause_time))
+
+    def fail_safe(self, details):
+        """Release both relays and log why; a state holding one starts over from IDLE"""
+        held = self.relay_held()
+        self.cause_path = _P_NONE
+        if self.flags & _F_START_RELAY:
+            self.set_start_relay(False)
+        if self.flags & _F_KILL_RELAY:
+            self.set_kill_relay(False)
+        self.log_state_change('Deadline Missed', details + ('; relays released' if held else ''))
+        if held:
+            self.transition_to(GeneratorState.IDLE)
+
+    def maintenance_minute(self):
+        """Minute of day this channel's maintenance run starts, stagger included"""
+        return (self.maintenance_start_hour * 60 + self.maintenance_start_minute + self.maintenance_offset_minutes) % 1440
+
+    def log_state_change(self, event, details=''):
+        """Log a state transition with timestamp"""
+        timestamp = time.ticks_ms()
+        self.status_version += 1
+        seq = self.state_log.append(timestamp, event, details)
+        if log_echo:
+            print(f"[{timestamp}] {event}: {details}")
+        if self.on_log:
+            self.on_log(seq)
+
+    def mark_status_changed(self):
+        """Call after changing status fields outside the state machine (config, RTC)"""
+        self.status_version += 1
+
+    def transition_to(self, state):
+        if self.current_state:
+            self.current_state.on_exit()
+        self.current_state = self.state_map[state]
+        self.current_state.on_enter()
+
+    def status_snapshot(self):
+        """Every field get_status() reports, as of now"""
+        sensor_manager = self.sensor_manager
+        return StatusSnapshot(self.status_version, sensor_manager.is_running_debounced(), sensor_manager.is_request_run(),
+                              self.cool_down_active, self.cool_down_end, self.maintenance_active, self.maintenance_end,
+                              self.days_until_maintenance, self.maintenance_minute(), self.start_attempts,
+                              self.detected_runs, self.last_start_request, self.last_kill_action,
+                              self.last_run_sense_start, self.last_run_sense_end)
+
+    def get_status_generator(self):
+        return status_json(self.status_snapshot())
+
+    def get_status(self):
+        """Same fields as get_status_generator(), as a dict"""
+        return status_dict(self.status_snapshot())
+
+    def is_maintenance_starting(self):
+        if self.days_until_maintenance > 0:
+            return False
+        current_minutes = get_current_minutes()
+        configured_minutes = self.maintenance_minute()
+        return current_minutes >= configured_minutes
+
+    def start_pulse_cooldown(self, duration_ms):
+        """Block new start attempts for duration_ms"""
+        self.pulse_cooldown_end = time.ticks_add(time.ticks_ms(), duration_ms)
+        self.pulse_cooldown_active = True
+
+    def relay_held(self):
+        """True while StartingState or StoppingState is holding a relay"""
+        state = self.current_state
+        return state is self.state_map[GeneratorState.STARTING] or state is self.state_map[GeneratorState.STOPPING]
+
+    def update(self):
+        # Update pulse cooldown
+        flags = self.flags
+        if flags & _F_PULSE_COOLDOWN and time.ticks_diff(time.ticks_ms(), self.pulse_cooldown_end) >= 0:
+            self.flags = flags & ~_F_PULSE_COOLDOWN
+            # A start the hold-off kept back is due from the moment it ended
+            state = self.current_state
+            if flags & _F_PREVIOUS_REQUEST and (state is self.state_map[GeneratorState.IDLE]
+                                                or state is self.state_map[GeneratorState.CONFIRM_STARTED]):
+                self.tag_cause(_P_RETRY_START, self.pulse_cooldown_end)
+        self.current_state.update()
+
+    def tick(self):
+        """Run one iteration of the control loop"""
+        sensor_manager = self.sensor_manager
+
+        # Check if a day has passed for maintenance countdown
+        current_time = time.ticks_ms()
+        time_since_check = time.ticks_diff(current_time, self.maintenance_check_time)
+        if time_since_check >= MS_PER_DAY:
+            if self.days_until_maintenance > 0:
+                self.days_until_maintenance -= 1
+            self.maintenance_check_time = time.ticks_add(self.maintenance_check_time, MS_PER_DAY)
+            self.days_elapsed += 1
+            # Reading the RTC once a day keeps its base inside the ticks_diff range
+            get_current_minutes()
+            # Bank run time daily too, so long runs never overflow ticks_diff
+            if sensor_manager.is_running_debounced():
+                self.run_ms += time.ticks_diff(current_time, self.run_mark)
+                self.run_mark = current_time
+
+        # Update sensor debouncing
+        sensor_manager.update_debounce()
+
+        # Count runs based on debounced signal
+        sensor_manager.update_transitions()
+        sensed = sensor_manager.flags
+        debounced_running = (sensed & _S_RUNNING) != 0
+        trace = self.trace
+        if sensed & (_S_BECAME_RUNNING | _S_STOPPED_RUNNING):
+            if trace:
+                trace.record(self.channel, SENSE, debounced_running)
+            if sensed & _S_BECAME_RUNNING:
+                self.detected_runs += 1
+                self.last_run_sense_start = time.ticks_ms()
+                self.run_mark = self.last_run_sense_start
+                self.run_ms = 0
+                self.run_start_day = self.days_elapsed
+                self.run_start_minutes = get_current_minutes()
+                self.run_maintenance = self.maintenance_active
+                self.start_pulse_cooldown(RUN_HOLDOFF_MS)
+            else:
+                self.last_run_sense_end = time.ticks_ms()
+                self.run_ms += time.ticks_diff(self.last_run_sense_end, self.run_mark)
+                if self.on_run:
+                    self.on_run(self.run_start_day, self.run_start_minutes, self.run_ms, self.run_maintenance)
+
+        request = sensor_manager.is_request_run()
+        if request != ((self.flags & _F_PREVIOUS_REQUEST) != 0):
+            if request:
+                self.last_start_request = time.ticks_ms()
+                self.tag_cause(_P_REQUEST_START, sensor_manager.request_edge_ms())
+            elif self.cause_path == _P_REQUEST_START or self.cause_path == _P_RETRY_START:
+                self.cause_path = _P_NONE
+            if trace:
+                trace.record(self.channel, REQUEST, request)
+            self.flags ^= _F_PREVIOUS_REQUEST
+
+        # Update controller (handles state machine)
+        state = self.current_state
+        self.update()
+        if self.current_state is state:
+            self.flags |= _F_STATE_SETTLED
+        else:
+            self.flags &= ~_F_STATE_SETTLED
+
+        # Log state changes
+        current_request = sensor_manager.is_request_run()
+        flags = self.flags
+
+        if debounced_running != ((flags & _F_LOGGED_RUNNING) != 0):
+            self.flags ^= _F_LOGGED_RUNNING
+            self.log_state_change('Generator Running', 'Yes' if debounced_running else 'No')
+
+        if current_request != ((flags & _F_LOGGED_REQUEST) != 0):
+            self.flags ^= _F_LOGGED_REQUEST
+            self.log_state_change('Run Request', 'Active' if current_request else 'Inactive')
+
+        # Log days until maintenance changes
+        if self.days_until_maintenance != self.logged_days:
+            self.log_state_change('Maintenance Countdown', f'{self.days_until_maintenance} days remaining')
+            self.logged_days = self.days_until_maintenance
+
+    def next_wakeup_ms(self):
+        """Milliseconds until tick() next has anything to do, assuming inputs stay put"""
+        current_time = time.ticks_ms()
+        flags = self.flags
+        # A state entered during this tick gets a look at the next one
+        if not flags & _F_STATE_SETTLED:
+            wait = TICK_MS
+        else:
+            wait = time.ticks_diff(time.ticks_add(self.maintenance_check_time, MS_PER_DAY), current_time)
+        if flags & _F_PULSE_COOLDOWN:
+            wait = min(wait, time.ticks_diff(self.pulse_cooldown_end, current_time))
+        settle = self.sensor_manager.next_settle_ms()
+        if settle is not None:
+            wait = min(wait, settle)
+        deadline = self.current_state.deadline()
+        if deadline is not None:
+            wait = min(wait, time.ticks_diff(deadline, current_time))
+        return max(0, wait)
+
+class ChannelScheduler:
+    """Steps every channel's controller from one control loop
+
+    tick() runs one pass per channel in order and keeps each pass's time in
+    `pass_us`, so the cost per channel can be watched as channels are added.
+    """
+    def __init__(self, controllers):
+        self.controllers = controllers
+        self.pass_us = array.array('I', [0] * len(controllers))
+
+    def tick(self):
+        pass_us = self.pass_us
+        i = 0
+        for controller in self.controllers:
+            start = time.ticks_us()
+            controller.tick()
+            pass_us[i] = time.ticks_diff(time.ticks_us(), start)
+            i += 1
+
+    def next_wakeup_ms(self):
+        """Milliseconds until any channel next has something to do"""
+        wait = MS_PER_DAY
+        for controller in self.controllers:
+            channel_wait = controller.next_wakeup_ms()
+            if channel_wait < wait:
+                wait = channel_wait
+        return wait
+
+    def next_settle_ms(self):
+        """Soonest pending input change on any channel, or None"""
+        wait = None
+        for controller in self.controllers:
+            settle = controller.sensor_manager.next_settle_ms()
+            if settle is not None and (wait is None or settle < wait):
+                wait = settle
+        return wait
+
+    def input_changed(self):
+        """Cheap check between ticks: has a polled input moved on any channel?"""
+        for controller in self.controllers:
+            sensor_manager = controller.sensor_manager
+            if (sensor_manager.next_settle_ms() is not None
+                    or sensor_manager.is_request_run() != ((controller.flags & _F_PREVIOUS_REQUEST) != 0)):
+                return True
+        return False
+
+    def relay_held(self):
+        for controller in self.controllers:
+            if controller.relay_held():
+                return True
+        return False
+
+def stagger_maintenance(controllers, spacing_minutes):
+    """Start each channel's maintenance runs spacing_minutes after the previous channel's"""
+    for i, controller in enumerate(controllers):
+        controller.maintenance_offset_minutes = i * spacing_minutes
+
+class State:
+    def __init__(self, controller):
+        self.controller = controller
+
+    def on_enter(self):
+        pass
+
+    def update(self):
+        pass
+
+    def on_exit(self):
+        pass
+
+    def deadline(self):
+        """Ticks value at which update() next acts on its own, or None if it only reacts to inputs"""
+        return None
+
+class IdleState(State):
+    def on_enter(self):
+        self.controller.trace_keyframe()
+
+    def update(self):
+        controller = self.controller
+        # Check for maintenance start
+        if controller.is_maintenance_starting():
+            controller.maintenance_end = time.ticks_add(time.ticks_ms(), controller.maintenance_duration)
+            controller.days_until_maintenance = controller.maintenance_interval_days
+            controller.maintenance_active = True
+            controller.cause_path = _P_NONE
+            controller.log_state_change('Maintenance', f'Started ({controller.maintenance_duration_minutes} min)')
+            controller.transition_to(GeneratorState.STARTING)
+            return
+        sensor_manager = controller.sensor_manager
+        if sensor_manager.flags & _S_RUNNING:
+            # If already running (e.g., startup), go to running
+            controller.transition_to(GeneratorState.RUNNING)
+        # Check for run request, only if cooldown expired
+        elif not controller.flags & _F_PULSE_COOLDOWN and sensor_manager.is_request_run():
+            controller.transition_to(GeneratorState.STARTING)
+
+    def deadline(self):
+        if self.controller.days_until_maintenance > 0:
+            return None
+        configured_minutes = self.controller.maintenance_minute()
+        if get_current_minutes() >= configured_minutes:
+            return time.ticks_ms()
+        return time.ticks_add(time.ticks_ms(), ms_until_minute_of_day(configured_minutes))
+
+class StartingState(State):
+    def on_enter(self):
+        self.controller.start_attempts += 1
+        self.controller.set_start_relay(True)
+        self.controller.start_relay_end_time = time.ticks_add(time.ticks_ms(), 1000)
+        self.controller.start_pulse_cooldown(START_RETRY_MS)
+        self.controller.log_state_change('Start Relay', 'Activated (starting generator)')
+
+    def update(self):
+        controller = self.controller
+        if controller.sensor_manager.flags & _S_RUNNING:
+            controller.transition_to(GeneratorState.RUNNING)
+        elif time.ticks_diff(controller.start_relay_end_time, time.ticks_ms()) <= 0:
+            # Pulse complete, deactivate
+            controller.tag_cause(_P_START_RELEASE, controller.start_relay_end_time)
+            controller.set_start_relay(False)
+            controller.log_state_change('Start Relay', 'Deactivated (pulse complete)')
+            # Now wait for the generator to start or cooldown to expire
+            controller.transition_to(GeneratorState.CONFIRM_STARTED)
+
+    def deadline(self):
+        return self.controller.start_relay_end_time
+
+class ConfirmStartedState(State):
+    def update(self):
+        controller = self.controller
+        # If generator started, go to running
+        if controller.sensor_manager.flags & _S_RUNNING:
+            controller.transition_to(GeneratorState.RUNNING)
+        # Wait for cooldown to expire before allowing another attempt
+        elif not controller.flags & _F_PULSE_COOLDOWN:
+            controller.failed_starts += 1
+            if controller.on_failed_start:
+                controller.on_failed_start()
+            controller.transition_to(GeneratorState.IDLE)
+
+class RunningState(State):
+    def on_enter(self):
+        # Reset maintenance if from request
+        if not self.controller.maintenance_reset:
+            self.controller.days_until_maintenance = self.controller.maintenance_interval_days
+            self.controller.maintenance_check_time = time.ticks_ms()
+            self.controller.maintenance_reset = True
+            self.controller.log_state_change('Maintenance Reset', f'Countdown reset to {self.controller.days_until_maintenance} days (generator running from request)')
+
+    def update(self):
+        controller = self.controller
+        if controller.flags & _F_MAINTENANCE:
+            # End maintenance when time is up
+            if time.ticks_diff(controller.maintenance_end, time.ticks_ms()) <= 0:
+                controller.maintenance_active = False
+                controller.log_state_change('Maintenance', 'Finished')
+                controller.tag_cause(_P_MAINTENANCE_KILL, controller.maintenance_end)
+                controller.transition_to(GeneratorState.STOPPING)
+        else:
+            if not controller.sensor_manager.is_request_run():
+                controller.transition_to(GeneratorState.COOL_DOWN)
+
+    def deadline(self):
+        if self.controller.maintenance_active:
+            return self.controller.maintenance_end
+        return None
+
+class CoolDownState(State):
+    def on_enter(self):
+        self.controller.cool_down_active = True
+        self.controller.cool_down_end = time.ticks_add(time.ticks_ms(), self.controller.cool_down_duration)
+        self.controller.log_state_change('Cool Down', f'Started ({self.controller.cool_down_duration_minutes} min)')
+
+    def update(self):
+        controller = self.controller
+        if time.ticks_diff(controller.cool_down_end, time.ticks_ms()) <= 0:
+            controller.cool_down_active = False
+            controller.days_until_maintenance = controller.maintenance_interval_days
+            controller.log_state_change('Cool Down', 'Finished')
+            controller.tag_cause(_P_COOL_DOWN_KILL, controller.cool_down_end)
+            controller.transition_to(GeneratorState.STOPPING)
+
+    def on_exit(self):
+        # Reset maintenance at the end of cool-down
+        self.controller.days_until_maintenance = self.controller.maintenance_interval_days
+        self.controller.log_state_change('Maintenance', 'Reset after cool-down')
+
+    def deadline(self):
+        return self.controller.cool_down_end
+
+class StoppingState(State):
+    def on_enter(self):
+        self.controller.set_kill_relay(True)
+        self.controller.stopping_waiting_for_stop = True
+        self.controller.last_kill_action = time.ticks_ms()  # Update last_kill_action
+        self.controller.log_state_change('Kill Relay', 'Activated')
+
+    def update(self):
+        controller = self.controller
+        if controller.flags & _F_WAITING_FOR_STOP:
+            if not controller.sensor_manager.flags & _S_RUNNING:
+                # Generator has stopped, start 2s timer
+                controller.kill_relay_delay_timer = time.ticks_ms()
+                controller.stopping_waiting_for_stop = False
+        else:
+            # Already stopped, count 2 seconds
+            if time.ticks_diff(time.ticks_ms(), controller.kill_relay_delay_timer) >= KILL_RELAY_DELAY_MS:
+                controller.tag_cause(_P_KILL_RELEASE, time.ticks_add(controller.kill_relay_delay_timer, KILL_RELAY_DELAY_MS))
+                controller.set_kill_relay(False)
+                controller.last_kill_action = time.ticks_ms()  # Update last_kill_action
+                controller.log_state_change('Kill Relay', 'Deactivated (delay complete)')
+                controller.transition_to(GeneratorState.IDLE)
+
+    def deadline(self):
+        if self.controller.stopping_waiting_for_stop:
+            return None
+        return time.ticks_add(self.controller.kill_relay_delay_timer, KILL_RELAY_DELAY_MS)
+
+
+class SensorManager:
+    # Debounced levels and transitions are bits of self.flags (the _S_*
+    # constants). The IRQ-side fields of IrqSensorManager stay separate
+    # attributes: a soft IRQ can run between the read and the write of a
+    # read-modify-write, and would lose its bit.
+    debounced_running = _flag_property(_S_RUNNING)
+    previous_debounced_running = _flag_property(_S_PREVIOUS_RUNNING)
+    became_running = _flag_property(_S_BECAME_RUNNING)
+    stopped_running = _flag_property(_S_STOPPED_RUNNING)
+    traced_sense = _flag_property(_S_TRACED_SENSE)
+    traced_request = _flag_property(_S_TRACED_REQUEST)
+
+    def __init__(self, in_run_sense_pin, in_run_request_pin, debounce_ms=2000):
+        self.in_run_sense = in_run_sense_pin
+        self.in_run_request = in_run_request_pin
+        self.test_override_running = None
+        self.test_override_request = None
+        self.debounce_ms = debounce_ms
+        # ticks_ms() of the first sample that differed from the debounced level, None while they agree
+        self.change_time = None
+        self.flags = 0
+        # Set by firmware.py to the ControlLoop or ControlThread, whose set() wakes the loop
+        self.wake = None
+        # Set by GeneratorController.attach_trace()
+        self.trace = None
+        self.channel = 0
+
+    def set_override_running(self, override):
+        self.test_override_running = override
+
+    def set_override_request(self, override):
+        self.test_override_request = override
+
+    def _is_running_raw(self):
+        if self.test_override_running is not None:
+            return self.test_override_running
+        return not self.in_run_sense.value()
+
+    def is_request_run(self):
+        return self.is_request_raw()
+
+    def request_edge_ms(self):
+        """When the run request last changed. Polled pins are only seen to change when sampled, so: now."""
+        return time.ticks_ms()
+
+    def is_request_raw(self):
+        """Run-request level before any debouncing (override included)"""
+        if self.test_override_request is not None:
+            return self.test_override_request
+        return not self.in_run_request.value()
+
+    def update_debounce(self):
+        sensor_running = self._is_running_raw()
+        trace = self.trace
+        if trace:
+            # Polled inputs: an edge is seen when a sample differs from the last one
+            if sensor_running != ((self.flags & _S_TRACED_SENSE) != 0):
+                self.flags ^= _S_TRACED_SENSE
+                trace.record(self.channel, RAW_SENSE, sensor_running)
+            request = self.is_request_raw()
+            if request != ((self.flags & _S_TRACED_REQUEST) != 0):
+                self.flags ^= _S_TRACED_REQUEST
+                trace.record(self.channel, RAW_REQUEST, request)
+        if sensor_running != ((self.flags & _S_RUNNING) != 0):
+            # Timed from the first differing sample, not counted in passes: the loop
+            # also runs for other channels' deadlines and wake_control()
+            now = time.ticks_ms()
+            if self.change_time is None:
+                self.change_time = now
+            elif time.ticks_diff(now, self.change_time) >= self.debounce_ms:  # 2 seconds by default
+                self.flags ^= _S_RUNNING
+                self.change_time = None
+        elif self.change_time is not None:
+            self.change_time = None
+
+    def next_settle_ms(self):
+        """Milliseconds until a pending input change could be accepted, or None if nothing is pending"""
+        if self._is_running_raw() != ((self.flags & _S_RUNNING) != 0):
+            # Keep sampling every tick until then, so a level that flips back is seen
+            if self.change_time is None:
+                return 0
+            return min(TICK_MS, max(0, self.debounce_ms - time.ticks_diff(time.ticks_ms(), self.change_time)))
+        return None
+
+    def is_running_debounced(self):
+        return (self.flags & _S_RUNNING) != 0
+
+    def update_transitions(self):
+        """Updates internal transition flags. Should be called once per loop."""
+        flags = self.flags
+        if flags & _S_RUNNING:
+            if flags & _S_PREVIOUS_RUNNING:
+                flags &= ~_S_BECAME_RUNNING
+            else:
+                flags |= _S_PREVIOUS_RUNNING | _S_BECAME_RUNNING
+            flags &= ~_S_STOPPED_RUNNING
+        elif flags & _S_PREVIOUS_RUNNING:
+            flags = (flags & ~(_S_PREVIOUS_RUNNING | _S_BECAME_RUNNING)) | _S_STOPPED_RUNNING
+        else:
+            flags &= ~(_S_BECAME_RUNNING | _S_STOPPED_RUNNING)
+        self.flags = flags
+
+class IrqSensorManager(SensorManager):
+    """Edge-driven inputs: pin IRQs stamp each edge and debouncing runs on elapsed time
+
+    Nothing is read from the pins until an edge is pending. An input is
+    accepted once it has been quiet for its debounce window.
+    """
+    debounced_request = _flag_property(_S_REQUEST)
+
+    def __init__(self, in_run_sense_pin, in_run_request_pin, debounce_ms=2000, request_debounce_ms=50):
+        super().__init__(in_run_sense_pin, in_run_request_pin, debounce_ms)
+        self.request_debounce_ms = request_debounce_ms
+        self.debounced_request = not in_run_request_pin.value()
+        now = time.ticks_ms()
+        self.sense_edge_time = now
+        self.request_edge_time = now
+        # Pick up whatever level the run-sense input has at boot
+        self.sense_pending = True
+        self.request_pending = False
+        trigger = in_run_sense_pin.IRQ_RISING | in_run_sense_pin.IRQ_FALLING
+        in_run_sense_pin.irq(handler=self._on_sense_edge, trigger=trigger)
+        in_run_request_pin.irq(handler=self._on_request_edge, trigger=trigger)
+
+    def _on_sense_edge(self, pin):
+        self.sense_edge_time = time.ticks_ms()
+        self.sense_pending = True
+        if self.trace:
+            self.trace.irq_edge(self.channel, RAW_SENSE, self._is_running_raw())
+        if self.wake:
+            self.wake.set()
+
+    def _on_request_edge(self, pin):
+        self.request_edge_time = time.ticks_ms()
+        self.request_pending = True
+        if self.trace:
+            self.trace.irq_edge(self.channel, RAW_REQUEST, self.is_request_raw())
+        if self.wake:
+            self.wake.set()
+
+    def set_override_running(self, override):
+        self.test_override_running = override
+        self._on_sense_edge(None)
+
+    def set_override_request(self, override):
+        self.test_override_request = override
+        self._on_request_edge(None)
+
+    def is_request_run(self):
+        if self.test_override_request is not None:
+            return self.test_override_request
+        return (self.flags & _S_REQUEST) != 0
+
+    def request_edge_ms(self):
+        """When the run request last changed, as stamped by its IRQ (debounce window included from there)"""
+        return self.request_edge_time
+
+    def update_debounce(self):
+        now = time.ticks_ms()
+        if self.sense_pending and time.ticks_diff(now, self.sense_edge_time) >= self.debounce_ms:
+            self.sense_pending = False
+            self.debounced_running = self._is_running_raw()
+        if self.request_pending and time.ticks_diff(now, self.request_edge_time) >= self.request_debounce_ms:
+            self.request_pending = False
+            self.debounced_request = not self.in_run_request.value()
+
+    def next_settle_ms(self):
+        now = time.ticks_ms()
+        wait = None
+        if self.sense_pending:
+            wait = max(0, self.debounce_ms - time.ticks_diff(now, self.sense_edge_time))
+        if self.request_pending:
+            request_wait = max(0, self.request_debounce_ms - time.ticks_diff(now, self.request_edge_time))
+            if wait is None or request_wait < wait:
+                wait = request_wait
+        return wait
@@ -0,0 +1,207 @@
+import os
+import struct
+
+from storage import atomic_write
+
+HISTORY_DIR = 'history'
+MAX_RUNS = 512
+DAYS = 14
+WEEKS = 8
+
+# Run record: boot number, day, start minute of day, duration in seconds, kind
+RUN = '<HHHIB'
+RUN_SIZE = struct.calcsize(RUN)
+RUN_KINDS = ('demand', 'maintenance', 'failed_start')
+DEMAND = 0
+MAINTENANCE = 1
+FAILED_START = 2
+
+# Rollups file: boot number, current day, lifetime totals, then the day and week slots
+ROLLUP_HEADER = '<HH'
+LIFETIME = '<IIIII'
+SLOT = '<HHHHII'
+ROLLUP_HEADER_SIZE = struct.calcsize(ROLLUP_HEADER)
+LIFETIME_SIZE = struct.calcsize(LIFETIME)
+SLOT_SIZE = struct.calcsize(SLOT)
+EMPTY = 0xFFFF
+
+# Totals fields, shared by the lifetime totals and each slot (slots keep their period first)
+RUNS = 0
+MAINTENANCE_RUNS = 1
+FAILED_STARTS = 2
+DEMAND_S = 3
+MAINTENANCE_S = 4
+TOTAL_NAMES = ('runs', 'maintenance_runs', 'failed_starts', 'demand_s', 'maintenance_s')
+
+CSV_HEADER = 'boot,day,start_minute,duration_s,kind\n'
+
+def _read_runs(data):
+    """Yield run tuples from a buffer of packed records"""
+    for offset in range(0, len(data) - RUN_SIZE + 1, RUN_SIZE):
+        yield struct.unpack_from(RUN, data, offset)
+
+def _csv_line(run):
+    boot, day, minute, seconds, kind = run
+    return '%d,%d,%d,%d,%s\n' % (boot, day, minute, seconds, RUN_KINDS[kind] if kind < len(RUN_KINDS) else '')
+
+class RunHistory:
+    """Completed runs as fixed-size records plus daily/weekly rollups in flash
+
+    Each run updates the rollups as it is recorded, so reading them never
+    scans the records. Days are 24-hour periods of uptime (the clock has no
+    date), and each boot starts a new day after the last one stored.
+    """
+    def __init__(self, directory=HISTORY_DIR, max_runs=MAX_RUNS):
+        self.directory = directory
+        self.max_runs = max_runs
+        self.pending = bytearray()
+        self.dirty = False
+        self.boot = 1
+        self.day = 0
+        self.lifetime = [0] * len(TOTAL_NAMES)
+        self.days = [[EMPTY] + [0] * len(TOTAL_NAMES) for _ in range(DAYS)]
+        self.weeks = [[EMPTY] + [0] * len(TOTAL_NAMES) for _ in range(WEEKS)]
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+        if self._load():
+            self.day += 1
+            self.boot += 1
+        self.base_day = self.day
+        self.dirty = True
+        try:
+            self.stored_runs = os.stat(self._path('runs.bin'))[6] // RUN_SIZE
+        except OSError:
+            self.stored_runs = 0
+
+    def _path(self, name):
+        return self.directory + '/' + name
+
+    def _load(self):
+        try:
+            with open(self._path('rollups.bin'), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) != ROLLUP_HEADER_SIZE + LIFETIME_SIZE + (DAYS + WEEKS) * SLOT_SIZE:
+            return False
+        self.boot, self.day = struct.unpack_from(ROLLUP_HEADER, data, 0)
+        offset = ROLLUP_HEADER_SIZE
+        self.lifetime = list(struct.unpack_from(LIFETIME, data, offset))
+        offset += LIFETIME_SIZE
+        for slots in (self.days, self.weeks):
+            for i in range(len(slots)):
+                slots[i] = list(struct.unpack_from(SLOT, data, offset))
+                offset += SLOT_SIZE
+        return True
+
+    def set_day(self, days_elapsed):
+        """Advance to the day the controller is on"""
+        day = self.base_day + days_elapsed
+        if day != self.day:
+            self.day = day
+            self.dirty = True
+
+    def _slot(self, slots, period):
+        slot = slots[period % len(slots)]
+        if slot[0] != period:
+            slot[0] = period
+            for i in range(1, len(slot)):
+                slot[i] = 0
+        return slot
+
+    def _add(self, day, field, amount):
+        self.lifetime[field] += amount
+        self._slot(self.days, day)[field + 1] += amount
+        self._slot(self.weeks, day // 7)[field + 1] += amount
+
+    def _append(self, day, minute, seconds, kind):
+        self.pending += struct.pack(RUN, self.boot & 0xFFFF, day & 0xFFFF, minute, seconds, kind)
+        self.dirty = True
+
+    def record_run(self, days_elapsed, start_minute, duration_ms, maintenance):
+        """Record a completed run and fold it into the rollups"""
+        day = self.base_day + days_elapsed
+        seconds = duration_ms // 1000
+        if maintenance:
+            self._add(day, MAINTENANCE_RUNS, 1)
+            self._add(day, MAINTENANCE_S, seconds)
+        else:
+            self._add(day, DEMAND_S, seconds)
+        self._add(day, RUNS, 1)
+        self._append(day, start_minute, seconds, MAINTENANCE if maintenance else DEMAND)
+
+    def record_failed_start(self, days_elapsed, minute):
+        """Record a start attempt that never produced run-sense"""
+        day = self.base_day + days_elapsed
+        self._add(day, FAILED_STARTS, 1)
+        self._append(day, minute, 0, FAILED_START)
+
+    def flush(self):
+        """Append queued run records and rewrite the rollups"""
+        if not self.dirty:
+            return
+        if self.pending:
+            if self.stored_runs + len(self.pending) // RUN_SIZE > self.max_runs:
+                # Keep one older file so the CSV always covers at least max_runs records
+                os.rename(self._path('runs.bin'), self._path('runs.old.bin'))
+                self.stored_runs = 0
+            with open(self._path('runs.bin'), 'ab') as f:
+                f.write(self.pending)
+            self.stored_runs += len(self.pending) // RUN_SIZE
+            self.pending = bytearray()
+        data = bytearray(struct.pack(ROLLUP_HEADER, self.boot & 0xFFFF, self.day & 0xFFFF))
+        data += struct.pack(LIFETIME, *self.lifetime)
+        for slots in (self.days, self.weeks):
+            for slot in slots:
+                data += struct.pack(SLOT, *slot)
+        atomic_write(self._path('rollups.bin'), data)
+        self.dirty = False
+
+    def _recent(self, slots, current):
+        """Slots still inside the window, newest first"""
+        result = []
+        for period in range(current, current - len(slots), -1):
+            if period < 0:
+                break
+            slot = slots[period % len(slots)]
+            if slot[0] == period:
+                result.append(slot)
+        return result
+
+    def _totals_dict(self, values, key=None, period=None):
+        totals = {}
+        if key:
+            totals[key] = period
+        for i, name in enumerate(TOTAL_NAMES):
+            totals[name] = values[i]
+        return totals
+
+    def rollups(self):
+        """Lifetime, per-day and per-week totals as a dict"""
+        return {
+            'boot': self.boot,
+            'day': self.day,
+            'lifetime': self._totals_dict(self.lifetime),
+            'days': [self._totals_dict(slot[1:], 'day', slot[0]) for slot in self._recent(self.days, self.day)],
+            'weeks': [self._totals_dict(slot[1:], 'week', slot[0]) for slot in self._recent(self.weeks, self.day // 7)],
+        }
+
+    def csv_rows(self):
+        """Yield every stored run record as CSV, oldest first"""
+        yield CSV_HEADER
+        for name in ('runs.old.bin', 'runs.bin'):
+            try:
+                f = open(self._path(name), 'rb')
+            except OSError:
+                continue
+            with f:
+                while True:
+                    data = f.read(RUN_SIZE * 32)
+                    if not data:
+                        break
+                    for run in _read_runs(data):
+                        yield _csv_line(run)
+        for run in _read_runs(bytes(self.pending)):
+            yield _csv_line(run)
@@ -0,0 +1,6 @@
+"""Host-side (CPython) tools for the generator controller firmware.
+
+The firmware modules import `machine`, `network` and MicroPython's
+`time.ticks_*` helpers. This package provides stand-ins for those so the
+control logic can run on a desktop machine.
+"""
@@ -0,0 +1,120 @@
+"""Check that a steady-state control pass allocates nothing.
+
+    micropython host/alloc_check.py [passes]
+
+Runs under the MicroPython unix port, since only its heap accounting says
+anything about the device. Each scenario builds a ChannelScheduler over one
+or more controllers on stand-in pins and runs it with the firmware's own
+control.ControlLoop, polled or with IRQ inputs as the scenario says: the
+pass, the metrics hooks and the asyncio sleep until the next deadline, with
+the deadlines capped at a millisecond so the passes come quickly and every
+third sleep cut short by set(). Once the controllers have settled it
+disables the GC and compares gc.mem_alloc() before and after `passes`
+passes. Exits 1 if any scenario allocated.
+"""
+import asyncio
+import gc
+import sys
+
+if sys.implementation.name != 'micropython':
+    print('alloc_check needs the MicroPython unix port: micropython host/alloc_check.py')
+    sys.exit(2)
+
+HOST_DIR = sys.argv[0].rsplit('/', 1)[0] if '/' in sys.argv[0] else '.'
+sys.path.insert(0, HOST_DIR + '/..')
+sys.path.insert(0, HOST_DIR)
+
+import machine
+import generator
+from control import ControlLoop
+from metrics import Histogram, UPDATE_BUCKETS_US, LATENESS_BUCKETS_MS
+
+SETTLE_PASSES = 20
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 15,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+
+
+def make_controller(irq, running, request):
+    # Inputs are active low
+    run_sense = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if running else 1)
+    run_request = machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if request else 1)
+    if irq:
+        sensors = generator.IrqSensorManager(run_sense, run_request, 0, 0)
+    else:
+        sensors = generator.SensorManager(run_sense, run_request, 0)
+    return generator.GeneratorController(sensors, CONFIG, machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+
+
+def make_scheduler(irq, running):
+    """One channel per entry of running, each requested and running or neither"""
+    return generator.ChannelScheduler([make_controller(irq, r, r) for r in running])
+
+
+class Measured(Exception):
+    pass
+
+
+def measure(scheduler, irq, passes):
+    """Bytes allocated over `passes` passes of the control loop, after SETTLE_PASSES to settle"""
+    loop = ControlLoop(scheduler, polled=not irq)
+    loop.max_wait_ms = 1
+    pass_time = Histogram(UPDATE_BUCKETS_US)
+    lateness = Histogram(LATENESS_BUCKETS_MS)
+    marks = [0, 0]
+
+    def after_pass(pass_us):
+        # What firmware.observe_pass() and update_gc() do, less the GC itself
+        pass_time.observe(pass_us)
+        gc.mem_free()
+        gc.mem_alloc()
+        if loop.passes == SETTLE_PASSES:
+            gc.collect()
+            gc.disable()
+            marks[0] = gc.mem_alloc()
+        elif loop.passes == SETTLE_PASSES + passes:
+            marks[1] = gc.mem_alloc()
+            raise Measured()
+
+    def before_sleep(wait_ms):
+        if loop.passes % 3 == 0:
+            loop.set()
+
+    def after_wakeup(late):
+        if late >= 0:
+            lateness.observe(late)
+
+    loop.after_pass = after_pass
+    loop.before_sleep = before_sleep
+    loop.after_wakeup = after_wakeup
+    try:
+        asyncio.run(loop.run())
+    except Measured:
+        pass
+    finally:
+        gc.enable()
+    return marks[1] - marks[0]
+
+
+def main():
+    passes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    failed = False
+    for name, irq, running in (
+            ('polled idle', False, (False,)),
+            ('polled running on request', False, (True,)),
+            ('irq idle', True, (False,)),
+            ('irq running on request', True, (True,)),
+            ('polled, 3 channels', False, (True, False, True)),
+            ('irq, 3 channels', True, (True, False, True))):
+        allocated = measure(make_scheduler(irq, running), irq, passes)
+        print('{:28} {:6} bytes over {} passes'.format(name, allocated, passes))
+        failed = failed or allocated > 0
+    sys.exit(1 if failed else 0)
+
+
+main()
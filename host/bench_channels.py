@@ -0,0 +1,83 @@
+"""Time a control pass as the number of generator channels grows.
+
+    python -m host.bench_channels [--channels 1,2,4,8] [--passes 2000]
+
+Builds a `ChannelScheduler` over N controllers on stand-in pins (half of
+them running on request, half idle, with maintenance staggered the way the
+firmware does it) and times `tick()` plus `next_wakeup_ms()` on the host's
+clock. Absolute numbers say nothing about the ESP32; the per-channel column
+should stay flat as N grows. On the device the same costs are exported as
+`gen_channel_update_us` on `/metrics`.
+"""
+import argparse
+import os
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+for path in (REPO_DIR, HOST_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from host.vclock import VirtualClock
+
+clock = VirtualClock()
+clock.install(time)
+
+import machine
+import generator
+
+generator.log_echo = False
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 15,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+STAGGER_MINUTES = 15
+
+
+def make_scheduler(channels):
+    controllers = []
+    for i in range(channels):
+        # Inputs are active low; even channels run on request
+        active = 0 if i % 2 == 0 else 1
+        sensors = generator.SensorManager(machine.Pin(100 + 4 * i, machine.Pin.IN, machine.Pin.PULL_UP, value=active),
+                                          machine.Pin(101 + 4 * i, machine.Pin.IN, machine.Pin.PULL_UP, value=active))
+        config = dict(CONFIG, name='gen' + str(i + 1))
+        controllers.append(generator.GeneratorController(sensors, config, machine.Pin(102 + 4 * i, machine.Pin.OUT),
+                                                         machine.Pin(103 + 4 * i, machine.Pin.OUT)))
+    generator.stagger_maintenance(controllers, STAGGER_MINUTES)
+    return generator.ChannelScheduler(controllers)
+
+
+def measure(scheduler, passes):
+    for _ in range(20):
+        clock.advance(generator.TICK_MS)
+        scheduler.tick()
+    start = time.perf_counter()
+    for _ in range(passes):
+        clock.advance(generator.TICK_MS)
+        scheduler.tick()
+        scheduler.next_wakeup_ms()
+    return (time.perf_counter() - start) * 1e6 / passes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--channels', default='1,2,4,8', help='comma-separated channel counts')
+    parser.add_argument('--passes', type=int, default=2000)
+    args = parser.parse_args()
+    print('{:>8} {:>12} {:>14}  {}'.format('channels', 'us/pass', 'us/channel', 'maintenance start'))
+    for channels in [int(n) for n in args.channels.split(',')]:
+        scheduler = make_scheduler(channels)
+        us = measure(scheduler, args.passes)
+        starts = ' '.join('{:02d}:{:02d}'.format(*divmod(c.maintenance_minute(), 60)) for c in scheduler.controllers)
+        print('{:8} {:12.1f} {:14.1f}  {}'.format(channels, us, us / channels, starts))
+
+
+if __name__ == '__main__':
+    main()
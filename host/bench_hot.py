@@ -0,0 +1,179 @@
+"""Time the control loop's hot functions per call.
+
+    micropython host/bench_hot.py [--calls N] [--path DIR] [--json]
+    python -m host.bench_hot
+
+Meant for the MicroPython unix port, whose interpreter, object layout and
+emitters are the device's; CPython only checks that the script runs.
+Each function the control loop calls per pass (and the serializers
+behind `/status` and `/log`) is timed in a steady state on stand-in pins,
+along with a whole control pass and an empty call for scale.
+
+Before timing, a scripted run on a virtual clock (request, start pulse,
+run, cool-down, kill) must switch the relays at the expected times, so a
+miscompiled native or viper build fails here instead of reporting fast
+numbers. `--path DIR` puts DIR first on sys.path, for loading a build of
+generator.mpy from there; `python -m host.bench_mpy` does that for each
+emitter and keeps the results.
+"""
+import gc
+import json
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+
+
+def option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if MICROPYTHON:
+    HOST_DIR = sys.argv[0].rsplit('/', 1)[0] if '/' in sys.argv[0] else '.'
+    sys.path.insert(0, HOST_DIR + '/..')
+    sys.path.insert(0, HOST_DIR)
+
+    def now_us():
+        return time.ticks_us()
+
+    def elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+else:
+    import os
+
+    HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+    REPO_DIR = os.path.dirname(HOST_DIR)
+    for path in (REPO_DIR, HOST_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from host.vclock import VirtualClock
+    VirtualClock().install(time)
+
+    def now_us():
+        return time.perf_counter_ns() // 1000
+
+    def elapsed_us(start):
+        return now_us() - start
+
+if option('--path'):
+    sys.path.insert(0, option('--path'))
+
+import machine
+import generator
+from vclock import VirtualClock
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 1,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+CALLS = int(option('--calls', 2000))
+# (ms, pin, level) driven in the check run; inputs are active low
+SCRIPT = ((1000, 13, 0), (3000, 27, 0), (10000, 13, 1), (80000, 27, 1))
+CHECK_MS = 90000
+EXPECTED_RELAYS = [(1000, 32, 1), (2000, 32, 0), (70000, 33, 1), (82200, 33, 0)]
+
+
+def make_controller(running=False, irq=False):
+    run_sense = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if running else 1)
+    run_request = machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if running else 1)
+    if irq:
+        sensors = generator.IrqSensorManager(run_sense, run_request, generator.TICK_MS, 0)
+    else:
+        sensors = generator.SensorManager(run_sense, run_request, generator.TICK_MS)
+    controller = generator.GeneratorController(sensors, CONFIG, machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+    for _ in range(5):
+        controller.tick()
+    return controller
+
+
+def check():
+    """Run the SCRIPT on a virtual clock; returns (relay actions, counters)"""
+    clock = VirtualClock()
+    generator.time = clock
+    try:
+        generator.set_current_minutes(600)
+        controller = make_controller()
+        pins = {13: controller.sensor_manager.in_run_request, 27: controller.sensor_manager.in_run_sense}
+        relays = []
+        for pin in (controller.relay_start_gen, controller.relay_kill_gen):
+            pin.on_change(lambda pin, value: relays.append((clock.now, pin.id, value)))
+        script = list(SCRIPT)
+        while clock.now < CHECK_MS:
+            clock.advance(generator.TICK_MS)
+            while script and script[0][0] <= clock.now:
+                _, pin, level = script.pop(0)
+                pins[pin].drive(level)
+            controller.tick()
+    finally:
+        generator.time = time
+        generator.set_current_minutes(600)
+    return relays, (controller.start_attempts, controller.detected_runs, controller.failed_starts)
+
+
+def per_call_us(fn):
+    gc.collect()
+    start = now_us()
+    for _ in range(CALLS):
+        fn()
+    return elapsed_us(start) / CALLS
+
+
+def status_json(controller):
+    return ''.join(controller.get_status_generator())
+
+
+def main():
+    relays, counters = check()
+    if relays != EXPECTED_RELAYS or counters != (1, 1, 0):
+        print('check failed: relays {} counters {}'.format(relays, counters))
+        sys.exit(1)
+
+    idle = make_controller()
+    running = make_controller(running=True)
+    irq = make_controller(irq=True)
+    scheduler = generator.ChannelScheduler([idle])
+    state_log = running.state_log
+    for i in range(state_log.capacity):
+        running.log_state_change('Run Request', 'Active' if i % 2 else 'Inactive')
+    seq = state_log.last_seq
+
+    def control_pass():
+        scheduler.tick()
+        scheduler.next_wakeup_ms()
+
+    def empty_call():
+        pass
+
+    results = {}
+    names = []
+    for name, fn in (
+            ('empty_call', empty_call),
+            ('update_debounce', idle.sensor_manager.update_debounce),
+            ('update_debounce_irq', irq.sensor_manager.update_debounce),
+            ('update_idle', idle.update),
+            ('update_running', running.update),
+            ('tick_idle', idle.tick),
+            ('tick_running', running.tick),
+            ('control_pass', control_pass),
+            ('status_json', lambda: status_json(idle)),
+            ('log_entry_json', lambda: state_log.entry_json(seq)),
+            ('log_json_50', lambda: ','.join([state_log.entry_json(s) for s in state_log.seqs_since(0)]))):
+        results[name] = round(per_call_us(fn), 3)
+        names.append(name)
+
+    implementation = '{} {}'.format(sys.implementation.name, '.'.join([str(v) for v in sys.implementation.version[:3]]))
+    if '--json' in sys.argv:
+        print(json.dumps({'implementation': implementation, 'calls': CALLS, 'functions': names, 'results': results}))
+        return
+    print('{} ({} calls each)'.format(implementation, CALLS))
+    print('{:24} {:>10}'.format('function', 'us/call'))
+    for name in names:
+        print('{:24} {:10.2f}'.format(name, results[name]))
+
+
+main()
@@ -0,0 +1,132 @@
+"""Benchmark the hot functions on the MicroPython unix port for each emitter and keep the results.
+
+    python -m host.bench_mpy [--emit bytecode,native,viper] [--label NAME] [--baseline NAME]
+                             [--micropython PATH] [--mpy-cross PATH] [--march x64]
+
+For each emitter, builds generator.mpy the way `host/build_firmware.py
+--emit` does, for the unix port's architecture, and runs
+`host/bench_hot.py` against it. The results go to
+`host/bench_results/<label>.json` (the label defaults to `git describe
+--always --dirty`) and are compared with a baseline: the file named by
+--baseline, else the most recently saved other one. A function more than
+--threshold percent slower under any emitter than in the baseline is
+flagged, and the exit status is 1.
+
+The unix port is not the ESP32, but the ratios between firmware versions
+and between emitters carry over. `mpy-cross` must emit the .mpy version the
+`micropython` binary loads.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from host.build_firmware import EMITTERS, compile_module
+
+RESULTS_DIR = os.path.join(HOST_DIR, 'bench_results')
+# mpy-cross -march for the unix port on this machine
+MARCH = {'x86_64': 'x64', 'AMD64': 'x64', 'i386': 'x86', 'i686': 'x86'}
+
+
+def label():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unversioned'
+
+
+def run_emitter(emit, args):
+    """Build generator.mpy with `emit` and time it; returns (bench_hot output, {function: emitter})"""
+    with tempfile.TemporaryDirectory() as tmp:
+        emitters = compile_module('generator.py', os.path.join(tmp, 'generator.mpy'), mpy_cross=args.mpy_cross,
+                                  march=args.march, emit=emit)
+        cmd = [args.micropython, os.path.join(HOST_DIR, 'bench_hot.py'), '--json', '--calls', str(args.calls), '--path', tmp]
+        try:
+            result = subprocess.run(cmd, cwd=REPO_DIR, capture_output=True, text=True)
+        except FileNotFoundError:
+            sys.exit('{} not found: build the MicroPython unix port (ports/unix) or pass --micropython'.format(args.micropython))
+    if result.returncode != 0 or not result.stdout.strip():
+        sys.exit('{} build failed to run:\n{}{}'.format(emit, result.stdout, result.stderr))
+    return json.loads(result.stdout.strip().splitlines()[-1]), emitters
+
+
+def load_baseline(name, current):
+    if name:
+        path = os.path.join(RESULTS_DIR, name + '.json')
+    else:
+        saved = [os.path.join(RESULTS_DIR, f) for f in os.listdir(RESULTS_DIR) if f.endswith('.json')] if os.path.isdir(RESULTS_DIR) else []
+        saved = [p for p in saved if os.path.basename(p) != current + '.json']
+        if not saved:
+            return None
+        path = max(saved, key=os.path.getmtime)
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--micropython', default='micropython', help='MicroPython unix port executable')
+    parser.add_argument('--mpy-cross', default='mpy-cross', help='mpy-cross executable')
+    parser.add_argument('--march', default=MARCH.get(platform.machine()), help='native code architecture of the unix port')
+    parser.add_argument('--emit', default=','.join(EMITTERS), help='comma-separated emitters to compare')
+    parser.add_argument('--calls', type=int, default=2000, help='calls per function')
+    parser.add_argument('--label', default=label(), help='name to save these results under')
+    parser.add_argument('--baseline', help='saved label to compare with (default: the latest other one)')
+    parser.add_argument('--threshold', type=float, default=10, help='percent slowdown reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='compare only, do not write the results file')
+    args = parser.parse_args()
+    emits = args.emit.split(',')
+    if any(emit != 'bytecode' for emit in emits) and not args.march:
+        parser.error('no native architecture known for {}; pass --march'.format(platform.machine()))
+
+    report = {'label': args.label, 'march': args.march, 'calls': args.calls, 'results': {}, 'emitters': {}}
+    for emit in emits:
+        output, emitters = run_emitter(emit, args)
+        report['implementation'] = output['implementation']
+        report['functions'] = output['functions']
+        report['results'][emit] = output['results']
+        report['emitters'][emit] = emitters
+    baseline = load_baseline(args.baseline, args.label)
+
+    print('{} on {}, {} calls each, us/call{}'.format(
+        report['implementation'], args.march, args.calls, ' vs ' + baseline['label'] if baseline else ''))
+    print('{:22}'.format('function') + ''.join('{:>18}'.format(emit) for emit in emits))
+    regressions = []
+    for name in report['functions']:
+        row = '{:22}'.format(name)
+        for emit in emits:
+            us = report['results'][emit][name]
+            before = baseline['results'].get(emit, {}).get(name) if baseline else None
+            if before:
+                change = (us - before) * 100 / before
+                row += '{:>18}'.format('{:.2f} ({:+.0f}%)'.format(us, change))
+                if change > args.threshold and name != 'empty_call':
+                    regressions.append('{} {}: {:.2f} -> {:.2f} us'.format(emit, name, before, us))
+            else:
+                row += '{:>18.2f}'.format(us)
+        print(row)
+    for emit in emits:
+        fallback = sorted(f for f, e in report['emitters'][emit].items() if e != emit)
+        if fallback:
+            print('{}: built native instead: {}'.format(emit, ', '.join(fallback)))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, args.label + '.json'), 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Check that the control thread keeps its timing however busy the web side is.
+
+    micropython host/bench_thread.py [--clients N] [--seconds S] [--tolerance MS]
+    python -m host.bench_thread
+
+Runs the control loop on a `control.ControlThread`, as firmware.py does
+with "control_thread" set, against stand-in pins with the run request held
+on. START_RETRY_MS is shortened so the controller keeps pulsing the start
+relay, and every pulse is timed against the 1 s StartingState holds it for.
+
+For the first S seconds nothing else runs; for the next S seconds N client
+tasks share the main thread's asyncio loop the way routes do: each formats
+the published status snapshot and the full log, queues a command through
+`ControlThread.call()` every few rounds, and spends BUSY_MS computing
+without awaiting, as a slow handler or flash read would. The exit status is
+1 if, with the clients, the control loop wakes for a deadline or ends a
+pulse more than --tolerance ms later than it did without them.
+
+Meant for the MicroPython unix port (built with threads, as the standard
+variant is); CPython runs it too, with its GIL handing the control thread
+the interpreter every few ms.
+"""
+import asyncio
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+
+
+def option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if MICROPYTHON:
+    HOST_DIR = sys.argv[0].rsplit('/', 1)[0] if '/' in sys.argv[0] else '.'
+    sys.path.insert(0, HOST_DIR + '/..')
+    sys.path.insert(0, HOST_DIR)
+else:
+    import os
+
+    HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+    REPO_DIR = os.path.dirname(HOST_DIR)
+    for path in (REPO_DIR, HOST_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    # Real time in the MicroPython API: the threads race the wall clock here
+    TICKS_MAX = 2 ** 30
+    T0 = time.monotonic()
+    time.ticks_ms = lambda: int((time.monotonic() - T0) * 1000) % TICKS_MAX
+    time.ticks_us = lambda: int((time.monotonic() - T0) * 1000000) % TICKS_MAX
+    time.ticks_add = lambda ticks, delta: (ticks + delta) % TICKS_MAX
+
+    def ticks_diff(a, b):
+        diff = (a - b) % TICKS_MAX
+        return diff - TICKS_MAX if diff >= TICKS_MAX // 2 else diff
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+import machine
+import generator
+from control import ControlThread
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 1,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+CLIENTS = int(option('--clients', 20))
+PHASE_MS = int(float(option('--seconds', 6)) * 1000)
+TOLERANCE_MS = int(option('--tolerance', 20))
+RETRY_MS = 1500          # START_RETRY_MS for this run: a new start pulse every 1.5 s
+PULSE_MS = 1000          # How long StartingState holds the start relay
+BUSY_MS = 5              # Computation per client round without an await
+CALL_EVERY = 4           # Rounds between commands queued per client
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.lateness = []
+        self.pulses = []
+        self.rounds = 0
+        self.calls = 0
+
+
+def busy(ms):
+    start = time.ticks_ms()
+    n = 0
+    while time.ticks_diff(time.ticks_ms(), start) < ms:
+        n += 1
+    return n
+
+
+async def client(control, controller, phase, stop):
+    state_log = controller.state_log
+    while not stop:
+        ''.join(generator.status_json(control.snapshots[0]))
+        ','.join([state_log.entry_json(seq) for seq in state_log.seqs_since(0)])
+        busy(BUSY_MS)
+        phase.rounds += 1
+        if phase.rounds % CALL_EVERY == 0:
+            await control.call(controller.mark_status_changed)
+            phase.calls += 1
+        else:
+            await asyncio.sleep(0)
+
+
+async def run_phase(control, controller, phase, clients):
+    stop = []
+    tasks = [asyncio.create_task(client(control, controller, phase, stop)) for _ in range(clients)]
+    await asyncio.sleep(PHASE_MS / 1000)
+    stop.append(True)
+    for task in tasks:
+        await task
+
+
+def main():
+    generator.START_RETRY_MS = RETRY_MS
+    run_sense = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP)
+    run_request = machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP, value=0)
+    sensors = generator.SensorManager(run_sense, run_request, generator.TICK_MS)
+    controller = generator.GeneratorController(sensors, CONFIG, machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+    control = ControlThread(generator.ChannelScheduler([controller]))
+    sensors.wake = control
+
+    phases = [Phase('0 clients'), Phase(str(CLIENTS) + ' clients')]
+    current = [phases[0]]
+    pulse_start = [None]
+
+    def on_start_relay(pin, value):
+        now = time.ticks_ms()
+        if value:
+            pulse_start[0] = now
+        elif pulse_start[0] is not None:
+            current[0].pulses.append(time.ticks_diff(now, pulse_start[0]) - PULSE_MS)
+
+    def after_wakeup(late):
+        if late >= 0:
+            current[0].lateness.append(late)
+
+    controller.relay_start_gen.on_change(on_start_relay)
+    control.after_wakeup = after_wakeup
+    control.start()
+
+    asyncio.run(run_phase(control, controller, phases[0], 0))
+    current[0] = phases[1]
+    asyncio.run(run_phase(control, controller, phases[1], CLIENTS))
+    if control.error:
+        print('control thread failed: {!r}'.format(control.error))
+        sys.exit(1)
+
+    print('{} {}, {} ms per phase'.format(sys.implementation.name, '.'.join([str(v) for v in sys.implementation.version[:3]]), PHASE_MS))
+    print('{:12} {:>7} {:>8} {:>9} {:>9} {:>7} {:>14}'.format('phase', 'rounds', 'commands', 'wakeups', 'late max', 'pulses', 'pulse over max'))
+    for phase in phases:
+        print('{:12} {:7} {:8} {:9} {:9} {:7} {:14}'.format(
+            phase.name, phase.rounds, phase.calls, len(phase.lateness), max(phase.lateness or [0]),
+            len(phase.pulses), max(phase.pulses or [0])))
+    quiet, loaded = phases
+    if not loaded.pulses:
+        print('no start pulses timed under load')
+        sys.exit(1)
+    worse = max(max(loaded.lateness or [0]) - max(quiet.lateness or [0]), max(loaded.pulses) - max(quiet.pulses or [0]))
+    if worse > TOLERANCE_MS:
+        print('control loop {} ms later with {} clients (tolerance {} ms)'.format(worse, CLIENTS, TOLERANCE_MS))
+        sys.exit(1)
+    print('ok: within {} ms of the quiet phase'.format(TOLERANCE_MS))
+    # The control thread never returns
+    sys.exit(0)
+
+
+main()
@@ -0,0 +1,144 @@
+"""Count socket writes and bytes per streamed response.
+
+    python -m host.bench_writes [--buffer BYTES]
+
+Each body is produced by the same code the routes use (the controller's
+status generator, which `/status` caches, a full 50-entry log in the shape
+`/log` streams, the run-history CSV and the `/metrics` histograms) and
+written twice: once as Microdot writes a plain generator, one write per
+yield, and once through `streaming.BufferedBody`.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+for path in (REPO_DIR, HOST_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from host.vclock import VirtualClock
+
+clock = VirtualClock()
+clock.install(time)
+
+import machine
+import generator
+import metrics
+import streaming
+from history import RunHistory
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 15,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+
+
+class CountingWriter:
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+        self.data = bytearray()
+
+    async def awrite(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        self.data += data
+
+
+def make_controller():
+    sensors = generator.SensorManager(machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP),
+                                      machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP))
+    controller = generator.GeneratorController(sensors, CONFIG, machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+    for i in range(controller.state_log.capacity):
+        clock.advance(60000)
+        controller.log_state_change('Run Request', 'Active' if i % 2 else 'Inactive')
+    return controller
+
+
+def log_body(controller):
+    state_log = controller.state_log
+    yield '{"log":['
+    first = True
+    for seq in state_log.seqs_since(0):
+        if not first:
+            yield ','
+        first = False
+        yield state_log.entry_json(seq)
+    yield '],"seq":' + str(state_log.last_seq)
+    yield ',"resync":false'
+    yield ',"uptime_ms":' + str(time.ticks_ms()) + '}'
+
+
+def metrics_body():
+    lateness = metrics.Histogram(metrics.LATENESS_BUCKETS_MS)
+    update = metrics.Histogram(metrics.UPDATE_BUCKETS_US)
+    routes = {path: metrics.Histogram(metrics.REQUEST_BUCKETS_MS) for path in ('/', '/status', '/log', '/events', '/config/data')}
+    for i in range(1000):
+        lateness.observe(i % 7)
+        update.observe(300 + i % 500)
+        for histogram in routes.values():
+            histogram.observe(i % 40)
+    yield metrics.header('gen_loop_lateness_ms', 'histogram', 'How late the control loop woke for a deadline')
+    yield from lateness.lines('gen_loop_lateness_ms')
+    yield metrics.header('gen_controller_update_us', 'histogram', 'Time spent in one controller update pass')
+    yield from update.lines('gen_controller_update_us')
+    yield metrics.header('gen_http_request_duration_ms', 'histogram', 'Route handler time per request')
+    for path, histogram in routes.items():
+        yield from histogram.lines('gen_http_request_duration_ms', 'route="' + path + '"')
+
+
+def make_history(directory, runs=200):
+    history = RunHistory(directory)
+    for i in range(runs):
+        history.record_run(i // 3, (i * 97) % 1440, 1800000 + i * 1000, i % 10 == 0)
+    history.flush()
+    return history
+
+
+async def write_plain(body):
+    writer = CountingWriter()
+    for piece in body:
+        await writer.awrite(piece.encode() if isinstance(piece, str) else piece)
+    return writer
+
+
+async def write_buffered(body, size):
+    writer = CountingWriter()
+    stream = streaming.BufferedBody(body, size)
+    async for chunk in stream:
+        await writer.awrite(chunk)
+    await stream.aclose()
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--buffer', type=int, default=streaming.WRITE_BUFFER_BYTES, help='write buffer size in bytes')
+    args = parser.parse_args()
+    controller = make_controller()
+    with tempfile.TemporaryDirectory() as directory:
+        history = make_history(directory)
+        bodies = (
+            ('status generator', lambda: controller.get_status_generator()),
+            ('/log', lambda: log_body(controller)),
+            ('/history?format=csv', lambda: history.csv_rows()),
+            ('/metrics', metrics_body),
+        )
+        print('{:22} {:>7} {:>14} {:>15} {:>9}'.format('response', 'bytes', 'writes/yield', 'writes/buffer', 'avg write'))
+        for name, body in bodies:
+            plain = asyncio.run(write_plain(body()))
+            buffered = asyncio.run(write_buffered(body(), args.buffer))
+            assert plain.data == buffered.data
+            print('{:22} {:7} {:14} {:15} {:9.0f}'.format(name, plain.bytes, plain.writes, buffered.writes, buffered.bytes / buffered.writes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Build gzip-compressed copies of the web assets for upload to the device.
+
+    python -m host.build_assets
+
+Writes `static/<name>.gz` for every asset and `static/assets.json`, which
+maps each asset to a hash of its contents. `firmware.py` serves the `.gz` files
+with `Content-Encoding: gzip` and uses the hash as the ETag. Rerun after
+editing any asset.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = 'static'
+MANIFEST = 'assets.json'
+ASSETS = ('index.html', 'log.html', 'config.html', 'script.js', 'style.css')
+
+
+def build(repo_dir=REPO_DIR):
+    out_dir = os.path.join(repo_dir, STATIC_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name in ASSETS:
+        with open(os.path.join(repo_dir, name), 'rb') as f:
+            data = f.read()
+        # mtime=0 keeps the output identical for identical input
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(os.path.join(out_dir, name + '.gz'), 'wb') as f:
+            f.write(compressed)
+        manifest[name] = hashlib.sha256(data).hexdigest()[:16]
+        print('{:12} {:6} -> {:6} bytes'.format(name, len(data), len(compressed)))
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,106 @@
+"""Precompile the firmware modules to .mpy for upload to the device.
+
+    python -m host.build_firmware [--mpy-cross PATH] [--march xtensawin] [--emit native]
+
+Writes `build/<module>.mpy` for every firmware module and copies `main.py`,
+which only imports `firmware`. Upload the contents of `build/` instead of
+the .py sources: the device then loads bytecode directly instead of
+compiling every module at boot. `mpy-cross` (`pip install mpy-cross`) must
+emit the same .mpy version as the MicroPython firmware on the board.
+
+`--emit native` (or `viper`) compiles the control loop's hot functions
+(`HOT_FUNCTIONS`) to machine code for `--march` by decorating them with
+`@micropython.native` in a copy of the source; everything else stays
+bytecode, since a whole module of native code is several times its bytecode
+size. Viper only takes code that keeps Python objects and machine ints
+apart, so a function mpy-cross rejects as viper is built native instead.
+`python -m host.bench_mpy` measures what each emitter buys.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = 'build'
+MODULES = ('firmware.py', 'generator.py', 'eventlog.py', 'history.py', 'storage.py', 'metrics.py', 'streaming.py', 'server.py', 'iotrace.py', 'control.py', 'respcache.py', 'telemetry.py')
+EMITTERS = ('bytecode', 'native', 'viper')
+# Functions run on every control pass (or every log entry sent), by module.
+# A name covers every def of that name in the module, e.g. each state's update().
+HOT_FUNCTIONS = {
+    'generator.py': ('update_debounce', 'update_transitions', 'update', 'tick', 'next_wakeup_ms', 'next_settle_ms',
+                     'is_request_run', 'is_request_raw', '_is_running_raw', 'entry_json'),
+}
+
+
+def mpy_version(path):
+    """.mpy format version from a compiled file's header"""
+    with open(path, 'rb') as f:
+        return f.read(2)[1]
+
+
+def decorate(source, emitters):
+    """Put @micropython.<emitter> on each def named in `emitters` ({function: emitter})"""
+    lines = []
+    for line in source.splitlines(True):
+        stripped = line.lstrip()
+        if stripped.startswith('def '):
+            emitter = emitters.get(stripped[4:].split('(', 1)[0])
+            if emitter:
+                lines.append(line[:len(line) - len(stripped)] + '@micropython.' + emitter + '\n')
+        lines.append(line)
+    return ''.join(lines)
+
+
+def compile_module(name, out, repo_dir=REPO_DIR, mpy_cross='mpy-cross', march=None, emit='bytecode'):
+    """Compile one module to `out`; returns the {function: emitter} it was built with"""
+    emitters = {} if emit == 'bytecode' else {function: emit for function in HOT_FUNCTIONS.get(name, ())}
+    with open(os.path.join(repo_dir, name)) as f:
+        source = f.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        while True:
+            with open(os.path.join(tmp, name), 'w') as f:
+                f.write(decorate(source, emitters))
+            cmd = [mpy_cross, '-o', os.path.abspath(out), name]
+            if march:
+                cmd.insert(1, '-march=' + march)
+            result = subprocess.run(cmd, cwd=tmp, capture_output=True, text=True)
+            if result.returncode == 0:
+                return emitters
+            failed = re.search(r', in (\w+)\n\w*ViperTypeError', result.stderr)
+            if not failed or emitters.get(failed.group(1)) != 'viper':
+                sys.stderr.write(result.stderr)
+                raise subprocess.CalledProcessError(result.returncode, cmd)
+            emitters[failed.group(1)] = 'native'
+
+
+def build(repo_dir=REPO_DIR, mpy_cross='mpy-cross', march=None, emit='bytecode'):
+    out_dir = os.path.join(repo_dir, BUILD_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    for name in MODULES:
+        out = os.path.join(out_dir, name[:-3] + '.mpy')
+        emitters = compile_module(name, out, repo_dir, mpy_cross, march, emit)
+        print('{:14} {:6} -> {:6} bytes'.format(name, os.path.getsize(os.path.join(repo_dir, name)), os.path.getsize(out)))
+        fallback = sorted(function for function, emitter in emitters.items() if emitter != emit)
+        if fallback:
+            print('  {} as native, not {}: {}'.format(len(fallback), emit, ', '.join(fallback)))
+    shutil.copy(os.path.join(repo_dir, 'main.py'), out_dir)
+    # microdot.mpy is shipped precompiled; ours must load on the same firmware
+    ours = mpy_version(os.path.join(out_dir, MODULES[0][:-3] + '.mpy'))
+    theirs = mpy_version(os.path.join(repo_dir, 'microdot.mpy'))
+    if ours != theirs:
+        print('warning: built .mpy v{} but microdot.mpy is v{}'.format(ours, theirs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mpy-cross', default='mpy-cross', help='mpy-cross executable')
+    parser.add_argument('--march', help='native code architecture, e.g. xtensawin for the ESP32')
+    parser.add_argument('--emit', choices=EMITTERS, default='bytecode', help='code emitter for HOT_FUNCTIONS')
+    args = parser.parse_args()
+    if args.emit != 'bytecode' and not args.march:
+        parser.error('--emit {} needs --march'.format(args.emit))
+    build(mpy_cross=args.mpy_cross, march=args.march, emit=args.emit)
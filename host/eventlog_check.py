@@ -0,0 +1,86 @@
+"""Check that the event log survives a reset in the middle of a write.
+
+    python -m host.eventlog_check [--records 30]
+
+Fills a segment with `--records` entries, then for every length the last
+record could have been cut to (from nothing of it written to all but its
+last byte) truncates a copy of the segment there and reopens the log. The
+torn record must be dropped: `next_seq` has to come back as its seq, an
+entry recorded and flushed after that has to be read back by a fresh
+EventLog, and every earlier entry has to be intact. Exits 1 on the first
+cut that fails.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from eventlog import EventLog, HEADER_SIZE
+
+
+def fill(directory, records):
+    """Write the entries; returns (segment path, offset of the last record)"""
+    log = EventLog(directory)
+    for i in range(records - 1):
+        log.record(i, 'Kill Relay', 'On {}'.format(i))
+    log.flush()
+    path = log._path(log.current)
+    last_offset = os.stat(path).st_size
+    log.record(records - 1, 'Cool Down', 'last entry')
+    log.flush()
+    return path, last_offset
+
+
+def check_cut(directory, records):
+    """Reopen the log after its segment was cut short; returns an error or None"""
+    log = EventLog(directory)
+    if log.next_seq != records:
+        return 'next_seq {} after the cut, expected {}'.format(log.next_seq, records)
+    log.record(0, 'Maintenance', 'after reset')
+    log.flush()
+    entries = EventLog(directory).query(limit=records + 1)
+    got = [(seq, event, details) for seq, timestamp, boot, event, details in entries]
+    expected = [(records, 'Maintenance', 'after reset')]
+    expected += [(i + 1, 'Kill Relay', 'On {}'.format(i)) for i in reversed(range(records - 1))]
+    if got != expected:
+        return 'read back {} entries, first {}, expected {} starting {}'.format(
+            len(got), got[:1], len(expected), expected[:1])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=30, help='entries in the segment, the last one torn')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='eventlog-check-')
+    try:
+        original = os.path.join(work, 'original')
+        path, last_offset = fill(original, args.records)
+        with open(path, 'rb') as f:
+            data = f.read()
+        segment = os.path.relpath(path, original)
+        for cut in range(last_offset, len(data)):
+            directory = os.path.join(work, 'cut{}'.format(cut))
+            shutil.copytree(original, directory)
+            with open(os.path.join(directory, segment), 'wb') as f:
+                f.write(data[:cut])
+            error = check_cut(directory, args.records)
+            if error:
+                print('cut at byte {} ({} of the last record kept): {}'.format(cut, cut - last_offset, error))
+                sys.exit(1)
+            shutil.rmtree(directory)
+        print('ok: last record ({} bytes, {}-byte header) cut at every offset, log recovered each time'.format(
+            len(data) - last_offset, HEADER_SIZE))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
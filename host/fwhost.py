@@ -0,0 +1,161 @@
+"""Run the firmware's web app on the host, in real time.
+
+    python -m host.fwhost [--port 8080] [--dir DIR] [--set key=value ...]
+
+Boots `main.py`, and with it `firmware.py`, on CPython against the
+stand-in `machine` and `network` modules in `host/`. MicroPython's
+`time.ticks_*` and `time.sleep_ms()`, `asyncio.sleep_ms()`,
+`asyncio.wait_for_ms()` and `asyncio.ThreadSafeFlag` are filled in on the
+wall clock, so the control loop, the storage tasks and the web server run
+as they do on the board and the pages are served on
+http://127.0.0.1:<port>/. The run-sense and run-request inputs stay at
+their inactive level; the `/test/` routes drive the controller.
+
+The firmware writes `config.json`, `state.bin` and its log and history
+files to the working directory, so it runs in a copy: --dir, or a fresh
+temporary directory. --set overrides a `config.json` entry with a JSON
+value, e.g. `--set control_thread=1`. `gc.mem_free()` and `gc.mem_alloc()`
+report fixed figures from an ESP32 after boot.
+
+Needs Microdot's source (`pip install microdot`); the repo only carries
+the compiled `microdot.mpy`.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import _thread
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+ASSETS = ('config.json', 'index.html', 'log.html', 'config.html', 'script.js', 'style.css')
+HEAP_FREE_BYTES = 96000     # Roughly what an ESP32 without PSRAM has left once the firmware is up
+HEAP_ALLOC_BYTES = 24000
+TICKS_PERIOD = 1 << 30
+THREAD_STACK_MIN = 32768    # CPython refuses smaller thread stacks than this
+
+
+class ThreadSafeFlag:
+    """asyncio.ThreadSafeFlag: set() from any thread wakes the task waiting on it"""
+
+    def __init__(self):
+        self._flag = False
+        self._loop = None
+        self._event = None
+
+    def set(self):
+        self._flag = True
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self):
+        # Created on first use: the firmware makes its flags before the loop runs
+        if self._event is None:
+            self._loop = asyncio.get_running_loop()
+            self._event = asyncio.Event()
+        while not self._flag:
+            await self._event.wait()
+            self._event.clear()
+        self._flag = False
+
+
+def install_runtime(start=None):
+    """Give time, asyncio, gc, sys and _thread the MicroPython APIs the firmware uses"""
+    t0 = time.monotonic() if start is None else start
+    time.ticks_ms = lambda: int((time.monotonic() - t0) * 1000) % TICKS_PERIOD
+    time.ticks_us = lambda: int((time.monotonic() - t0) * 1000000) % TICKS_PERIOD
+    time.ticks_add = lambda ticks, delta: (ticks + delta) % TICKS_PERIOD
+
+    def ticks_diff(a, b):
+        diff = (a - b) % TICKS_PERIOD
+        return diff - TICKS_PERIOD if diff >= TICKS_PERIOD // 2 else diff
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+    async def sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+
+    async def wait_for_ms(awaitable, ms):
+        return await asyncio.wait_for(awaitable, ms / 1000)
+    asyncio.sleep_ms = sleep_ms
+    asyncio.wait_for_ms = wait_for_ms
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    gc.threshold = lambda amount=None: -1
+    gc.mem_free = lambda: HEAP_FREE_BYTES
+    gc.mem_alloc = lambda: HEAP_ALLOC_BYTES
+    sys.print_exception = traceback.print_exception
+    sys.modules['ujson'] = json
+    stack_size = _thread.stack_size
+    _thread.stack_size = lambda size=0: stack_size(max(size, THREAD_STACK_MIN) if size else 0)
+
+
+def prepare_dir(path, settings):
+    """Copy config.json and the web assets into path, with settings applied to the config"""
+    os.makedirs(path, exist_ok=True)
+    for name in ASSETS:
+        shutil.copy(os.path.join(REPO_DIR, name), path)
+    static = os.path.join(REPO_DIR, 'static')
+    if os.path.isdir(static):
+        shutil.copytree(static, os.path.join(path, 'static'), dirs_exist_ok=True)
+    config_path = os.path.join(path, 'config.json')
+    with open(config_path) as f:
+        config = json.load(f)
+    config.update(settings)
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=4)
+
+
+def parse_settings(pairs):
+    settings = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080, help='port to serve on')
+    parser.add_argument('--host', default='127.0.0.1', help='address to serve on')
+    parser.add_argument('--dir', help='working directory for the firmware (default: a temporary one)')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='override a config.json entry (JSON value); repeatable')
+    args = parser.parse_args()
+
+    install_runtime()
+    try:
+        import microdot
+    except ImportError:
+        sys.exit('Microdot is not installed: pip install microdot')
+    serve = microdot.Microdot.start_server
+
+    async def start_server(self, host='0.0.0.0', port=5000, **kwargs):
+        return await serve(self, host=args.host, port=args.port, **kwargs)
+    microdot.Microdot.start_server = start_server
+
+    work = args.dir or tempfile.mkdtemp(prefix='fwhost-')
+    prepare_dir(work, parse_settings(args.set))
+    os.chdir(work)
+    for path in (REPO_DIR, HOST_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    print('fwhost: {} on http://{}:{}/'.format(work, args.host, args.port), flush=True)
+    # Runs the firmware's asyncio loop until interrupted
+    import main
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Report the heap held by the controller objects and the cost of their hot paths.
+
+    micropython host/heap_report.py
+    python -m host.heap_report
+
+Builds each object on stand-in pins and reports the bytes it keeps on the
+heap once construction garbage is collected: a `SensorManager`, an
+`IrqSensorManager` and a `GeneratorController` (with its state objects and
+log ring, but not its sensor manager). Then times `update_debounce()`,
+`controller.update()` and `controller.tick()` per call.
+
+Under the MicroPython unix port the bytes come from gc.mem_alloc() and match
+the ESP32's object layout. Under CPython they come from tracemalloc, whose
+dicts grow in large steps and hide small changes, so the report also works
+out the size of each object's MicroPython member map (8 bytes a slot on the
+ESP32, in 16-byte GC blocks) from its attribute count. CPython timings say
+little about the device, where `const()` bits are inlined and attribute
+lookups cost more.
+"""
+import gc
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+
+if MICROPYTHON:
+    HOST_DIR = sys.argv[0].rsplit('/', 1)[0] if '/' in sys.argv[0] else '.'
+    sys.path.insert(0, HOST_DIR + '/..')
+    sys.path.insert(0, HOST_DIR)
+
+    def heap_used():
+        gc.collect()
+        return gc.mem_alloc()
+
+    def now_us():
+        return time.ticks_us()
+else:
+    import os
+    import tracemalloc
+
+    HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+    REPO_DIR = os.path.dirname(HOST_DIR)
+    for path in (REPO_DIR, HOST_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from host.vclock import VirtualClock
+    VirtualClock().install(time)
+    tracemalloc.start()
+
+    def heap_used():
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+
+    def now_us():
+        return time.perf_counter_ns() // 1000
+
+import machine
+import generator
+
+generator.log_echo = False
+
+CONFIG = {
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 15,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+}
+CALLS = 2000
+# py/map.c: a full member map is reallocated at the next of these sizes
+MAP_SIZES = (0, 2, 4, 6, 8, 10, 12, 17, 23, 29, 37, 47, 59, 73, 97, 127)
+
+
+def pins():
+    return (machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP), machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP),
+            machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+
+
+def held(build):
+    """Bytes still held after build() returns, with its inputs made beforehand"""
+    keep = []
+    before = heap_used()
+    keep.append(build())
+    return heap_used() - before, keep[0]
+
+
+def member_map_bytes(obj):
+    """Bytes of the member map MicroPython gives `obj` on a 32-bit port"""
+    slots = next(size for size in MAP_SIZES if size >= len(obj.__dict__))
+    return (slots * 8 + 15) // 16 * 16
+
+
+def per_call_us(fn):
+    start = now_us()
+    for _ in range(CALLS):
+        fn()
+    return (now_us() - start) / CALLS
+
+
+def main():
+    run_sense, run_request, start, kill = pins()
+    sensors_bytes, sensors = held(lambda: generator.SensorManager(run_sense, run_request))
+    irq_bytes, irq_sensors = held(lambda: generator.IrqSensorManager(*pins()[:2]))
+    controller_bytes, controller = held(lambda: generator.GeneratorController(sensors, CONFIG, start, kill))
+    print('{:32} {:>8} {:>6} {:>10}'.format('object', 'bytes', 'attrs', 'map bytes'))
+    for name, size, obj in (('SensorManager', sensors_bytes, sensors),
+                            ('IrqSensorManager', irq_bytes, irq_sensors),
+                            ('GeneratorController', controller_bytes, controller)):
+        print('{:32} {:8} {:6} {:10}'.format(name, size, len(obj.__dict__), member_map_bytes(obj)))
+    print('{:32} {:>8}'.format('hot path', 'us/call'))
+    print('{:32} {:8.2f}'.format('update_debounce()', per_call_us(sensors.update_debounce)))
+    print('{:32} {:8.2f}'.format('controller.update()', per_call_us(controller.update)))
+    print('{:32} {:8.2f}'.format('controller.tick()', per_call_us(controller.tick)))
+
+
+main()
@@ -0,0 +1,440 @@
+"""Load-test the web server and report route latency and control loop timing.
+
+    python -m host.loadtest [--browsers 8] [--seconds 30] [--set key=value ...]
+                            [--label NAME] [--baseline NAME] [--url http://host:port]
+
+Starts the firmware on the host (`host/fwhost.py`, in a process of its
+own) and points N simulated browsers at it for S seconds. Each browser
+does what `script.js` does when it polls: it loads a page (`/`, or
+`/logpage` for every fourth browser) with `/style.css` and `/script.js`,
+accepting gzip and revalidating by ETag after the first load, syncs the
+clock with a `/config/update` POST, then fetches `/dashboard` once a second
+(every 2 s on the log page) and reloads the page every --reload seconds.
+A request that outlasts the interval delays the next one instead of
+overlapping it. One operator client meanwhile cycles through `/status`
+(revalidated), `/log?since=`, `/config` and `/config/data`, a
+`/config/update` that saves the settings unchanged, and
+`/test/override_request` and `/test/override_running`, so the start relay
+pulses during the run. `/test/force_maintenance` is left out: it would
+hold the generator in a 10-minute run. With --url the clients target a
+firmware that is already running, on the host or on a board.
+
+The report gives each route's requests, errors (connection failures,
+5xx and `{"error": ...}` bodies), throughput and p50/p95/p99/max latency
+as the client saw it. From `/metrics` scraped before and after, it gives
+how late the control loop woke for its deadlines during the run
+(`gen_loop_lateness_ms`, interpolated) and the relay latencies. Results
+go to `host/loadtest_results/<label>.json` (the label defaults to `git
+describe --always --dirty`) and are compared with a baseline: the file
+named by --baseline, else the most recently saved other one. A route's
+p95 or the control loop's p99 lateness more than --threshold percent and
+--slack ms worse than in the baseline is flagged, and the exit status is 1.
+
+Host timings are not the board's, but the change between firmware
+versions and between client counts carries over. Needs Microdot's source
+for the host run (`pip install microdot`).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from metrics import Histogram
+from host.bench_mpy import label
+
+RESULTS_DIR = os.path.join(HOST_DIR, 'loadtest_results')
+STARTUP_S = 15              # How long the firmware gets to start serving
+REQUEST_TIMEOUT_S = 10
+OPERATOR_PERIOD_S = 4       # Seconds between the operator's rounds
+CONFIG_FIELDS = ('maintenance_interval_days', 'maintenance_duration_minutes', 'cool_down_duration_minutes',
+                 'maintenance_start_hour', 'maintenance_start_minute')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Connection:
+    """One keep-alive connection, as a browser keeps to the board
+
+    A request on a connection the server has since closed is retried once
+    on a new one, as browsers do.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Send one request; returns (status, headers with lower-case names, body)"""
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                return await self.exchange(method, path, headers or {}, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused or attempt:
+                    raise
+
+    async def exchange(self, method, path, headers, body):
+        head = '{} {} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n'.format(method, path, self.host)
+        for name, value in headers.items():
+            head += '{}: {}\r\n'.format(name, value)
+        if body:
+            head += 'Content-Length: {}\r\n'.format(len(body))
+        self.writer.write(head.encode() + b'\r\n' + body)
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionResetError('connection closed')
+        status = int(line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await self.reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() != 'keep-alive':
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class Stats:
+    """Client-side latency per route (the path without its query string)"""
+
+    def __init__(self):
+        self.latency = {}
+        self.errors = {}
+
+    async def fetch(self, conn, method, path, headers=None, body=b''):
+        """conn.request() timed and recorded; returns (status, headers, body), status 0 on failure"""
+        route = path.split('?')[0]
+        start = time.perf_counter()
+        try:
+            status, response_headers, data = await asyncio.wait_for(
+                conn.request(method, path, headers, body), REQUEST_TIMEOUT_S)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            conn.close()
+            status, response_headers, data = 0, {}, b''
+        self.latency.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+        if status == 0 or status >= 500 or data.startswith(b'{"error"'):
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return status, response_headers, data
+
+
+async def load_page(stats, conn, page, etags):
+    """A page and its assets, as a browser with a cache loads them"""
+    for path in (page, '/style.css', '/script.js'):
+        headers = {'Accept-Encoding': 'gzip'}
+        if path in etags:
+            headers['If-None-Match'] = etags[path]
+        status, response_headers, _ = await stats.fetch(conn, 'GET', path, headers)
+        if status == 200 and 'etag' in response_headers:
+            etags[path] = response_headers['etag']
+
+
+async def browser(n, target, stats, stop, reload_s):
+    conn = Connection(*target)
+    log_page = n % 4 == 3
+    page = '/logpage' if log_page else '/'
+    interval = 2.0 if log_page else 1.0
+    etags = {}
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(random.uniform(0, interval))
+    while not stop:
+        await load_page(stats, conn, page, etags)
+        now = time.localtime()
+        await stats.fetch(conn, 'POST', '/config/update', {'Content-Type': 'application/x-www-form-urlencoded'},
+                          'current_minutes={}'.format(now.tm_hour * 60 + now.tm_min).encode())
+        log_seq = 0
+        reload_at = loop.time() + reload_s
+        next_poll = loop.time()
+        while not stop and loop.time() < reload_at:
+            if log_page:
+                url = '/dashboard?include=uptime,log&log_since={}'.format(log_seq)
+            else:
+                url = '/dashboard?include=uptime,status'
+            status, _, data = await stats.fetch(conn, 'GET', url)
+            if log_page and status == 200:
+                log_seq = json.loads(data).get('seq', log_seq)
+            next_poll = max(next_poll + interval, loop.time())
+            await asyncio.sleep(next_poll - loop.time())
+    conn.close()
+
+
+async def operator(target, stats, stop):
+    conn = Connection(*target)
+    json_headers = {'Content-Type': 'application/json'}
+    status_etag = None
+    log_seq = 0
+    request_on = False
+    while not stop:
+        headers = {'If-None-Match': status_etag} if status_etag else {}
+        status, response_headers, _ = await stats.fetch(conn, 'GET', '/status', headers)
+        if status == 200:
+            status_etag = response_headers.get('etag')
+        status, _, data = await stats.fetch(conn, 'GET', '/log?since={}'.format(log_seq))
+        if status == 200:
+            log_seq = json.loads(data).get('seq', log_seq)
+        await stats.fetch(conn, 'GET', '/config', {'Accept-Encoding': 'gzip'})
+        status, _, data = await stats.fetch(conn, 'GET', '/config/data')
+        if status == 200:
+            config = json.loads(data)
+            form = '&'.join('{}={}'.format(field, config[field]) for field in CONFIG_FIELDS if field in config)
+            await stats.fetch(conn, 'POST', '/config/update', {'Content-Type': 'application/x-www-form-urlencoded'},
+                              form.encode())
+        request_on = not request_on
+        await stats.fetch(conn, 'POST', '/test/override_request', json_headers,
+                          json.dumps({'override': request_on}).encode())
+        await stats.fetch(conn, 'POST', '/test/override_running', json_headers, b'{"override": false}')
+        await asyncio.sleep(OPERATOR_PERIOD_S)
+    if request_on:
+        await stats.fetch(conn, 'POST', '/test/override_request', json_headers, b'{"override": false}')
+    conn.close()
+
+
+def scrape(text):
+    """{'name{labels}': value} from Prometheus text"""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            key, _, value = line.rpartition(' ')
+            values[key] = float(value)
+    return values
+
+
+def histogram_delta(before, after, name, labels=''):
+    """A metrics.Histogram of what `name` recorded between two scrapes"""
+    prefix = name + '_bucket{' + labels + (',' if labels else '') + 'le="'
+    bounds = []
+    cumulative = []
+    for key, value in after.items():
+        if key.startswith(prefix):
+            bound = key[len(prefix):-2]
+            if bound != '+Inf':
+                bounds.append(int(bound))
+            cumulative.append(value - before.get(key, 0))
+    histogram = Histogram(tuple(bounds))
+    seen = 0
+    for i, total in enumerate(cumulative):
+        histogram.counts[i] = int(total - seen)
+        seen = total
+    return histogram
+
+
+def percentile(ordered, q):
+    """Nearest-rank q-quantile of a sorted list"""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def get_metrics(target):
+    conn = Connection(*target)
+    try:
+        status, _, data = await conn.request('GET', '/metrics')
+    finally:
+        conn.close()
+    return scrape(data.decode())
+
+
+async def wait_until_serving(target, server):
+    deadline = time.monotonic() + STARTUP_S
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            sys.exit('the firmware exited during startup (status {})'.format(server.returncode))
+        conn = Connection(*target)
+        try:
+            status, _, _ = await conn.request('GET', '/ping')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        await asyncio.sleep(0.25)
+    sys.exit('the firmware did not answer /ping within {} s'.format(STARTUP_S))
+
+
+async def run(target, args, server):
+    await wait_until_serving(target, server)
+    before = await get_metrics(target)
+    stats = Stats()
+    stop = []
+    tasks = [asyncio.create_task(browser(n, target, stats, stop, args.reload)) for n in range(args.browsers)]
+    tasks.append(asyncio.create_task(operator(target, stats, stop)))
+    start = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    stop.append(True)
+    for task in tasks:
+        await task
+    elapsed = time.perf_counter() - start
+    after = await get_metrics(target)
+    return stats, elapsed, before, after
+
+
+def summarize(stats, elapsed, before, after, args):
+    report = {'label': args.label, 'browsers': args.browsers, 'seconds': args.seconds, 'settings': args.set,
+              'routes': {}, 'relays': {}}
+    total = 0
+    errors = 0
+    for route in sorted(stats.latency):
+        ordered = sorted(stats.latency[route])
+        entry = {'requests': len(ordered), 'errors': stats.errors.get(route, 0),
+                 'rps': round(len(ordered) / elapsed, 2), 'max': round(ordered[-1], 1)}
+        for q in QUANTILES:
+            entry['p{:g}'.format(q * 100)] = round(percentile(ordered, q), 1)
+        report['routes'][route] = entry
+        total += len(ordered)
+        errors += entry['errors']
+    report['total'] = {'requests': total, 'errors': errors, 'rps': round(total / elapsed, 2),
+                       'rejected': int(after.get('gen_http_rejected_total', 0) - before.get('gen_http_rejected_total', 0))}
+    lateness = histogram_delta(before, after, 'gen_loop_lateness_ms')
+    control = {'wakeups': lateness.count(),
+               'over_budget': int(after.get('gen_loop_over_budget_total', 0) - before.get('gen_loop_over_budget_total', 0)),
+               'budget': int(after.get('gen_loop_lateness_budget_ms', 0)),
+               'max_since_boot': int(after.get('gen_loop_lateness_max_ms', 0)),
+               'deadline_missed': int(after.get('gen_deadline_missed_total', 0) - before.get('gen_deadline_missed_total', 0))}
+    for q in QUANTILES:
+        control['p{:g}'.format(q * 100)] = lateness.quantile(q) if lateness.count() else 0
+    report['control'] = control
+    for key in after:
+        if key.startswith('gen_relay_latency_ms_count{'):
+            labels = key[len('gen_relay_latency_ms_count{'):-1]
+            histogram = histogram_delta(before, after, 'gen_relay_latency_ms', labels)
+            if histogram.count():
+                report['relays'][labels.split('"')[1]] = {
+                    'count': histogram.count(), 'p50': histogram.quantile(0.5), 'p99': histogram.quantile(0.99)}
+    return report
+
+
+def load_baseline(name, current):
+    if name:
+        path = os.path.join(RESULTS_DIR, name + '.json')
+    else:
+        saved = [os.path.join(RESULTS_DIR, f) for f in os.listdir(RESULTS_DIR) if f.endswith('.json')] if os.path.isdir(RESULTS_DIR) else []
+        saved = [p for p in saved if os.path.basename(p) != current + '.json']
+        if not saved:
+            return None
+        path = max(saved, key=os.path.getmtime)
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(now, before):
+    return ' ({:+.0f}%)'.format((now - before) * 100 / before) if before else ''
+
+
+def compare(report, baseline, args):
+    """Lines flagging what got worse than the baseline by more than the threshold and slack"""
+    regressions = []
+
+    def check(what, now, before):
+        if before is not None and now - before > args.slack and now > before * (1 + args.threshold / 100):
+            regressions.append('{}: {} -> {} ms'.format(what, before, now))
+    for route, entry in report['routes'].items():
+        old = baseline['routes'].get(route)
+        if old:
+            check(route + ' p95', entry['p95'], old['p95'])
+    check('control loop p99 lateness', report['control']['p99'], baseline['control']['p99'])
+    return regressions
+
+
+def print_report(report, baseline):
+    old_routes = baseline['routes'] if baseline else {}
+    print('{} browsers for {} s{}{}'.format(report['browsers'], report['seconds'],
+                                           ' with ' + ' '.join(report['settings']) if report['settings'] else '',
+                                           ' vs ' + baseline['label'] if baseline else ''))
+    print('{:24} {:>8} {:>6} {:>7} {:>8} {:>16} {:>8} {:>8}'.format('route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for route, entry in report['routes'].items():
+        old = old_routes.get(route, {})
+        print('{:24} {:8} {:6} {:7.2f} {:8.1f} {:>16} {:8.1f} {:8.1f}'.format(
+            route, entry['requests'], entry['errors'], entry['rps'], entry['p50'],
+            '{:.1f}{}'.format(entry['p95'], change(entry['p95'], old.get('p95'))), entry['p99'], entry['max']))
+    total = report['total']
+    print('{:24} {:8} {:6} {:7.2f}   ({} turned away with 503)'.format('all', total['requests'], total['errors'], total['rps'], total['rejected']))
+    control = report['control']
+    old = baseline['control'] if baseline else {}
+    print('control loop: {} wakeups, late p50 {} p95 {} p99 {}{} ms, {} over the {} ms budget, {} deadlines missed, '
+          'worst since boot {} ms'.format(control['wakeups'], control['p50'], control['p95'], control['p99'],
+                                         change(control['p99'], old.get('p99')), control['over_budget'], control['budget'],
+                                         control['deadline_missed'], control['max_since_boot']))
+    for path, entry in report['relays'].items():
+        print('relay {:16} {:4} writes, p50 {} ms, p99 {} ms'.format(path, entry['count'], entry['p50'], entry['p99']))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--browsers', type=int, default=8, help='simulated browsers polling at once')
+    parser.add_argument('--seconds', type=float, default=30, help='length of the run')
+    parser.add_argument('--reload', type=float, default=15, help='seconds between page reloads per browser')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='config.json override for the firmware run (see host/fwhost.py); repeatable')
+    parser.add_argument('--url', help='test a firmware already running here instead of starting one')
+    parser.add_argument('--label', default=label(), help='name to save these results under')
+    parser.add_argument('--baseline', help='saved label to compare with (default: the latest other one)')
+    parser.add_argument('--threshold', type=float, default=25, help='percent slowdown reported as a regression')
+    parser.add_argument('--slack', type=float, default=5, help='ms a slowdown must also exceed to count')
+    parser.add_argument('--no-save', action='store_true', help='compare only, do not write the results file')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        address = args.url.split('://')[-1].rstrip('/')
+        host, _, port = address.partition(':')
+        target = (host, int(port or 80))
+    else:
+        target = ('127.0.0.1', free_port())
+        cmd = [sys.executable, '-m', 'host.fwhost', '--port', str(target[1])]
+        for setting in args.set:
+            cmd += ['--set', setting]
+        server = subprocess.Popen(cmd, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    try:
+        stats, elapsed, before, after = asyncio.run(run(target, args, server))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = summarize(stats, elapsed, before, after, args)
+    baseline = load_baseline(args.baseline, args.label)
+    print_report(report, baseline)
+    regressions = compare(report, baseline, args) if baseline else []
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, args.label + '.json'), 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
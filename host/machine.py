@@ -0,0 +1,95 @@
+"""Stand-in for MicroPython's `machine` module on the host.
+
+Only the parts used by the firmware are provided. Pins keep their level in
+memory; tools drive inputs with `Pin.drive()` and watch outputs through
+`Pin.on_change()`.
+"""
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self._value = 1 if value else 0
+        self._listeners = []
+        self._irq_handler = None
+        self._irq_trigger = 0
+
+    def __repr__(self):
+        return 'Pin({})'.format(self.id)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._set(1 if value else 0)
+
+    __call__ = value
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._irq_handler = handler
+        self._irq_trigger = trigger if handler else 0
+
+    def on_change(self, callback):
+        """Call `callback(pin, value)` whenever the level changes"""
+        self._listeners.append(callback)
+
+    def drive(self, value):
+        """Set the level of an input pin as the outside world would"""
+        self._set(1 if value else 0)
+
+    def _set(self, value):
+        if value == self._value:
+            return
+        self._value = value
+        for callback in self._listeners:
+            callback(self, value)
+        if self._irq_handler:
+            edge = Pin.IRQ_RISING if value else Pin.IRQ_FALLING
+            if self._irq_trigger & edge:
+                self._irq_handler(self)
+
+
+class WDT:
+    """Counts feeds; nothing resets the host"""
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.feeds = 0
+
+    def feed(self):
+        self.feeds += 1
+
+
+PWRON_RESET = 1
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def unique_id():
+    return b'\x00host\x00'
@@ -0,0 +1,123 @@
+"""Stand-in MQTT broker for trying the firmware's telemetry on the host.
+
+    python -m host.mqtt_broker [--port 1883] [--outage AT:SECONDS ...] [--refuse]
+
+Accepts MQTT 3.1.1 clients, acknowledges QoS 1 publishes, answers pings
+and prints every message it receives as `<seconds> <topic> <payload>`.
+There are no subscriptions; this only shows what a controller sends.
+--outage 20:30 drops every connection and stops listening 20 s after
+start, for 30 s, so the controller's queue and forward can be watched;
+it can be given more than once. --refuse answers every CONNECT
+with "not authorized".
+
+    python -m host.mqtt_broker --outage 20:30
+    python -m host.fwhost --set 'telemetry={"broker": "127.0.0.1", "interval_s": 2}'
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from telemetry import read_packet, remaining_length
+
+CONNECT = 1
+PUBLISH = 3
+PINGREQ = 12
+DISCONNECT = 14
+
+
+class Broker:
+    def __init__(self, host, port, refuse=False):
+        self.host = host
+        self.port = port
+        self.refuse = refuse
+        self.server = None
+        self.writers = set()
+        self.retained = {}
+        self.start = time.monotonic()
+
+    def say(self, text):
+        print('{:8.1f} {}'.format(time.monotonic() - self.start, text), flush=True)
+
+    async def listen(self):
+        self.server = await asyncio.start_server(self.serve, self.host, self.port)
+        self.say('listening on {}:{}'.format(self.host, self.port))
+
+    async def outage(self, at, seconds):
+        await asyncio.sleep(at - (time.monotonic() - self.start))
+        self.say('outage for {} s'.format(seconds))
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await asyncio.sleep(seconds)
+        await self.listen()
+
+    async def serve(self, reader, writer):
+        self.writers.add(writer)
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                kind, body = await read_packet(reader)
+                if kind == CONNECT:
+                    client_id = body[12:12 + struct.unpack('!H', body[10:12])[0]].decode()
+                    self.say('CONNECT {} from {}:{}'.format(client_id, *peer[:2]))
+                    writer.write(bytes((0x20, 2, 0, 5 if self.refuse else 0)))
+                elif kind == PUBLISH:
+                    self.publish(writer, body)
+                elif kind == PINGREQ:
+                    self.say('PINGREQ')
+                    writer.write(b'\xd0\x00')
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+            self.say('connection from {}:{} closed'.format(*peer[:2]))
+
+    def publish(self, writer, body):
+        # Only the QoS the firmware uses: 1, with a packet id to acknowledge
+        length = struct.unpack('!H', body[:2])[0]
+        topic = body[2:2 + length].decode()
+        packet_id = body[2 + length:4 + length]
+        payload = body[4 + length:]
+        self.retained[topic] = payload
+        self.say('{} {}'.format(topic, payload.decode(errors='replace')))
+        writer.write(b'\x40' + remaining_length(2) + packet_id)
+
+
+async def run(args):
+    broker = Broker(args.host, args.port, args.refuse)
+    await broker.listen()
+    for outage in args.outage:
+        at, _, seconds = outage.partition(':')
+        asyncio.create_task(broker.outage(float(at), float(seconds)))
+    while True:
+        await asyncio.sleep(3600)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--outage', action='append', default=[], metavar='AT:SECONDS',
+                        help='go away AT seconds after start for SECONDS; repeatable')
+    parser.add_argument('--refuse', action='store_true', help='refuse every connection')
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Stand-in for MicroPython's `network` module on the host."""
+
+STA_IF = 0
+AP_IF = 1
+AUTH_OPEN = 0
+AUTH_WPA_WPA2_PSK = 4
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._config = {}
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def connect(self, ssid=None, key=None):
+        self._config['ssid'] = ssid
+
+    def isconnected(self):
+        return self._active
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.255.255.0', '127.0.0.1', '127.0.0.1')
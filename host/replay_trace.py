@@ -0,0 +1,224 @@
+"""Replay a recorded input trace through the controller and compare relay actions.
+
+    curl -o incident.trace http://192.168.4.1/trace
+    python -m host.replay_trace incident.trace [--tolerance-ms 500] [--dump]
+
+The trace from `/trace` holds every raw and debounced edge on each
+channel's run-sense and run-request inputs, every relay actuation and a
+keyframe each time a channel went idle. For each channel the replay builds
+a fresh `SensorManager` and `GeneratorController` (from the current
+`generator.py`) with the settings the device reported, restores the oldest
+keyframe still in the ring, then drives the stand-in input pins with the
+recorded raw edges on a virtual clock, as fast as the controller's own
+deadlines allow. The relay actions that come out are compared in order with
+the recorded ones; a mismatch in kind, level or time (beyond the
+tolerance) exits with status 1. Debounced edges are compared too and
+reported, but do not fail the replay.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+for path in (REPO_DIR, HOST_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from host.vclock import VirtualClock
+
+clock = VirtualClock()
+clock.install(time)
+
+import machine
+import generator
+import iotrace
+
+generator.log_echo = False
+
+RELAYS = (iotrace.START_RELAY, iotrace.KILL_RELAY)
+DEBOUNCED = (iotrace.SENSE, iotrace.REQUEST)
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        value |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            return value, offset
+
+
+def parse(data):
+    """Return (header dict, [channel settings], [(ms, channel, kind, level, keyframe fields)])
+
+    Times are ms after the trace's base time.
+    """
+    magic, version, count, _, base, now, overwritten, length = struct.unpack_from(iotrace.HEADER, data)
+    if magic != iotrace.MAGIC or version != iotrace.VERSION:
+        raise ValueError('not a version {} trace'.format(iotrace.VERSION))
+    offset = struct.calcsize(iotrace.HEADER)
+    channels = []
+    for _ in range(count):
+        (irq, interval, maintenance, cool_down, hour, minute, stagger, debounce,
+         request_debounce) = struct.unpack_from(iotrace.CHANNEL, data, offset)
+        offset += struct.calcsize(iotrace.CHANNEL)
+        channels.append({
+            'input_irq': irq,
+            'maintenance_interval_days': interval,
+            'maintenance_duration_minutes': maintenance,
+            'cool_down_duration_minutes': cool_down,
+            'maintenance_start_hour': hour,
+            'maintenance_start_minute': minute,
+            'maintenance_offset_minutes': stagger,
+            'debounce_ms': debounce,
+            'request_debounce_ms': request_debounce,
+        })
+    records = []
+    t = 0
+    end = offset + length
+    while offset < end:
+        delta, offset = read_varint(data, offset)
+        t += delta
+        code = data[offset]
+        offset += 1
+        kind = (code >> 1) & 7
+        fields = None
+        if kind == iotrace.KEYFRAME:
+            fields = []
+            for _ in range(iotrace.KEYFRAME_FIELDS):
+                value, offset = read_varint(data, offset)
+                fields.append(value)
+        records.append((t, code >> 4, kind, code & 1, fields))
+    span = clock.ticks_diff(now, base)
+    return {'channels': count, 'overwritten': overwritten, 'end': span}, channels, records
+
+
+def replay_channel(channel, settings, records, end):
+    """Replay one channel from its oldest keyframe; returns (start ms, recorded outputs, replayed outputs)"""
+    mine = [r for r in records if r[1] == channel]
+    start = next((i for i, r in enumerate(mine) if r[2] == iotrace.KEYFRAME), None)
+    if start is None:
+        return None, [], []
+    t0, _, _, _, (days, minute, day_ms, holdoff, flags) = mine[start]
+    clock.now = t0
+
+    # Inputs are active low
+    run_sense = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if flags & iotrace.KEY_RAW_SENSE else 1)
+    run_request = machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP, value=0 if flags & iotrace.KEY_RAW_REQUEST else 1)
+    if settings['input_irq']:
+        sensors = generator.IrqSensorManager(run_sense, run_request, settings['debounce_ms'], settings['request_debounce_ms'])
+        sensors.sense_pending = False
+        sensors.debounced_request = bool(flags & iotrace.KEY_REQUEST)
+    else:
+        sensors = generator.SensorManager(run_sense, run_request, settings['debounce_ms'])
+    sensors.debounced_running = sensors.previous_debounced_running = bool(flags & iotrace.KEY_SENSE)
+    controller = generator.GeneratorController(sensors, settings, machine.Pin(32, machine.Pin.OUT), machine.Pin(33, machine.Pin.OUT))
+    controller.maintenance_offset_minutes = settings['maintenance_offset_minutes']
+    controller.days_until_maintenance = days
+    controller.logged_days = days
+    generator.set_current_minutes(minute)
+    controller.maintenance_check_time = time.ticks_add(time.ticks_ms(), -day_ms)
+    if holdoff:
+        controller.start_pulse_cooldown(holdoff)
+    controller.previous_request = controller.logged_request = bool(flags & iotrace.KEY_REQUEST)
+    controller.logged_running = sensors.debounced_running
+    # The replay records into a trace of its own, big enough never to wrap
+    replayed = iotrace.Trace(1 << 20)
+    controller.attach_trace(replayed, channel)
+    sensors.traced_sense = bool(flags & iotrace.KEY_RAW_SENSE)
+    sensors.traced_request = bool(flags & iotrace.KEY_RAW_REQUEST)
+
+    inputs = [r for r in mine[start + 1:] if r[2] in (iotrace.RAW_SENSE, iotrace.RAW_REQUEST)]
+    i = 0
+    while True:
+        while i < len(inputs) and inputs[i][0] <= clock.now:
+            _, _, kind, level, _ = inputs[i]
+            (run_sense if kind == iotrace.RAW_SENSE else run_request).drive(0 if level else 1)
+            i += 1
+        controller.tick()
+        if clock.now >= end:
+            break
+        due = clock.now + max(1, controller.next_wakeup_ms())
+        if i < len(inputs):
+            due = min(due, inputs[i][0])
+        clock.advance_to(min(due, end))
+
+    _, _, out = parse(replayed.snapshot([]))
+    recorded = [r for r in mine[start + 1:] if r[2] in RELAYS + DEBOUNCED]
+    replayed_out = [(t0 + r[0], channel, r[2], r[3], None) for r in out if r[2] in RELAYS + DEBOUNCED]
+    return t0, recorded, replayed_out
+
+
+def compare(recorded, replayed, kinds, tolerance):
+    """Pair outputs of the given kinds in order; returns the list of mismatch descriptions"""
+    a = [r for r in recorded if r[2] in kinds]
+    b = [r for r in replayed if r[2] in kinds]
+    problems = []
+    for i in range(max(len(a), len(b))):
+        if i >= len(a):
+            problems.append('extra in replay: {}'.format(describe(b[i])))
+        elif i >= len(b):
+            problems.append('missing from replay: {}'.format(describe(a[i])))
+        elif a[i][2:4] != b[i][2:4]:
+            problems.append('recorded {}, replay {}'.format(describe(a[i]), describe(b[i])))
+        elif abs(a[i][0] - b[i][0]) > tolerance:
+            problems.append('{} {} ms off'.format(describe(a[i]), b[i][0] - a[i][0]))
+        else:
+            continue
+        break  # After the first difference the sequences no longer line up
+    return problems
+
+
+def describe(record):
+    t, channel, kind, level, fields = record
+    text = '{:>10.3f}s {}'.format(t / 1000, iotrace.KIND_NAMES[kind])
+    if fields is not None:
+        return text + ' days={} minute={} day_ms={} holdoff_ms={} flags={:04b}'.format(*fields)
+    return text + ' ' + ('on' if level else 'off')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='file saved from /trace, or - for stdin')
+    parser.add_argument('--tolerance-ms', type=int, default=500, help='allowed timing difference per action')
+    parser.add_argument('--dump', action='store_true', help='print the decoded records first')
+    args = parser.parse_args()
+    if args.trace == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args.trace, 'rb') as f:
+            data = f.read()
+    header, channels, records = parse(data)
+    print('{} channel(s), {} records over {:.1f} s, {} overwritten'.format(
+        header['channels'], len(records), header['end'] / 1000, header['overwritten']))
+    if args.dump:
+        for record in records:
+            print('  ch{} {}'.format(record[1], describe(record)))
+    failed = False
+    for channel, settings in enumerate(channels):
+        t0, recorded, replayed = replay_channel(channel, settings, records, header['end'])
+        if t0 is None:
+            print('channel {}: no keyframe left in the trace, not replayed'.format(channel))
+            continue
+        relay_problems = compare(recorded, replayed, RELAYS, args.tolerance_ms)
+        edge_problems = compare(recorded, replayed, DEBOUNCED, args.tolerance_ms)
+        relays = len([r for r in recorded if r[2] in RELAYS])
+        print('channel {}: from {:.3f}s, {} relay actions recorded, {} replayed: {}'.format(
+            channel, t0 / 1000, relays, len([r for r in replayed if r[2] in RELAYS]),
+            'MISMATCH' if relay_problems else 'match'))
+        for problem in relay_problems:
+            print('  relay: ' + problem)
+        for problem in edge_problems:
+            print('  debounced input: ' + problem)
+        failed = failed or bool(relay_problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Run the generator controller on a virtual clock.
+
+The real `GeneratorController`, `SensorManager` and `State` classes from
+`generator.py` are driven by a simulated engine and a random outage
+schedule. Between events the clock jumps straight to the controller's next
+deadline, so a month of operation takes milliseconds.
+
+    python -m host.simulate --days 30
+    python -m host.simulate --days 30 --sweep --seeds 200 \
+        --interval-days 3,7,14 --cool-down 5,15 --start-success 0.8,0.95
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+for path in (REPO_DIR, HOST_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from host.vclock import VirtualClock
+
+clock = VirtualClock()
+# generator.py reads the clock at import time, so install first
+clock.install(time)
+
+import machine
+import generator
+
+generator.log_echo = False
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+DEFAULTS = {
+    'days': 30,
+    'seed': 0,
+    'start_minute': 8 * 60,
+    'maintenance_interval_days': 7,
+    'maintenance_duration_minutes': 10,
+    'cool_down_duration_minutes': 15,
+    'maintenance_start_hour': 12,
+    'maintenance_start_minute': 0,
+    'outages_per_day': 0.3,
+    'outage_minutes': 90,
+    'start_success': 0.9,
+    'crank_ms': 3000,
+    'stop_ms': 1500,
+    'input_irq': 0,
+    'debounce_ms': 2000,
+    'request_debounce_ms': 50,
+}
+
+
+class GeneratorPlant:
+    """Simulated engine wired to the controller's relays and run-sense input"""
+
+    def __init__(self, sim, start_success, crank_ms, stop_ms):
+        self.sim = sim
+        self.start_success = start_success
+        self.crank_ms = crank_ms
+        self.stop_ms = stop_ms
+        self.run_sense = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP)
+        self.relay_start = machine.Pin(32, machine.Pin.OUT)
+        self.relay_kill = machine.Pin(33, machine.Pin.OUT)
+        self.relay_start.on_change(self._on_start_relay)
+        self.relay_kill.on_change(self._on_kill_relay)
+        self.running = False
+        self.cranking = False
+        self.engine_starts = 0
+        self.started_at = 0
+        self.run_ms = 0
+        self.relay_on_ms = {32: 0, 33: 0}
+        self._run_since = 0
+        self._relay_since = {}
+
+    def _on_start_relay(self, pin, value):
+        self._track_relay(pin, value)
+        if value and not self.running and not self.cranking:
+            self.cranking = True
+            if self.sim.rng.random() < self.start_success:
+                self.sim.schedule(self.crank_ms, self._engine_started)
+            else:
+                self.sim.schedule(self.crank_ms, self._crank_failed)
+
+    def _on_kill_relay(self, pin, value):
+        self._track_relay(pin, value)
+        if value and self.running:
+            self.sim.schedule(self.stop_ms, self._engine_stopped)
+
+    def _track_relay(self, pin, value):
+        now = self.sim.clock.now
+        if value:
+            self._relay_since[pin.id] = now
+        else:
+            self.relay_on_ms[pin.id] += now - self._relay_since.pop(pin.id, now)
+
+    def _crank_failed(self):
+        self.cranking = False
+
+    def _engine_started(self):
+        self.cranking = False
+        if self.relay_kill.value():
+            return
+        self.running = True
+        self.engine_starts += 1
+        self.started_at = self._run_since = self.sim.clock.now
+        self.run_sense.drive(0)  # active low
+
+    def _engine_stopped(self):
+        if not self.running:
+            return
+        self.running = False
+        self.run_ms += self.sim.clock.now - self._run_since
+        self.run_sense.drive(1)
+
+    def finish(self, now):
+        if self.running:
+            self.run_ms += now - self._run_since
+            self._run_since = now
+        for pin_id, since in self._relay_since.items():
+            self.relay_on_ms[pin_id] += now - since
+            self._relay_since[pin_id] = now
+
+
+class Simulation:
+    def __init__(self, params):
+        self.params = dict(DEFAULTS, **params)
+        p = self.params
+        self.clock = clock
+        self.clock.now = 0
+        self.rng = random.Random(p['seed'])
+        self._events = []
+        self._seq = 0
+
+        generator.set_current_minutes(p['start_minute'])
+        self.plant = GeneratorPlant(self, p['start_success'], p['crank_ms'], p['stop_ms'])
+        self.in_run_request = machine.Pin(13, machine.Pin.IN, machine.Pin.PULL_UP)
+        config = {k: p[k] for k in (
+            'maintenance_interval_days',
+            'maintenance_duration_minutes',
+            'cool_down_duration_minutes',
+            'maintenance_start_hour',
+            'maintenance_start_minute',
+        )}
+        if p['input_irq']:
+            self.sensor_manager = generator.IrqSensorManager(
+                self.plant.run_sense, self.in_run_request, p['debounce_ms'], p['request_debounce_ms'])
+        else:
+            self.sensor_manager = generator.SensorManager(self.plant.run_sense, self.in_run_request, p['debounce_ms'])
+        self.controller = generator.GeneratorController(
+            self.sensor_manager, config, self.plant.relay_start, self.plant.relay_kill)
+        self._schedule_outages(p['days'] * DAY_MS)
+
+    def schedule(self, delay_ms, callback):
+        self._seq += 1
+        heapq.heappush(self._events, (self.clock.now + delay_ms, self._seq, callback))
+
+    def _schedule_outages(self, end):
+        p = self.params
+        if p['outages_per_day'] <= 0:
+            return
+        at = 0
+        while True:
+            at += int(self.rng.expovariate(p['outages_per_day'] / DAY_MS))
+            if at >= end:
+                break
+            length = max(60000, int(self.rng.expovariate(1 / (p['outage_minutes'] * 60000))))
+            self.schedule(at, lambda: self.in_run_request.drive(0))
+            self.schedule(at + length, lambda: self.in_run_request.drive(1))
+            at += length
+
+    def run(self):
+        p = self.params
+        controller = self.controller
+        end = p['days'] * DAY_MS
+        wakeups = 0
+        maintenance_started = 0
+        maintenance_ran = 0
+        in_maintenance = False
+        ran_this_maintenance = False
+        detected_runs = 0
+        detect_latency_ms = 0
+
+        # Same preamble as the firmware at boot
+        controller.maintenance_check_time = time.ticks_ms()
+        controller.log_state_change('System Start', 'Generator controller initialized')
+
+        while self.clock.now < end:
+            while self._events and self._events[0][0] <= self.clock.now:
+                heapq.heappop(self._events)[2]()
+
+            controller.tick()
+            wakeups += 1
+
+            if controller.detected_runs != detected_runs:
+                detected_runs = controller.detected_runs
+                detect_latency_ms += self.clock.now - self.plant.started_at
+
+            if controller.maintenance_active:
+                if not in_maintenance:
+                    in_maintenance = True
+                    ran_this_maintenance = False
+                    maintenance_started += 1
+                if self.plant.running:
+                    ran_this_maintenance = True
+            elif in_maintenance:
+                in_maintenance = False
+                if ran_this_maintenance:
+                    maintenance_ran += 1
+
+            due = self.clock.now + max(1, controller.next_wakeup_ms())
+            if self._events:
+                due = min(due, self._events[0][0])
+            self.clock.advance_to(min(due, end))
+
+        self.plant.finish(self.clock.now)
+        hours = p['days'] * 24
+        return {
+            'start_attempts': controller.start_attempts,
+            'engine_starts': self.plant.engine_starts,
+            'failed_starts': controller.start_attempts - self.plant.engine_starts,
+            'detected_runs': controller.detected_runs,
+            'detect_latency_ms': detect_latency_ms // detected_runs if detected_runs else None,
+            'engine_hours': round(self.plant.run_ms / HOUR_MS, 3),
+            'start_relay_ms': self.plant.relay_on_ms[32],
+            'kill_relay_ms': self.plant.relay_on_ms[33],
+            'maintenance_started': maintenance_started,
+            'maintenance_ran': maintenance_ran,
+            'maintenance_hit_rate': round(maintenance_ran / maintenance_started, 3) if maintenance_started else None,
+            'wakeups': wakeups,
+            'wakeups_per_hour': round(wakeups / hours, 1),
+        }
+
+
+def simulate(params):
+    """Run one simulated controller and return its summary"""
+    return Simulation(params).run()
+
+
+def _parse_list(text, cast):
+    return [cast(v) for v in text.split(',')]
+
+
+def sweep(grid, seeds, days, workers=None):
+    """Simulate every combination in `grid` `seeds` times across a process pool"""
+    keys = sorted(grid)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    jobs = []
+    for combo in combos:
+        for seed in range(seeds):
+            jobs.append(dict(combo, seed=seed, days=days))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(simulate, jobs, chunksize=max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))))
+
+    report = []
+    for i, combo in enumerate(combos):
+        runs = results[i * seeds:(i + 1) * seeds]
+        started = sum(r['maintenance_started'] for r in runs)
+        report.append(dict(
+            combo,
+            runs=seeds,
+            starts=round(sum(r['start_attempts'] for r in runs) / seeds, 2),
+            failed_starts=round(sum(r['failed_starts'] for r in runs) / seeds, 2),
+            engine_hours=round(sum(r['engine_hours'] for r in runs) / seeds, 2),
+            relay_on_s=round(sum(r['start_relay_ms'] + r['kill_relay_ms'] for r in runs) / seeds / 1000, 1),
+            maintenance_hit_rate=round(sum(r['maintenance_ran'] for r in runs) / started, 3) if started else None,
+        ))
+    return report
+
+
+def _print_table(rows):
+    columns = list(rows[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=DEFAULTS['days'])
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+    parser.add_argument('--interval-days', default=str(DEFAULTS['maintenance_interval_days']))
+    parser.add_argument('--cool-down', default=str(DEFAULTS['cool_down_duration_minutes']))
+    parser.add_argument('--maintenance-minutes', default=str(DEFAULTS['maintenance_duration_minutes']))
+    parser.add_argument('--outages-per-day', default=str(DEFAULTS['outages_per_day']))
+    parser.add_argument('--outage-minutes', default=str(DEFAULTS['outage_minutes']))
+    parser.add_argument('--start-success', default=str(DEFAULTS['start_success']))
+    parser.add_argument('--debounce-ms', default=str(DEFAULTS['debounce_ms']))
+    parser.add_argument('--irq', action='store_true', help='use the IRQ-driven, time-debounced inputs')
+    parser.add_argument('--sweep', action='store_true', help='run every combination of the list-valued options')
+    parser.add_argument('--seeds', type=int, default=100, help='simulations per combination in sweep mode')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+
+    grid = {
+        'maintenance_interval_days': _parse_list(args.interval_days, int),
+        'cool_down_duration_minutes': _parse_list(args.cool_down, int),
+        'maintenance_duration_minutes': _parse_list(args.maintenance_minutes, int),
+        'outages_per_day': _parse_list(args.outages_per_day, float),
+        'outage_minutes': _parse_list(args.outage_minutes, float),
+        'start_success': _parse_list(args.start_success, float),
+        'debounce_ms': _parse_list(args.debounce_ms, int),
+        'input_irq': [1 if args.irq else 0],
+    }
+
+    started = time.perf_counter()
+    if args.sweep:
+        rows = sweep(grid, args.seeds, args.days, args.workers)
+    else:
+        params = {k: v[0] for k, v in grid.items()}
+        rows = [dict(params, **simulate(dict(params, seed=args.seed, days=args.days)))]
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        _print_table(rows)
+        print('{} simulated controller(s), {} days each, in {:.2f}s'.format(
+            len(rows) * (args.seeds if args.sweep else 1), args.days, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Virtual millisecond clock with MicroPython `time.ticks_*` semantics."""
+
+# ESP32 port: ticks_ms() wraps at 2**30
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+class VirtualClock:
+    """Clock that only moves when told to.
+
+    `now` is the absolute simulated time in milliseconds; the `ticks_*`
+    methods expose it the way the firmware sees it, including wrap-around.
+    """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def ticks_ms(self):
+        return self.now & TICKS_MAX
+
+    def ticks_us(self):
+        return (self.now * 1000) & TICKS_MAX
+
+    def ticks_add(self, ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(self, ticks1, ticks2):
+        diff = (ticks1 - ticks2) & TICKS_MAX
+        if diff >= TICKS_HALFPERIOD:
+            diff -= TICKS_PERIOD
+        return diff
+
+    def advance(self, ms):
+        self.now += ms
+
+    def advance_to(self, now):
+        if now > self.now:
+            self.now = now
+
+    def install(self, module):
+        """Point `module.ticks_ms` and friends at this clock"""
+        module.ticks_ms = self.ticks_ms
+        module.ticks_us = self.ticks_us
+        module.ticks_add = self.ticks_add
+        module.ticks_diff = self.ticks_diff
@@ -0,0 +1,166 @@
+import array
+import struct
+import time
+
+TRACE_BYTES = 4096
+IRQ_SLOTS = 16
+
+# A record is the ms since the previous record as a varint, then a code byte:
+# channel in bits 4-7, kind in bits 1-3 and the level in bit 0. Keyframes
+# carry their fields as further varints.
+RAW_SENSE = 0       # Run-sense input level before debouncing (1 = running)
+RAW_REQUEST = 1     # Run-request input level before debouncing (1 = requested)
+SENSE = 2           # Debounced run sense
+REQUEST = 3         # Run request as the controller acts on it
+START_RELAY = 4
+KILL_RELAY = 5
+KEYFRAME = 6        # Controller entered idle: the state a replay starts from
+KIND_NAMES = ('raw_sense', 'raw_request', 'sense', 'request', 'start_relay', 'kill_relay', 'keyframe')
+# Keyframe fields: days until maintenance, minute of day, ms into the maintenance
+# day, ms left on the start hold-off, flags
+KEYFRAME_FIELDS = 5
+KEY_SENSE = 1       # Flag bits
+KEY_REQUEST = 2
+KEY_RAW_SENSE = 4
+KEY_RAW_REQUEST = 8
+
+# /trace body: header, one CHANNEL block per channel, then the records oldest first.
+# base_ticks is the time the first record's delta counts from.
+MAGIC = b'GTRC'
+VERSION = 1
+HEADER = '<4sBBHIIII'       # magic, version, channels, reserved, base ticks, now ticks, overwritten records, record bytes
+# input IRQs, maintenance interval days, maintenance minutes, cool-down minutes,
+# start hour, start minute, stagger offset minutes, debounce ms, request debounce ms
+CHANNEL = '<BHHHBBHHH'
+
+class Trace:
+    """Ring buffer of input edges and relay actions, delta-encoded
+
+    Records are a few bytes each and the oldest are dropped to make room.
+    Pin IRQ handlers must not write the ring while the loop is halfway
+    through a record, so they queue their edges for drain().
+    """
+    def __init__(self, size=TRACE_BYTES, irq_slots=IRQ_SLOTS):
+        self.buf = bytearray(size)
+        self.size = size
+        self.head = 0
+        self.used = 0
+        self.base_time = time.ticks_ms()
+        self.last_time = self.base_time
+        self.overwritten = 0
+        self.irq_times = array.array('I', [0] * irq_slots)
+        self.irq_codes = bytearray(irq_slots)
+        self.irq_head = 0
+        self.irq_tail = 0
+        self.irq_lost = 0
+
+    def _byte(self, offset):
+        return self.buf[(self.head + offset) % self.size]
+
+    def _skip_varint(self, offset):
+        while self._byte(offset) & 0x80:
+            offset += 1
+        return offset + 1
+
+    def _drop_oldest(self):
+        # Read the oldest record's delta, then step over its code and any keyframe fields
+        delta = 0
+        shift = 0
+        offset = 0
+        while True:
+            b = self._byte(offset)
+            delta |= (b & 0x7F) << shift
+            shift += 7
+            offset += 1
+            if not b & 0x80:
+                break
+        code = self._byte(offset)
+        offset += 1
+        if (code >> 1) & 7 == KEYFRAME:
+            for _ in range(KEYFRAME_FIELDS):
+                offset = self._skip_varint(offset)
+        self.base_time = time.ticks_add(self.base_time, delta)
+        self.head = (self.head + offset) % self.size
+        self.used -= offset
+        self.overwritten += 1
+
+    def _put(self, value):
+        self.buf[(self.head + self.used) % self.size] = value
+        self.used += 1
+
+    def _put_varint(self, value):
+        while value > 0x7F:
+            self._put((value & 0x7F) | 0x80)
+            value >>= 7
+        self._put(value)
+
+    def _start(self, now, length):
+        """Make room for a record of `length` bytes after its delta and write the delta"""
+        # Late IRQ edges are stamped with the previous record's time
+        delta = max(0, time.ticks_diff(now, self.last_time))
+        self.last_time = time.ticks_add(self.last_time, delta)
+        n = length + 1
+        d = delta >> 7
+        while d:
+            n += 1
+            d >>= 7
+        while self.size - self.used < n:
+            self._drop_oldest()
+        self._put_varint(delta)
+
+    def record(self, channel, kind, level, now=None):
+        self.drain()
+        self._start(time.ticks_ms() if now is None else now, 1)
+        self._put(channel << 4 | kind << 1 | (1 if level else 0))
+
+    def keyframe(self, channel, days, minute, day_ms, holdoff_ms, flags):
+        self.drain()
+        fields = (days, minute, day_ms, holdoff_ms, flags)
+        length = 1
+        for value in fields:
+            length += 1
+            while value > 0x7F:
+                length += 1
+                value >>= 7
+        self._start(time.ticks_ms(), length)
+        self._put(channel << 4 | KEYFRAME << 1)
+        for value in fields:
+            self._put_varint(value)
+
+    def irq_edge(self, channel, kind, level):
+        """Queue an edge from a pin IRQ handler"""
+        tail = self.irq_tail
+        nxt = (tail + 1) % len(self.irq_codes)
+        if nxt == self.irq_head:
+            self.irq_lost += 1
+            return
+        self.irq_times[tail] = time.ticks_ms()
+        self.irq_codes[tail] = channel << 4 | kind << 1 | (1 if level else 0)
+        self.irq_tail = nxt
+
+    def drain(self):
+        """Move queued IRQ edges into the ring"""
+        while self.irq_head != self.irq_tail:
+            i = self.irq_head
+            code = self.irq_codes[i]
+            self._start(self.irq_times[i], 1)
+            self._put(code)
+            self.irq_head = (i + 1) % len(self.irq_codes)
+
+    def snapshot(self, controllers):
+        """The /trace body: header, channel settings and a copy of the records"""
+        self.drain()
+        out = bytearray(struct.pack(HEADER, MAGIC, VERSION, len(controllers), 0, self.base_time,
+                                    time.ticks_ms(), self.overwritten, self.used))
+        for c in controllers:
+            sensors = c.sensor_manager
+            out += struct.pack(CHANNEL, 1 if hasattr(sensors, 'request_debounce_ms') else 0,
+                               c.maintenance_interval_days, c.maintenance_duration_minutes,
+                               c.cool_down_duration_minutes, c.maintenance_start_hour,
+                               c.maintenance_start_minute, c.maintenance_offset_minutes,
+                               sensors.debounce_ms, getattr(sensors, 'request_debounce_ms', 0))
+        end = self.head + self.used
+        out += self.buf[self.head:min(end, self.size)]
+        if end > self.size:
+            out += self.buf[:end - self.size]
+        return out
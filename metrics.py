@@ -0,0 +1,78 @@
+import array
+
+# Upper bounds of the histogram buckets; every histogram also has a +Inf bucket
+LATENESS_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+UPDATE_BUCKETS_US = (100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+REQUEST_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+RELAY_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 300, 500, 1000, 2000)
+
+class Histogram:
+    """Fixed-bucket histogram of non-negative integers
+
+    Counts live in a preallocated array, so observe() allocates nothing
+    while the sum stays a small int (under 2**30 on MicroPython).
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = array.array('I', [0] * (len(buckets) + 1))
+        self.sum = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Estimated q-quantile (0 < q < 1), interpolated within its bucket as
+        Prometheus' histogram_quantile() does; values past the last bound count as it"""
+        rank = q * self.count()
+        seen = 0
+        lower = 0
+        for i, bound in enumerate(self.buckets):
+            n = self.counts[i]
+            if n and seen + n >= rank:
+                return int(lower + (bound - lower) * (rank - seen) / n + 0.5)
+            seen += n
+            lower = bound
+        return lower
+
+    def lines(self, name, labels=''):
+        """Prometheus text lines: cumulative buckets, sum and count"""
+        sep = ',' if labels else ''
+        total = 0
+        for i, bound in enumerate(self.buckets):
+            total += self.counts[i]
+            yield '%s_bucket{%s%sle="%d"} %d\n' % (name, labels, sep, bound, total)
+        total += self.counts[-1]
+        yield '%s_bucket{%s%sle="+Inf"} %d\n' % (name, labels, sep, total)
+        labels = '{' + labels + '}' if labels else ''
+        yield '%s_sum%s %d\n' % (name, labels, self.sum)
+        yield '%s_count%s %d\n' % (name, labels, total)
+
+class Watermark:
+    """Lowest and highest value seen"""
+    def __init__(self):
+        self.low = -1
+        self.high = 0
+
+    def update(self, value):
+        if value < self.low or self.low < 0:
+            self.low = value
+        if value > self.high:
+            self.high = value
+
+class RouteStats:
+    """Request count, server errors and latency for one route"""
+    def __init__(self):
+        self.latency = Histogram(REQUEST_BUCKETS_MS)
+        self.errors = 0
+
+def header(name, kind, text):
+    return '# HELP %s %s\n# TYPE %s %s\n' % (name, text, name, kind)
@@ -0,0 +1,83 @@
+import gc
+import os
+from collections import OrderedDict
+
+CACHE_BYTES = 8192          # Default budget: every precompressed asset fits
+MIN_FREE_BYTES = 16384      # Free heap below this and the cache gives memory back
+CHUNK_BYTES = 1024          # Bytes per socket write when serving from the cache
+
+class CachedBody:
+    """Response body that writes cached bytes as memoryview slices
+
+    The slices point into the cached bytes, so serving a hit copies
+    nothing; Microdot still writes (and yields) once per slice.
+    """
+    def __init__(self, data, chunk=CHUNK_BYTES):
+        self.view = memoryview(data)
+        self.chunk = chunk
+        self.pos = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        pos = self.pos
+        if pos >= len(self.view):
+            raise StopAsyncIteration
+        self.pos = pos + self.chunk
+        return self.view[pos:pos + self.chunk]
+
+class ResponseCache:
+    """File contents kept in RAM by path, within a byte budget, least recently used evicted first
+
+    A file is only read into the cache if it fits the budget on its own and
+    loading it leaves at least `min_free` bytes of heap; otherwise get()
+    returns None and the caller streams it from flash as before. relieve()
+    gives entries back when the heap runs low for other reasons. The files
+    are assumed not to change while the firmware runs.
+    """
+    def __init__(self, budget=CACHE_BYTES, min_free=MIN_FREE_BYTES):
+        self.budget = budget
+        self.min_free = min_free
+        self.entries = OrderedDict()      # path -> bytes, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        """The file's bytes, from RAM or read into it; None if it is not to be cached"""
+        entries = self.entries
+        data = entries.pop(path, None)
+        if data is not None:
+            # Reinserting makes it the most recently used
+            entries[path] = data
+            self.hits += 1
+            return data
+        self.misses += 1
+        size = os.stat(path)[6]
+        if size > self.budget or gc.mem_free() - size < self.min_free:
+            return None
+        while entries and self.size + size > self.budget:
+            self.evict()
+        with open(path, 'rb') as f:
+            data = f.read()
+        entries[path] = data
+        self.size += len(data)
+        return data
+
+    def evict(self):
+        """Drop the least recently used entry; returns its size"""
+        path = next(iter(self.entries))
+        size = len(self.entries.pop(path))
+        self.size -= size
+        self.evictions += 1
+        return size
+
+    def relieve(self):
+        """Evict until the free heap shortfall is covered; returns the bytes given back"""
+        shortfall = self.min_free - gc.mem_free()
+        freed = 0
+        while self.entries and freed < shortfall:
+            freed += self.evict()
+        return freed
@@ -1,6 +1,19 @@
 let currentUptime = 0;
 let devicePowerOnTime = null;  // null means not initialized yet
 let sent_sync = false;
+let eventSource = null;
+let pollTimers = [];
+let currentStatus = null;
+let logEntries = [];
+let logSeq = 0;  // Sequence number of the newest entry we hold
+const MAX_LOG_ENTRIES = 50;
+const EVENTS_RETRY_MS = 30000;
+// ?channel=<n> in the page URL picks the generator channel (0 when left out)
+const channel = new URLSearchParams(window.location.search).get('channel') || '0';
+
+function channelUrl(path) {
+    return path + (path.indexOf('?') < 0 ? '?' : '&') + 'channel=' + channel;
+}
 
 function formatDateTime(timestamp) {
     const date = new Date(timestamp);
@@ -20,186 +33,254 @@ function formatUptime(seconds) {
     return days + 'd ' + hours + 'h ' + minutes + 'm';
 }
 
-function updateStatus() {
-    fetch('/status')
-        .then(r => {
-            if (!r.ok) {
-                throw new Error('HTTP ' + r.status);
-            }
-            // Get the raw text first to see what we're receiving
-            return r.text();
-        })
-        .then(text => {
-            // Try to parse as JSON
-            var data = JSON.parse(text);
-            console.log('Status data:', data);
+function renderStatus(data) {
+    const runningElement = document.getElementById('running');
+    if (runningElement) {
+        runningElement.className = 'status-value indicator ' + (data.running ? 'on' : 'off');
+    }
 
-            const runningElement = document.getElementById('running');
-            if (runningElement) {
-                runningElement.className = 'status-value indicator ' + (data.running ? 'on' : 'off');
-            }
+    const requestElement = document.getElementById('request');
+    if (requestElement) {
+        requestElement.className = 'status-value indicator ' + (data.run_request ? 'on' : 'off');
+    }
 
-            const requestElement = document.getElementById('request');
-            if (requestElement) {
-                requestElement.className = 'status-value indicator ' + (data.run_request ? 'on' : 'off');
-            }
+    const cooldownElement = document.getElementById('cooldown');
+    if (cooldownElement) {
+        cooldownElement.className = 'status-value indicator ' + (data.cool_down ? 'on' : 'off');
+    }
 
-            const cooldownElement = document.getElementById('cooldown');
-            if (cooldownElement) {
-                cooldownElement.className = 'status-value indicator ' + (data.cool_down ? 'on' : 'off');
-            }
+    const maintenanceElement = document.getElementById('maintenance');
+    if (maintenanceElement) {
+        maintenanceElement.className = 'status-value indicator ' + (data.maintenance ? 'on' : 'off');
+    }
 
-            const maintenanceElement = document.getElementById('maintenance');
-            if (maintenanceElement) {
-                maintenanceElement.className = 'status-value indicator ' + (data.maintenance ? 'on' : 'off');
-            }
+    document.getElementById('running').querySelector('.status-text').textContent = data.running ? 'Yes' : 'No';
+    document.getElementById('request').querySelector('.status-text').textContent = data.run_request ? 'Yes' : 'No';
 
-            document.getElementById('running').querySelector('.status-text').textContent = data.running ? 'Yes' : 'No';
-            document.getElementById('request').querySelector('.status-text').textContent = data.run_request ? 'Yes' : 'No';
+    if (data.cool_down) {
+        const remaining_ms = data.cool_down_remaining;
+        const minutes = Math.floor(remaining_ms / (60 * 1000));
+        const seconds = Math.floor((remaining_ms % (60 * 1000)) / 1000);
+        const timeStr = minutes + 'm ' + seconds + 's';
+        document.getElementById('cooldown').querySelector('.indicator').className = 'indicator on';
+        document.getElementById('cooldown').querySelector('.status-text').textContent = 'Yes (' + timeStr + ' remaining)';
+    } else {
+        document.getElementById('cooldown').querySelector('.indicator').className = 'indicator off';
+        document.getElementById('cooldown').querySelector('.status-text').textContent = 'No';
+    }
 
-            if (data.cool_down) {
-                const remaining_ms = data.cool_down_remaining;
-                const minutes = Math.floor(remaining_ms / (60 * 1000));
-                const seconds = Math.floor((remaining_ms % (60 * 1000)) / 1000);
-                const timeStr = minutes + 'm ' + seconds + 's';
-                document.getElementById('cooldown').querySelector('.indicator').className = 'indicator on';
-                document.getElementById('cooldown').querySelector('.status-text').textContent = 'Yes (' + timeStr + ' remaining)';
-            } else {
-                document.getElementById('cooldown').querySelector('.indicator').className = 'indicator off';
-                document.getElementById('cooldown').querySelector('.status-text').textContent = 'No';
-            }
+    if (data.maintenance) {
+        const remaining_ms = data.maintenance_remaining;
+        const minutes = Math.floor(remaining_ms / (60 * 1000));
+        const seconds = Math.floor((remaining_ms % (60 * 1000)) / 1000);
+        const timeStr = minutes + 'm ' + seconds + 's';
+        document.getElementById('maintenance').querySelector('.indicator').className = 'indicator on';
+        document.getElementById('maintenance').querySelector('.status-text').textContent = 'Yes (' + timeStr + ' remaining)';
+    } else {
+        document.getElementById('maintenance').querySelector('.indicator').className = 'indicator off';
+        document.getElementById('maintenance').querySelector('.status-text').textContent = 'No';
+    }
+    var countdown = data.maintenance_countdown;
+    document.getElementById('days').textContent =
+        countdown.days + 'd ' + countdown.hours + 'h ' + countdown.minutes + 'm';
+    document.getElementById('startAttempts').textContent = data.start_attempts;
+    document.getElementById('detectedRuns').textContent = data.detected_runs;
+    if (data.last_start_request) {
+        const timeStr = formatDateTime(devicePowerOnTime + data.last_start_request);
+        document.getElementById('lastStartRequest').textContent = timeStr;
+    } else {
+        document.getElementById('lastStartRequest').textContent = 'None';
+    }
+    if (data.last_kill_action) {
+        const timeStr = formatDateTime(devicePowerOnTime + data.last_kill_action);
+        document.getElementById('lastKillAction').textContent = timeStr;
+    } else {
+        document.getElementById('lastKillAction').textContent = 'None';
+    }
+    if (data.last_run_sense_start) {
+        const timeStr = formatDateTime(devicePowerOnTime + data.last_run_sense_start);
+        document.getElementById('lastRunSenseStart').textContent = timeStr;
+    } else {
+        document.getElementById('lastRunSenseStart').textContent = 'None';
+    }
+    if (data.last_run_sense_end) {
+        const timeStr = formatDateTime(devicePowerOnTime + data.last_run_sense_end);
+        document.getElementById('lastRunSenseEnd').textContent = timeStr;
+    } else {
+        document.getElementById('lastRunSenseEnd').textContent = 'None';
+    }
+    // Sync time once per connection
+    if (!sent_sync) {
+        const now = new Date();
+        const current_minutes = now.getHours() * 60 + now.getMinutes();
+        fetch('/config/update', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+            body: `current_minutes=${current_minutes}`
+        }).then(() => {
+            sent_sync = true;
+        });
+    }
+}
 
-            if (data.maintenance) {
-                const remaining_ms = data.maintenance_remaining;
-                const minutes = Math.floor(remaining_ms / (60 * 1000));
-                const seconds = Math.floor((remaining_ms % (60 * 1000)) / 1000);
-                const timeStr = minutes + 'm ' + seconds + 's';
-                document.getElementById('maintenance').querySelector('.indicator').className = 'indicator on';
-                document.getElementById('maintenance').querySelector('.status-text').textContent = 'Yes (' + timeStr + ' remaining)';
-            } else {
-                document.getElementById('maintenance').querySelector('.indicator').className = 'indicator off';
-                document.getElementById('maintenance').querySelector('.status-text').textContent = 'No';
-            }
-            var countdown = data.maintenance_countdown;
-            document.getElementById('days').textContent =
-                countdown.days + 'd ' + countdown.hours + 'h ' + countdown.minutes + 'm';
-            document.getElementById('startAttempts').textContent = data.start_attempts;
-            document.getElementById('detectedRuns').textContent = data.detected_runs;
-            if (data.last_start_request) {
-                const timeStr = formatDateTime(devicePowerOnTime + data.last_start_request);
-                document.getElementById('lastStartRequest').textContent = timeStr;
-            } else {
-                document.getElementById('lastStartRequest').textContent = 'None';
-            }
-            if (data.last_kill_action) {
-                const timeStr = formatDateTime(devicePowerOnTime + data.last_kill_action);
-                document.getElementById('lastKillAction').textContent = timeStr;
-            } else {
-                document.getElementById('lastKillAction').textContent = 'None';
-            }
-            if (data.last_run_sense_start) {
-                const timeStr = formatDateTime(devicePowerOnTime + data.last_run_sense_start);
-                document.getElementById('lastRunSenseStart').textContent = timeStr;
-            } else {
-                document.getElementById('lastRunSenseStart').textContent = 'None';
+function renderLog(entries) {
+    const logContainer = document.getElementById('logContainer');
+    if (!logContainer) return;  // Not on log page
+
+    if (entries.length === 0) {
+        logContainer.innerHTML = '<div class="log-entry">No events logged yet</div>';
+        return;
+    }
+
+    // Reverse to show newest first
+    const reversedLog = entries.slice().reverse();
+    logContainer.innerHTML = reversedLog.map(entry => {
+        // Convert device timestamp to actual browser time
+        const actualTime = devicePowerOnTime + entry.timestamp;
+        const timeStr = formatDateTime(actualTime);
+        return '<div class="log-entry">' +
+            '<span class="log-time">' + timeStr + '</span>' +
+            '<span class="log-event">' + entry.event + '</span>' +
+            '<span class="log-details">' + entry.details + '</span>' +
+            '</div>';
+    }).join('');
+}
+
+function renderUptime() {
+    // Between refreshes the device uptime follows the browser clock
+    const uptimeDisplay = document.getElementById('uptimeDisplay');
+    if (uptimeDisplay && devicePowerOnTime !== null) {
+        uptimeDisplay.textContent = formatUptime((Date.now() - devicePowerOnTime) / 1000);
+    }
+}
+
+function showDashboardError(e) {
+    if (isLogPage()) {
+        document.getElementById('logContainer').innerHTML = '<div class="log-entry">Error: ' + e.message + '</div>';
+        return;
+    }
+    // Show error details on the page
+    var errorMsg = 'Error: ' + e.message;
+    document.getElementById('running').textContent = errorMsg;
+    document.getElementById('request').textContent = 'Check WiFi connection';
+    document.getElementById('cooldown').textContent = '';
+    document.getElementById('maintenance').textContent = '';
+    document.getElementById('days').textContent = '';
+}
+
+// One /dashboard request carries the uptime and whatever this page shows
+function updateDashboard() {
+    const url = isLogPage()
+        ? '/dashboard?include=uptime,log&log_since=' + logSeq
+        : '/dashboard?include=uptime,status';
+    fetch(channelUrl(url))
+        .then(r => {
+            if (!r.ok) {
+                throw new Error('HTTP ' + r.status);
             }
-            if (data.last_run_sense_end) {
-                const timeStr = formatDateTime(devicePowerOnTime + data.last_run_sense_end);
-                document.getElementById('lastRunSenseEnd').textContent = timeStr;
-            } else {
-                document.getElementById('lastRunSenseEnd').textContent = 'None';
+            return r.json();
+        })
+        .then(data => {
+            currentUptime = data.uptime_ms;
+            devicePowerOnTime = Date.now() - currentUptime;
+            renderUptime();
+            if (data.status) {
+                renderStatus(data.status);
             }
-            // Sync time once per connection
-            if (!sent_sync) {
-                const now = new Date();
-                const current_minutes = now.getHours() * 60 + now.getMinutes();
-                fetch('/config/update', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-                    body: `current_minutes=${current_minutes}`
-                }).then(() => {
-                    sent_sync = true;
-                });
+            if (data.log) {
+                if (data.resync) {
+                    logEntries = data.log;
+                } else if (data.log.length > 0) {
+                    logEntries = logEntries.concat(data.log).slice(-MAX_LOG_ENTRIES);
+                } else if (logSeq > 0) {
+                    return;  // Nothing new
+                }
+                logSeq = data.seq;
+                renderLog(logEntries);
             }
         })
         .catch(e => {
-            console.error('Error updating status:', e);
-            // Show error details on the page
-            var errorMsg = 'Error: ' + e.message;
-            document.getElementById('running').textContent = errorMsg;
-            document.getElementById('request').textContent = 'Check WiFi connection';
-            document.getElementById('cooldown').textContent = '';
-            document.getElementById('maintenance').textContent = '';
-            document.getElementById('days').textContent = '';
+            console.error('Error updating dashboard:', e);
+            showDashboardError(e);
         });
 }
 
-function updateUptime() {
-    return fetch('/uptime')
-        .then(r => r.json())
-        .then(data => {
-            currentUptime = data.uptime_ms;
-            // Calculate when the device powered on (in browser time)
-            devicePowerOnTime = Date.now() - currentUptime;
-            console.log('Uptime:', currentUptime, 'Power-on time:', devicePowerOnTime, 'Now:', Date.now());
-            // Update uptime display if present
-            const uptimeDisplay = document.getElementById('uptimeDisplay');
-            if (uptimeDisplay) {
-                uptimeDisplay.textContent = formatUptime(currentUptime / 1000);
-            }
-        })
-        .catch(e => console.error('Error updating uptime:', e));
+function isLogPage() {
+    return window.location.pathname === '/logpage';
 }
 
-function updateLog() {
-    const logContainer = document.getElementById('logContainer');
-    if (!logContainer) return;  // Not on log page
+function startPolling() {
+    if (pollTimers.length > 0) return;
+    updateDashboard();
+    pollTimers.push(setInterval(updateDashboard, isLogPage() ? 2000 : 1000));
+}
 
-    fetch('/log')
-        .then(r => r.json())
-        .then(data => {
-            currentUptime = data.uptime_ms / 1000;
-            devicePowerOnTime = Date.now() - (currentUptime * 1000);
-            const logContainer = document.getElementById('logContainer');
+function stopPolling() {
+    pollTimers.forEach(clearInterval);
+    pollTimers = [];
+}
 
-            if (data.log.length === 0) {
-                logContainer.innerHTML = '<div class="log-entry">No events logged yet</div>';
-                return;
-            }
-            
-            // Reverse to show newest first
-            const reversedLog = data.log.slice().reverse();
-            logContainer.innerHTML = reversedLog.map(entry => {
-                // Convert device timestamp to actual browser time
-                const actualTime = devicePowerOnTime + entry.timestamp;
-                const timeStr = formatDateTime(actualTime);
-                return '<div class="log-entry">' +
-                    '<span class="log-time">' + timeStr + '</span>' +
-                    '<span class="log-event">' + entry.event + '</span>' +
-                    '<span class="log-details">' + entry.details + '</span>' +
-                    '</div>';
-            }).join('');
-        })
-        .catch(e => {
-            console.error('Error updating log:', e);
-            document.getElementById('logContainer').innerHTML = '<div class="log-entry">Error: ' + e.message + '</div>';
-        });
+// One long-lived /events connection replaces the polling above; polling
+// only runs while the stream is down.
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    eventSource = new EventSource(channelUrl('/events'));
+    eventSource.addEventListener('snapshot', e => {
+        stopPolling();
+        const data = JSON.parse(e.data);
+        currentUptime = data.uptime_ms;
+        devicePowerOnTime = Date.now() - currentUptime;
+        currentStatus = data.status;
+        logEntries = data.log;
+        logSeq = data.seq;
+        renderUptime();
+        if (isLogPage()) {
+            renderLog(logEntries);
+        } else {
+            renderStatus(currentStatus);
+        }
+    });
+    eventSource.addEventListener('status', e => {
+        if (!currentStatus || isLogPage()) return;
+        Object.assign(currentStatus, JSON.parse(e.data));
+        renderStatus(currentStatus);
+    });
+    eventSource.addEventListener('log', e => {
+        const entries = JSON.parse(e.data);
+        logEntries = logEntries.concat(entries).slice(-MAX_LOG_ENTRIES);
+        if (entries.length > 0) {
+            logSeq = entries[entries.length - 1].seq;
+        }
+        renderLog(logEntries);
+    });
+    eventSource.onerror = () => {
+        console.error('Event stream lost, falling back to polling');
+        eventSource.close();
+        eventSource = null;
+        currentStatus = null;
+        startPolling();
+        setTimeout(connectEvents, EVENTS_RETRY_MS);
+    };
+}
+
+function refresh() {
+    // The event stream pushes changes on its own
+    if (eventSource) return;
+    updateDashboard();
 }
 
 // Page-specific initialization
-if (window.location.pathname === '/logpage') {
-    // Log page
-    updateUptime();
-    updateLog();
-    setInterval(updateUptime, 5000);
-    setInterval(updateLog, 2000);
-} else {
-    // Main page
-    updateStatus();
-    updateUptime();
-    setInterval(updateStatus, 1000);
-    setInterval(updateUptime, 5000);
+if (channel !== '0') {
+    // Keep the channel when moving between the status and log pages
+    document.querySelectorAll('a[href="/"], a[href="/logpage"]').forEach(a => {
+        a.href = channelUrl(a.getAttribute('href'));
+    });
 }
+connectEvents();
+setInterval(renderUptime, 5000);
 
 // Testing functions
 function testConnection() {
@@ -214,20 +295,19 @@ function testConnection() {
 }
 
 function forceMaintenance() {
-    fetch('/test/force_maintenance', {
+    fetch(channelUrl('/test/force_maintenance'), {
         method: 'POST',
         headers: {'Content-Type': 'application/json'}
     })
     .then(r => r.json())
     .then(data => {
-        updateStatus();
-        updateLog();
+        refresh();
     })
     .catch(e => alert('Error: ' + e));
 }
 
 function overrideRunning(value) {
-    fetch('/test/override_running', {
+    fetch(channelUrl('/test/override_running'), {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
         body: JSON.stringify({override: value === null ? 'none' : value})
@@ -235,14 +315,13 @@ function overrideRunning(value) {
     .then(r => r.json())
     .then(data => {
         const msg = value === null ? 'Using sensor' : (value ? 'YES' : 'NO');
-        updateStatus();
-        updateLog();
+        refresh();
     })
     .catch(e => alert('Error: ' + e));
 }
 
 function overrideRequest(value) {
-    fetch('/test/override_request', {
+    fetch(channelUrl('/test/override_request'), {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
         body: JSON.stringify({override: value === null ? 'none' : value})
@@ -250,8 +329,7 @@ function overrideRequest(value) {
     .then(r => r.json())
     .then(data => {
         const msg = value === null ? 'Using sensor' : (value ? 'YES' : 'NO');
-        updateStatus();
-        updateLog();
+        refresh();
     })
     .catch(e => alert('Error: ' + e));
 }
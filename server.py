@@ -0,0 +1,128 @@
+import asyncio
+import time
+from microdot import Microdot, Request, Response
+
+MAX_CONNECTIONS = 6
+ACCEPT_QUEUE = 2
+QUEUE_WAIT_MS = 2000          # A queued connection gets a 503 if no slot frees up in this time
+REQUEST_HEAD_MS = 5000        # Time allowed for a new connection to send its request
+KEEPALIVE_IDLE_MS = 2000      # Close a persistent connection after this long without a request
+KEEPALIVE_MAX_REQUESTS = 20
+REJECT_HEAD_MS = 250          # Time allowed to read a rejected request before answering it
+
+SERVICE_UNAVAILABLE = b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+async def _skip_request_head(reader):
+    while (await reader.readline()).strip():
+        pass
+
+class BoundedMicrodot(Microdot):
+    """Microdot with a cap on concurrent connections and HTTP keep-alive
+
+    At most `max_connections` connections are served at once. Up to
+    `accept_queue` more wait for a free slot; anything beyond that, or a
+    queued connection that waits too long, gets an immediate 503. Responses
+    with a known length keep the connection open for the next request,
+    unless someone is queued for the slot.
+    """
+    def __init__(self, max_connections=MAX_CONNECTIONS, accept_queue=ACCEPT_QUEUE):
+        super().__init__()
+        self.max_connections = max_connections
+        self.accept_queue = accept_queue
+        self.active = 0
+        self.queued = 0
+        self.slot_freed = asyncio.Event()
+        self.rejected = 0
+        self.reused = 0           # Requests served on an already-used connection
+        # Called as response_sent(request, response) once a response, body included, has been written
+        self.response_sent = None
+
+    async def handle_request(self, reader, writer):
+        if not await self._admit():
+            self.rejected += 1
+            await self._reject(reader, writer)
+            return
+        try:
+            await self._serve(reader, writer)
+        finally:
+            self.active -= 1
+            freed = self.slot_freed
+            self.slot_freed = asyncio.Event()
+            freed.set()
+
+    async def _admit(self):
+        if self.active < self.max_connections:
+            self.active += 1
+            return True
+        if self.queued >= self.accept_queue:
+            return False
+        self.queued += 1
+        deadline = time.ticks_add(time.ticks_ms(), QUEUE_WAIT_MS)
+        try:
+            while self.active >= self.max_connections:
+                wait = time.ticks_diff(deadline, time.ticks_ms())
+                if wait <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for_ms(self.slot_freed.wait(), wait)
+                except asyncio.TimeoutError:
+                    return False
+            self.active += 1
+            return True
+        finally:
+            self.queued -= 1
+
+    async def _reject(self, reader, writer):
+        try:
+            # Read the request first: closing with unread data resets the
+            # connection, and the client might never see the 503
+            await asyncio.wait_for_ms(_skip_request_head(reader), REJECT_HEAD_MS)
+        except Exception:
+            pass
+        try:
+            await writer.awrite(SERVICE_UNAVAILABLE)
+            await writer.aclose()
+        except OSError:
+            pass
+
+    def _keep_alive(self, req, res):
+        if self.queued:
+            return False
+        # Without a length, closing the connection is what ends the body
+        res.complete()
+        if 'Content-Length' not in res.headers or req.content_length > Request.max_body_length:
+            return False
+        connection = req.headers.get('Connection', '').lower()
+        if req.http_version == '1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    async def _serve(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        served = 0
+        try:
+            while True:
+                try:
+                    req = await asyncio.wait_for_ms(Request.create(self, reader, writer, peer),
+                                                    KEEPALIVE_IDLE_MS if served else REQUEST_HEAD_MS)
+                except Exception:
+                    req = None
+                if req is None and served:
+                    break
+                if served:
+                    self.reused += 1
+                served += 1
+                # A None request gets Microdot's 400 response
+                res = await self.dispatch_request(req)
+                if res == Response.already_handled:
+                    break
+                keep = req is not None and served < KEEPALIVE_MAX_REQUESTS and self._keep_alive(req, res)
+                res.headers['Connection'] = 'keep-alive' if keep else 'close'
+                await res.write(writer)
+                if self.response_sent and req is not None:
+                    self.response_sent(req, res)
+                if not keep:
+                    break
+            await writer.aclose()
+        except OSError:
+            pass
@@ -0,0 +1,103 @@
+import os
+import struct
+import time
+
+STATE_FILE = 'state.bin'
+PERSIST_INTERVAL_MS = 5000      # Changes within this window share one flash write
+STATE_REFRESH_MS = 15 * 60000   # Rewrite runtime state this often so the clock and day progress stay current
+
+# Runtime state: format version, channel count and minute of day, then per channel:
+# days until maintenance, ms into the current maintenance day, start attempts,
+# detected runs, failed starts
+STATE_HEADER = '<BBH'
+CHANNEL_STATE = '<HIIII'
+STATE_VERSION = 2
+STATE_HEADER_SIZE = struct.calcsize(STATE_HEADER)
+CHANNEL_STATE_SIZE = struct.calcsize(CHANNEL_STATE)
+# Version 1 held a single channel: version, days, minute of day, day ms, attempts, runs, failed
+STATE_V1 = '<BHHIIII'
+
+def atomic_write(path, data):
+    """Replace a file so a reset mid-write leaves the previous copy intact"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.rename(tmp, path)
+
+def load_state(path=STATE_FILE):
+    """Saved runtime state as (minute of day, [per-channel tuple]), or None"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data:
+        return None
+    if data[0] == 1 and len(data) == struct.calcsize(STATE_V1):
+        _, days, minutes, day_ms, attempts, runs, failed = struct.unpack(STATE_V1, data)
+        return minutes, [(days, day_ms, attempts, runs, failed)]
+    if data[0] != STATE_VERSION or len(data) < STATE_HEADER_SIZE:
+        return None
+    _, count, minutes = struct.unpack_from(STATE_HEADER, data)
+    if len(data) != STATE_HEADER_SIZE + count * CHANNEL_STATE_SIZE:
+        return None
+    return minutes, [struct.unpack_from(CHANNEL_STATE, data, STATE_HEADER_SIZE + i * CHANNEL_STATE_SIZE)
+                     for i in range(count)]
+
+class Persistence:
+    """Coalesces config and runtime-state changes into one write per interval
+
+    Callers mark what changed; flush() writes whatever is dirty once the
+    interval has passed since the last write, each file via write-then-rename.
+    """
+    def __init__(self, save_config, state_file=STATE_FILE, interval_ms=PERSIST_INTERVAL_MS, refresh_ms=STATE_REFRESH_MS):
+        self.save_config = save_config
+        self.state_file = state_file
+        self.interval_ms = interval_ms
+        self.refresh_ms = refresh_ms
+        self.config_dirty = False
+        self.state_dirty = False
+        now = time.ticks_ms()
+        self.last_write = time.ticks_add(now, -interval_ms)
+        self.last_state_write = now
+        self.last_counters = None
+
+    def config_changed(self):
+        self.config_dirty = True
+
+    def state_changed(self):
+        self.state_dirty = True
+
+    def watch(self, controllers):
+        """Mark the state dirty when a persisted field of any channel's controller changed"""
+        counters = [(c.days_until_maintenance, c.start_attempts, c.detected_runs, c.failed_starts)
+                    for c in controllers]
+        if counters != self.last_counters:
+            self.last_counters = counters
+            self.state_dirty = True
+        elif time.ticks_diff(time.ticks_ms(), self.last_state_write) >= self.refresh_ms:
+            self.state_dirty = True
+
+    def flush(self, config, controllers, minutes):
+        """Write dirty config/state if the interval allows; returns True if anything was written"""
+        if not (self.config_dirty or self.state_dirty):
+            return False
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_write) < self.interval_ms:
+            return False
+        if self.config_dirty:
+            self.config_dirty = False
+            self.save_config(config)
+        if self.state_dirty:
+            self.state_dirty = False
+            data = bytearray(STATE_HEADER_SIZE + len(controllers) * CHANNEL_STATE_SIZE)
+            struct.pack_into(STATE_HEADER, data, 0, STATE_VERSION, len(controllers), minutes)
+            for i, c in enumerate(controllers):
+                day_ms = max(0, time.ticks_diff(now, c.maintenance_check_time))
+                struct.pack_into(CHANNEL_STATE, data, STATE_HEADER_SIZE + i * CHANNEL_STATE_SIZE,
+                                 min(c.days_until_maintenance, 0xFFFF), day_ms,
+                                 c.start_attempts, c.detected_runs, c.failed_starts)
+            atomic_write(self.state_file, data)
+            self.last_state_write = now
+        self.last_write = now
+        return True
@@ -0,0 +1,63 @@
+WRITE_BUFFER_BYTES = 1024
+
+# Buffers handed back by finished responses, reused by the next ones
+free_buffers = []
+
+class BufferedBody:
+    """Response body that coalesces a generator's yields into few socket writes
+
+    Microdot writes each item of an async iterator body as its own socket
+    write. This collects the generator's pieces into a preallocated
+    bytearray and hands Microdot a memoryview of it only when the next
+    piece would not fit or the generator is done. The stream copies what it
+    cannot send straight away, so the buffer is free again by the next call.
+    Buffers go back to a pool when the response ends.
+    """
+    def __init__(self, source, size=WRITE_BUFFER_BYTES):
+        self.source = source
+        self.carry = None
+        self.buf = free_buffers.pop() if free_buffers and len(free_buffers[-1]) == size else bytearray(size)
+        self.view = memoryview(self.buf)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        buf = self.buf
+        if buf is None:
+            raise StopAsyncIteration
+        n = 0
+        while self.source is not None:
+            if self.carry is None:
+                try:
+                    piece = next(self.source)
+                except StopIteration:
+                    self.source = None
+                    break
+                self.carry = piece.encode() if isinstance(piece, str) else piece
+            data = self.carry
+            if n + len(data) > len(buf):
+                if n:
+                    break
+                # Bigger than the whole buffer: write it as it is
+                self.carry = None
+                return data
+            buf[n:n + len(data)] = data
+            n += len(data)
+            self.carry = None
+        if n:
+            return self.view[:n]
+        self.release()
+        raise StopAsyncIteration
+
+    def release(self):
+        if self.buf is not None:
+            free_buffers.append(self.buf)
+            self.buf = None
+            self.view = None
+
+    async def aclose(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        self.release()
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import struct
+import time
+
+INTERVAL_S = 10             # One batch per interval
+QUEUE_RECORDS = 64          # Log entries held while the broker can't be reached
+BATCH_BYTES = 2048          # Largest log batch in one message
+KEEPALIVE_S = 60
+ACK_TIMEOUT_MS = 5000       # Wait for CONNACK and PUBACK
+RETRY_MIN_MS = 5000         # Reconnect backoff, doubled after each failure
+RETRY_MAX_MS = 300000
+
+# MQTT 3.1.1 control packet types
+CONNACK = 2
+PUBACK = 4
+PINGRESP = 13
+PINGREQ_PACKET = b'\xc0\x00'
+
+def remaining_length(n):
+    """MQTT's variable-length encoding of a packet's remaining length"""
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def mqtt_string(s):
+    data = s.encode()
+    return struct.pack('!H', len(data)) + data
+
+def connect_packet(client_id, keepalive_s, user=None, password=None):
+    """CONNECT with a clean session"""
+    flags = 0x02
+    payload = mqtt_string(client_id)
+    if user:
+        flags |= 0x80
+        payload += mqtt_string(user)
+    if password:
+        flags |= 0x40
+        payload += mqtt_string(password)
+    body = mqtt_string('MQTT') + bytes((4, flags)) + struct.pack('!H', keepalive_s) + payload
+    return b'\x10' + remaining_length(len(body)) + body
+
+def publish_packet(topic, payload, packet_id, retain=False):
+    """PUBLISH at QoS 1"""
+    body = mqtt_string(topic) + struct.pack('!H', packet_id) + payload
+    return bytes((0x32 | retain,)) + remaining_length(len(body)) + body
+
+def is_ip_address(host):
+    """True for a dotted IPv4 address. MicroPython resolves any other name with a blocking getaddrinfo()"""
+    parts = host.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not part.isdigit() or int(part) > 255:
+            return False
+    return True
+
+async def read_packet(reader):
+    """(packet type, body) of the next packet from the broker"""
+    first = (await reader.readexactly(1))[0]
+    n = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first >> 4, (await reader.readexactly(n) if n else b'')
+
+class Telemetry:
+    """Batched MQTT publisher for status changes and log entries, with store-and-forward
+
+    Once an interval, each channel's status goes to <topic>/<channel>/status
+    (retained) if it changed since the broker last took it, and the log
+    entries queued since go to <topic>/log as one JSON batch. Everything is
+    sent at QoS 1 over one persistent connection and only leaves the queue
+    once the broker has acknowledged it.
+
+    Nothing here waits on the producers. While the broker can't be reached,
+    a channel's newer status replaces its older one, and log entries wait
+    in a ring of `queue_records`; when that is full the oldest give way and
+    the number lost goes out with the next batch as "dropped".
+    """
+    def __init__(self, broker, port=1883, topic='gencontroller', client_id='gencontroller', user=None, password=None,
+                 interval_s=INTERVAL_S, queue_records=QUEUE_RECORDS, keepalive_s=KEEPALIVE_S):
+        if not is_ip_address(broker):
+            raise ValueError('broker must be an IP address: ' + broker)
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.client_id = client_id
+        self.user = user
+        self.password = password
+        self.interval_ms = interval_s * 1000
+        self.keepalive_s = keepalive_s
+        self.ring = [None] * queue_records
+        self.head = 0
+        self.count = 0
+        self.inflight = 0         # Entries at the head in the message awaiting its PUBACK
+        self.unsent = 0           # In-flight entries the ring has overwritten since
+        self.dropped = 0          # Lost and not yet reported in a batch
+        self.dropped_total = 0
+        self.status = {}          # Channel name -> status JSON not yet acknowledged
+        self.acked = {}           # Channel name -> status JSON the broker has
+        self.reader = None
+        self.writer = None
+        self.packet_id = 0
+        self.last_sent = 0
+        self.published = 0
+        self.errors = 0
+        self.retry_ms = RETRY_MIN_MS
+        self.next_attempt = time.ticks_ms()
+
+    def add_log(self, channel, seq, ts, event, details):
+        """Queue one log entry; drops the oldest if the ring is full"""
+        ring = self.ring
+        if self.count == len(ring):
+            self.head = (self.head + 1) % len(ring)
+            self.count -= 1
+            if self.inflight:
+                # Already in the message being sent: only lost if that fails
+                self.inflight -= 1
+                self.unsent += 1
+            else:
+                self.dropped += 1
+                self.dropped_total += 1
+        ring[(self.head + self.count) % len(ring)] = ('{"channel":' + json.dumps(channel) + ',"seq":' + str(seq)
+                                                      + ',"timestamp":' + str(ts) + ',"event":' + json.dumps(event)
+                                                      + ',"details":' + json.dumps(details) + '}')
+        self.count += 1
+
+    def offer_status(self, channel, body):
+        """Note channel's current status JSON; only a change is sent"""
+        if body == self.acked.get(channel):
+            self.status.pop(channel, None)
+        else:
+            self.status[channel] = body
+
+    def connected(self):
+        return self.writer is not None
+
+    async def run(self, collect, link_up):
+        """Publish forever: collect() offers the statuses each interval, link_up() says the network is there"""
+        while True:
+            if not self.writer and link_up() and time.ticks_diff(time.ticks_ms(), self.next_attempt) >= 0:
+                try:
+                    await self.connect()
+                    self.retry_ms = RETRY_MIN_MS
+                except Exception as e:
+                    print('[ERROR] telemetry connect:', e)
+                    self.fail()
+            collect()
+            if self.writer:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print('[ERROR] telemetry publish:', e)
+                    self.fail()
+            await asyncio.sleep_ms(self.interval_ms)
+
+    def fail(self):
+        """Drop the connection and back off before the next attempt"""
+        self.errors += 1
+        self.close()
+        self.next_attempt = time.ticks_add(time.ticks_ms(), self.retry_ms)
+        self.retry_ms = min(self.retry_ms * 2, RETRY_MAX_MS)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for_ms(asyncio.open_connection(self.broker, self.port),
+                                                             ACK_TIMEOUT_MS)
+        await self.send(connect_packet(self.client_id, self.keepalive_s, self.user, self.password))
+        kind, body = await asyncio.wait_for_ms(read_packet(self.reader), ACK_TIMEOUT_MS)
+        if kind != CONNACK or len(body) < 2 or body[1]:
+            raise OSError('broker refused connection: ' + str(body[1] if kind == CONNACK and len(body) > 1 else kind))
+        # The broker may have restarted without the retained statuses: send them all again
+        self.acked = {}
+
+    async def flush(self):
+        """Send the changed statuses and the queued log entries, then ping if the link has been quiet"""
+        for channel in list(self.status):
+            body = self.status[channel]
+            await self.publish(self.topic + '/' + channel + '/status', body.encode(), True)
+            self.acked[channel] = body
+            del self.status[channel]
+        while self.count or self.dropped:
+            n, dropped, payload = self.batch()
+            self.inflight = n
+            try:
+                await self.publish(self.topic + '/log', payload.encode())
+            except Exception:
+                self.dropped += self.unsent
+                self.dropped_total += self.unsent
+                self.unsent = 0
+                self.inflight = 0
+                raise
+            # Entries queued while waiting for the ack went in behind these
+            self.head = (self.head + self.inflight) % len(self.ring)
+            self.count -= self.inflight
+            self.inflight = 0
+            self.unsent = 0
+            self.dropped -= dropped
+        if time.ticks_diff(time.ticks_ms(), self.last_sent) >= self.keepalive_s * 500:
+            await self.send(PINGREQ_PACKET)
+            await self.expect(PINGRESP)
+
+    def batch(self):
+        """(entries taken, drops reported, JSON) for the next log message, oldest entries first"""
+        parts = ['{"client":', json.dumps(self.client_id), ',"uptime_ms":', str(time.ticks_ms()),
+                 ',"dropped":', str(self.dropped), ',"log":[']
+        size = 64
+        n = 0
+        while n < self.count:
+            record = self.ring[(self.head + n) % len(self.ring)]
+            if n and size + len(record) > BATCH_BYTES:
+                break
+            if n:
+                parts.append(',')
+            parts.append(record)
+            size += len(record) + 1
+            n += 1
+        parts.append(']}')
+        return n, self.dropped, ''.join(parts)
+
+    async def publish(self, topic, payload, retain=False):
+        self.packet_id = self.packet_id % 65535 + 1
+        packet_id = self.packet_id
+        await self.send(publish_packet(topic, payload, packet_id, retain))
+        await self.expect(PUBACK, packet_id)
+        self.published += 1
+
+    async def expect(self, kind, packet_id=None):
+        """Read until the broker's packet of this kind (and id) arrives, or raise after ACK_TIMEOUT_MS"""
+        deadline = time.ticks_add(time.ticks_ms(), ACK_TIMEOUT_MS)
+        while True:
+            wait = time.ticks_diff(deadline, time.ticks_ms())
+            if wait <= 0:
+                raise OSError('no reply from broker')
+            got, body = await asyncio.wait_for_ms(read_packet(self.reader), wait)
+            if got == kind and (packet_id is None or struct.unpack('!H', body)[0] == packet_id):
+                return
+
+    async def send(self, packet):
+        self.writer.write(packet)
+        await self.writer.drain()
+        self.last_sent = time.ticks_ms()
+
+    def close(self):
+        if self.writer:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = None
+        self.writer = None